@@ -1,20 +1,80 @@
 import logging
+import os
+import time
 import uuid
-from typing import Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 
 from fastapi import APIRouter, Body, Depends, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from core.config import settings
 from db.session import get_db
 # Assuming FacebookPostResponse is defined somewhere, e.g., in models.facebook
 # from models.facebook import FacebookPostResponse # No longer directly used in Pydantic model for post_result
 from services.ai.post_workflow import post_graph, BrandingPostState
 from services.social_media.facebook_manager import create_facebook_post
+from services.image_store import blob_sha256, get_image_store
 from pydantic import BaseModel
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-initial_state_store = {}
+# session_id → (monotonic start time, workflow state)
+initial_state_store: Dict[str, Tuple[float, BrandingPostState]] = {}
+# Sessions that have returned their branded images: they keep their image
+# references for BRANDING_SESSION_TTL_SECONDS, so the client can post the
+# returned paths (a stored post then keeps them) before the disk GC may
+# reclaim them. session_id → (monotonic end time, final workflow state)
+completed_sessions: Dict[str, Tuple[float, BrandingPostState]] = {}
+
+
+async def resolve_listing_photos(photo_ids: Optional[List[str]]) -> Optional[List[str]]:
+    """Local paths of uploaded listing photos (sha256 ids from POST /{agent_id}/photos)."""
+    if not photo_ids:
+        return None
+    store = get_image_store()
+    paths = []
+    for sha256 in photo_ids:
+        blob = await store.get(sha256)
+        if blob is None or not os.path.exists(blob.path):
+            raise HTTPException(status_code=404, detail=f"Listing photo {sha256} not found")
+        paths.append(blob.path)
+    return paths
+
+
+async def release_session_images(state: BrandingPostState):
+    """Drop the references a session's workflow run took on its branded images."""
+    store = get_image_store()
+    for path in state.get("image_paths") or []:
+        sha256 = blob_sha256(path)
+        if sha256:
+            await store.release(sha256, agent_id=state.get("client_id"))
+
+
+async def expire_sessions():
+    """Drop sessions past their TTL, never continued or completed, so their images can be reclaimed."""
+    cutoff = time.monotonic() - settings.BRANDING_SESSION_TTL_SECONDS
+    for store in (initial_state_store, completed_sessions):
+        for session_id in [sid for sid, (started, _) in store.items() if started < cutoff]:
+            expired = store.pop(session_id, None)
+            if expired:
+                logger.info(f"Branding session {session_id} expired")
+                await release_session_images(expired[1])
+
+
+async def run_workflow(state: BrandingPostState) -> BrandingPostState:
+    """
+    Run the post workflow to its final state. If it fails, the images it
+    had already stored are released, as no session will hold them.
+    """
+    latest = state
+    try:
+        async for latest in post_graph.astream(state, stream_mode="values"):
+            pass
+    except BaseException:
+        if latest.get("image_paths") is not state.get("image_paths"):
+            await release_session_images(latest)
+        raise
+    return latest
 
 class BrandSuggestionResponse(BaseModel):
     session_id: str
@@ -23,10 +83,13 @@ class BrandSuggestionResponse(BaseModel):
 class SelectBrandRequest(BaseModel):
     session_id: str
     selected_brand: str
+    # Overrides the photos given to /generate-branding when set
+    listing_photo_ids: Optional[List[str]] = None
 
 class ContentGenerationResponse(BaseModel):
     caption: str
     image_path: str
+    image_paths: List[str] = []  # one branded image per listing photo
     post_result: Optional[Dict[str, Any]] = None # Changed to Dict[str, Any] to accept a dictionary
 
 @router.websocket("/chat")
@@ -48,9 +111,12 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
 async def generate_branding(
     agent_id: str = Body(..., description="Agent identifier"),
     prompt:   str = Body(..., description="Free-text prompt for AI"),
+    listing_photo_ids: Optional[List[str]] = Body(None, description="Uploaded listing photos to brand"),
     db = Depends(get_db)
 ):
     logger.info(f"AI→branding request for agent_id={agent_id}, prompt={prompt}")
+    await expire_sessions()
+    listing_photos = await resolve_listing_photos(listing_photo_ids)
 
     session_id = str(uuid.uuid4())
 
@@ -62,6 +128,8 @@ async def generate_branding(
         "selected_brand": None,
         "visual_prompts": None,
         "image_path": None,
+        "image_paths": None,
+        "listing_photos": listing_photos,
         "location": None,
         "price": None,
         "bedrooms": None,
@@ -73,13 +141,14 @@ async def generate_branding(
     }
 
     try:
-        final_state = await post_graph.ainvoke(initial_state)
+        final_state = await run_workflow(initial_state)
         brand_suggestions = final_state.get("brand_suggestions")
 
         if not brand_suggestions:
+            await release_session_images(final_state)
             raise HTTPException(status_code=500, detail="Failed to generate brand suggestions from AI.")
 
-        initial_state_store[session_id] = final_state
+        initial_state_store[session_id] = (time.monotonic(), final_state)
         logger.info(f"Generated brand suggestions for session {session_id}: {brand_suggestions[:100]}...")
         return BrandSuggestionResponse(session_id=session_id, brand_suggestions=brand_suggestions)
 
@@ -98,15 +167,25 @@ async def continue_post_generation(
 
     logger.info(f"AI→continue post generation for session {session_id} with selected brand: {selected_brand[:50]}...")
 
-    current_state: Optional[BrandingPostState] = initial_state_store.pop(session_id, None)
-    if not current_state:
+    await expire_sessions()
+    listing_photos = await resolve_listing_photos(request.listing_photo_ids)
+    session = initial_state_store.pop(session_id, None)
+    if not session:
         raise HTTPException(status_code=404, detail="Session expired or not found. Please restart the process.")
+    current_state: BrandingPostState = session[1]
+    # The suggestion run's images are superseded by this run's
+    await release_session_images(current_state)
+    current_state["image_path"] = None
+    current_state["image_paths"] = None
 
     current_state["selected_brand"] = selected_brand
     current_state["db"] = db
+    if listing_photos:
+        current_state["listing_photos"] = listing_photos
 
     try:
-        final_state = await post_graph.ainvoke(current_state)
+        final_state = await run_workflow(current_state)
+        completed_sessions[session_id] = (time.monotonic(), final_state)
 
         caption = final_state.get("base_post")
         image_path = final_state.get("image_path")
@@ -135,6 +214,7 @@ async def continue_post_generation(
         return ContentGenerationResponse(
             caption=caption,
             image_path=image_path,
+            image_paths=final_state.get("image_paths") or [image_path],
             post_result=processed_post_result # Pass the processed dictionary here
         )
 
@@ -1,13 +1,11 @@
  
 
-import asyncio                # ← ADD THIS
 from fastapi import APIRouter, Request, Query, HTTPException, Depends
 from fastapi.responses import RedirectResponse, JSONResponse
 import os
 import httpx
 import secrets
 import logging
-from datetime import datetime
 from core.config import settings
 from services.social_media.token_service import FacebookTokenService, get_token_service
 from db.session import get_db
@@ -15,7 +13,6 @@ from motor.motor_asyncio import AsyncIOMotorCollection
 
 import logging
 import secrets
-from datetime import datetime
 
 import httpx
 from fastapi import APIRouter, Request, Query, HTTPException, Depends
@@ -23,6 +20,7 @@ from fastapi.responses import RedirectResponse
 
 from core.config import settings
 from services.social_media.token_service import FacebookTokenService, get_token_service
+from services.expiring_store import get_oauth_state_store
 
 
 
@@ -33,8 +31,9 @@ logger = logging.getLogger(__name__)
 FB_OAUTH_REDIRECT_URI = settings.FB_REDIRECT_URI
 FB_APP_ID = settings.FB_APP_ID
 
-# State token management for CSRF protection
-state_tokens = {}
+# State tokens for CSRF protection, shared across workers and expired by
+# the store itself (services/expiring_store.py)
+STATE_TOKEN_TTL_SECONDS = 300
 
 @router.get("/login")
 async def login(request: Request, agent_id: str = Query(...)):
@@ -43,11 +42,10 @@ async def login(request: Request, agent_id: str = Query(...)):
     """
     try:
         state_token = secrets.token_urlsafe(32)
-        state_tokens[state_token] = {
+        await get_oauth_state_store().set(state_token, {
             "agent_id": agent_id,
-            "created_at": datetime.utcnow(),
             "ip": request.client.host if request.client else "unknown"
-        }
+        }, ttl=STATE_TOKEN_TTL_SECONDS)
         fb_oauth_url = (
             f"https://www.facebook.com/v18.0/dialog/oauth?"
             f"client_id={FB_APP_ID}&"
@@ -76,13 +74,11 @@ async def callback(
     then redirect back to your Next.js dashboard.
     """
     # 1) Validate state token…
-    state_data = state_tokens.pop(state, None)
+    # Single use: popped atomically; unknown and expired tokens both miss
+    state_data = await get_oauth_state_store().pop(state)
     if not state_data:
-        logger.warning(f"Invalid state token: {state}")
-        raise HTTPException(status_code=400, detail="Invalid state token")
-    if (datetime.utcnow() - state_data["created_at"]).total_seconds() > 300:
-        logger.warning("Expired state token")
-        raise HTTPException(status_code=400, detail="Expired state token")
+        logger.warning(f"Invalid or expired state token: {state}")
+        raise HTTPException(status_code=400, detail="Invalid or expired state token")
 
     if error:
         logger.error(f"Facebook OAuth error: {error_reason} - {error_description}")
@@ -136,23 +132,3 @@ async def get_me(
     except Exception as e:
         logger.error(f"User info fetch failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to retrieve user information")
-
-async def clean_expired_tokens():
-    """
-    Periodically clean expired state tokens
-    """
-    while True:
-        try:
-            now = datetime.utcnow()
-            expired = [
-                token for token, data in state_tokens.items()
-                if (now - data["created_at"]).total_seconds() > 300
-            ]
-            for token in expired:
-                state_tokens.pop(token, None)
-            await asyncio.sleep(300)  # Run every 5 minutes
-        except Exception as e:
-            logger.error(f"Token cleanup failed: {e}", exc_info=True)
-            await asyncio.sleep(60)
-
-
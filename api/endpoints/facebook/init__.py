@@ -1,6 +1,5 @@
  
 
-import asyncio
 import logging
 
 from fastapi import FastAPI, Request
@@ -8,7 +7,7 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from core.config import settings
  
-from api.endpoints.facebook.auth import router as auth_router, clean_expired_tokens
+from api.endpoints.facebook.auth import router as auth_router
 
 
 from api.endpoints.facebook.posts    import router as posts_router
@@ -72,8 +71,6 @@ app.add_middleware(
 @app.on_event("startup")
 async def on_startup():
     logger.info("Application startup initiated.")
-    # kick off the background state-token cleanup
-    asyncio.create_task(clean_expired_tokens())
     logger.info("Application startup complete.")
 
 @app.on_event("shutdown")
@@ -1,23 +1,65 @@
 # api/endpoints/facebook/insights.py
 
-from fastapi import APIRouter, Query, Depends
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import APIRouter, Query, Depends, HTTPException, Request
 from services.facebook_analytics import FacebookAnalytics
-from db.session import get_db
+from services.agent_benchmarks import get_benchmark_engine
+from services.insights_store import InsightsStore
+from db.session import get_analytics_db
 from motor.motor_asyncio import AsyncIOMotorCollection
+from core.config import settings
+from utils.http_cache import ResponseCache, conditional_response
 
 router = APIRouter()
 
+@lru_cache(maxsize=None)
+def get_insights_cache() -> ResponseCache:
+    return ResponseCache(settings.HTTP_CACHE_TTL_SECONDS)
+
 @router.get("/agents/{agent_id}")
 async def get_agent_insights(
     agent_id: str,
-    days: int = Query(7, ge=1, le=30),
-    db: AsyncIOMotorCollection = Depends(get_db)
+    request: Request,
+    days: int = Query(7, ge=1),
+    start: Optional[datetime] = Query(None, description="Range start (overrides `days`)"),
+    end: Optional[datetime] = Query(None, description="Range end, defaults to now"),
+    max_points: int = Query(settings.INSIGHTS_MAX_POINTS, ge=1, le=settings.INSIGHTS_MAX_POINTS),
+    db: AsyncIOMotorCollection = Depends(get_analytics_db)
 ):
-    from datetime import datetime, timedelta
-    end_date = datetime.utcnow().strftime("%Y-%m-%d")
-    start_date = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d")
-    
-    analytics = FacebookAnalytics(db)
-    return await analytics.get_agent_analytics(agent_id, start_date, end_date)
+    # Any range is accepted; the bucket size grows with it so the number of
+    # points stays under `max_points`. The unit is reported in a header so
+    # the response body stays the list the charts already consume.
+    now = datetime.utcnow()
+    range_end = end or now
+    range_start = start or range_end - timedelta(days=days)
+    if range_start >= range_end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    async def compute():
+        bucket, series = await FacebookAnalytics(db).get_agent_series(
+            agent_id, range_start, range_end, max_points
+        )
+        return series, {"X-Insights-Bucket": bucket}
 
+    # Dashboards poll this: the agent's insights version (bumped whenever
+    # samples are recorded) drives the ETag and invalidates the cache.
+    # Open-ended ranges are keyed to the hour so the window still slides.
+    version, updated_at = await InsightsStore().get_version(agent_id)
+    key = (agent_id, start, end or now.strftime("%Y-%m-%dT%H"), days, max_points)
+    entry = await get_insights_cache().get(key, compute, version=version, last_modified=updated_at)
+    return conditional_response(request, entry)
 
+@router.get("/benchmarks/agents/{agent_id}")
+async def get_agent_benchmarks(
+    agent_id: str,
+    days: int = Query(28, ge=7, le=366),
+    end: Optional[datetime] = Query(None, description="Last day of the period, defaults to today")
+):
+    # Percentiles against all agents, moving averages and week-over-week deltas
+    benchmarks = await get_benchmark_engine().get_agent(agent_id, end or datetime.utcnow(), days)
+    if benchmarks is None:
+        raise HTTPException(status_code=404, detail="No insights for this agent in the period")
+    return benchmarks
@@ -1,26 +1,43 @@
 # api/endpoints/facebook/status.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from functools import lru_cache
+
+from fastapi import APIRouter, Depends, HTTPException, Request
 from motor.motor_asyncio import AsyncIOMotorCollection
+from core.config import settings
 from db.session import get_db
+from utils.http_cache import ResponseCache, conditional_response
 
 router = APIRouter()
 
+@lru_cache(maxsize=None)
+def get_status_cache() -> ResponseCache:
+    return ResponseCache(settings.HTTP_CACHE_TTL_SECONDS)
+
 @router.get("/status/agents/{agent_id}")
 async def get_facebook_status(
     agent_id: str,
+    request: Request,
     db: AsyncIOMotorCollection = Depends(get_db)
 ):
-    doc = await db.facebook.find_one({"_id": agent_id})
-    if not doc:
-        raise HTTPException(status_code=404, detail="Agent Facebook data not found")
-
-    facebook_data = doc.get("facebook", {})
-
-    return {
-        "token_valid": bool(facebook_data.get("tokens")),
-        "page_connected": bool(facebook_data.get("pages"))
-    }
+    async def compute():
+        doc = await db.facebook.find_one(
+            {"_id": agent_id},
+            {"facebook.tokens": 1, "facebook.pages": 1}
+        )
+        if not doc:
+            raise HTTPException(status_code=404, detail="Agent Facebook data not found")
+
+        facebook_data = doc.get("facebook", {})
+        return {
+            "token_valid": bool(facebook_data.get("tokens")),
+            "page_connected": bool(facebook_data.get("pages"))
+        }, {}
+
+    # Polled by every open dashboard tab: concurrent polls share one lookup,
+    # and the ETag (derived from the payload) lets clients revalidate cheaply
+    entry = await get_status_cache().get(agent_id, compute)
+    return conditional_response(request, entry)
 
 @router.post("/status/test-insert")
 async def insert_facebook_test_data(
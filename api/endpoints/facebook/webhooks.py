@@ -1,17 +1,14 @@
-from fastapi import APIRouter, Request, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import JSONResponse
-import hmac
-import hashlib
 import logging
-import json
 from core.config import settings
-from services.facebook_webhook_handler import WebhookHandler
-from models.facebook import FacebookWebhookPayload
-from typing import Dict, Any
+from services.webhook_event_log import get_webhook_event_log
+from services.webhook_dedup import get_webhook_deduplicator
+from utils.webhook_parsing import WebhookPayloadError, parse_webhook_body, verify_signature
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
-handler = WebhookHandler()
+APP_SECRET = settings.FB_APP_SECRET.encode("utf-8")
 
 @router.get("")
 async def verify_webhook(
@@ -48,18 +45,18 @@ async def verify_webhook(
         )
 
 @router.post("")
-async def handle_webhook(
-    request: Request, 
-    background_tasks: BackgroundTasks
-):
+async def handle_webhook(request: Request):
     """
-    Process incoming Facebook webhook events
+    Receive incoming Facebook webhook events
     
     Handles:
     - Signature verification for security
     - Event parsing and validation
-    - Background processing for non-critical tasks
+    - Appending the event to the durable webhook log; processing happens
+      in the consumer workers (services/webhook_event_log.py)
     """
+    event_log = get_webhook_event_log()
+    dedup = get_webhook_deduplicator()
     try:
         # Read raw body for signature validation
         body_bytes = await request.body()
@@ -73,49 +70,39 @@ async def handle_webhook(
                 detail="Missing signature header"
             )
             
-        # Extract signature value (format: "sha256=<signature>")
-        signature = signature_header.split('sha256=')[-1].strip()
-        
-        # Generate HMAC signature
-        calculated_signature = hmac.new(
-            settings.FB_APP_SECRET.encode('utf-8'),
-            body_bytes,
-            hashlib.sha256
-        ).hexdigest()
-        
-        # Constant-time comparison to prevent timing attacks
-        if not hmac.compare_digest(signature, calculated_signature):
+        # Verify the HMAC in constant time (format: "sha256=<signature>")
+        calculated_signature = verify_signature(body_bytes, signature_header, APP_SECRET)
+        if calculated_signature is None:
             logger.warning("Invalid webhook signature")
             raise HTTPException(
                 status_code=403,
                 detail="Invalid signature"
             )
-        
-        # Parse JSON payload
-        try:
-            payload = await request.json()
-        except json.JSONDecodeError:
-            logger.error("Invalid JSON payload")
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid JSON payload"
-            )
-        
-        # Validate payload structure
+
+        # Decode the bytes already read for the HMAC once and check their
+        # shape in place; no model is built or copied on the hot path
         try:
-            validated_payload = FacebookWebhookPayload(**payload)
-        except Exception as e:
+            payload = parse_webhook_body(body_bytes)
+        except WebhookPayloadError as e:
             logger.error(f"Payload validation failed: {str(e)}")
             raise HTTPException(
                 status_code=400,
                 detail="Invalid payload structure"
             )
-        
-        # Process event in background to avoid blocking
-        background_tasks.add_task(
-            handler.process_event, 
-            validated_payload.dict()
-        )
+
+        # Retried delivery of a body we already logged: ack without storing
+        delivery_key = dedup.delivery_key(calculated_signature)
+        if not await dedup.unseen([delivery_key]):
+            logger.info("Duplicate webhook delivery ignored")
+            return {"status": "ok"}
+
+        # Persist, then record the delivery. A crash in between only means a
+        # retry is logged twice, and the consumers' per-change dedup drops it.
+        await event_log.append(payload)
+        try:
+            await dedup.mark_seen([delivery_key])
+        except Exception as e:
+            logger.warning(f"Failed to record webhook delivery (retries will be logged again): {e}")
         
         return {"status": "ok"}
         
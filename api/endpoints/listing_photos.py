@@ -0,0 +1,67 @@
+# api/endpoints/listing_photos.py
+
+import logging
+import os
+
+from fastapi import APIRouter, HTTPException, Request
+
+from core.config import settings
+from services.image_processor import IMAGE_SIGNATURES, PropertyImageProcessor
+from services.image_store import VARIANTS, get_image_store
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.post("/{agent_id}/photos", status_code=201)
+async def upload_listing_photo(agent_id: str, request: Request):
+    """
+    Upload one listing photo as the raw request body (e.g. `Content-Type: image/jpeg`).
+
+    The body is streamed to disk rather than parsed as a multipart form, so
+    a photo is never held in memory and an oversized or non-image upload is
+    rejected as soon as that is known. Accepted photos go to the
+    content-addressed image store; variants are under `variants`.
+    """
+    max_size = settings.LISTING_PHOTO_MAX_BYTES
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_size:
+        raise HTTPException(status_code=413, detail=f"File too large. Max size: {max_size/1024/1024}MB")
+
+    store = get_image_store()
+    processor = PropertyImageProcessor()
+    stored = await processor.stream_to_disk(
+        request.stream(),
+        store.staging_dir,
+        allowed_types=list(IMAGE_SIGNATURES),
+        max_size=max_size
+    )
+    try:
+        blob = await store.put(stored.path, move=True, agent_id=agent_id, sha256=stored.sha256)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image file: {e}")
+    finally:
+        if os.path.exists(stored.path):
+            os.unlink(stored.path)
+    logger.info(f"Stored listing photo {blob.sha256} ({blob.size} bytes) for agent {agent_id}")
+    return {
+        "path": blob.path,
+        "url": blob.url,
+        "sha256": blob.sha256,
+        "size": blob.size,
+        "width": blob.width,
+        "height": blob.height,
+        "content_type": blob.content_type,
+        "variants": {name: store.url_for(store.variant_path(blob.sha256, name)) for name in VARIANTS},
+    }
+
+
+@router.delete("/{agent_id}/photos/{sha256}", status_code=204)
+async def delete_listing_photo(agent_id: str, sha256: str):
+    """
+    Drop the agent's reference to an uploaded photo. The file is removed by
+    the disk GC once nothing references it any more.
+    """
+    if not await get_image_store().release(sha256, agent_id=agent_id):
+        raise HTTPException(status_code=404, detail="Photo not found")
+    logger.info(f"Released listing photo {sha256} for agent {agent_id}")
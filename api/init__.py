@@ -1,6 +1,5 @@
 # api/__init__.py
 
-import asyncio
 import logging
 import os
 
@@ -12,7 +11,7 @@ from core.config import settings
 
 # --- Import all necessary routers ---
 # Ensure these files/routers exist if you're importing them
-from api.endpoints.facebook.auth import router as auth_router, clean_expired_tokens
+from api.endpoints.facebook.auth import router as auth_router
 from api.endpoints.facebook.posts import router as posts_router
 from api.endpoints.facebook.status import router as status_router
 from api.endpoints.facebook.insights import router as insights_router
@@ -85,7 +84,6 @@ app.mount("/generated_images", StaticFiles(directory=IMAGES_DIR), name="static_i
 @app.on_event("startup")
 async def on_startup():
     logger.info("Application startup initiated.")
-    asyncio.create_task(clean_expired_tokens())
     logger.info("Application startup complete.")
 
 @app.on_event("shutdown")
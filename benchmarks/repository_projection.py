@@ -0,0 +1,103 @@
+# benchmarks/repository_projection.py
+#
+# Latency and bytes returned per post lookup for an agent with many posts,
+# with and without projection-minimal reads. Seeds a scratch database
+# (<MONGO_DB_NAME>_bench, dropped afterwards) on MONGO_URI and times the
+# real queries. Run from the repo root:
+#
+#     python -m benchmarks.repository_projection [--posts 5000] [--runs 200]
+
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import bson
+from pymongo import ASCENDING, MongoClient
+
+from core.config import settings
+from models.post import FacebookPost
+
+
+def build_post(agent_id: str, i: int) -> dict:
+    created = datetime(2024, 1, 1) + timedelta(hours=i)
+    return {
+        "agent_id": agent_id,
+        "post_id": f"1234567890_{i}",
+        "content": "Stunning 3 bed, 2 bath home with a renovated kitchen and a huge backyard. " * 4,
+        "images": [f"generated_images/{agent_id}_{i}_{n}.png" for n in range(3)],
+        "status": "published",
+        "created_at": created,
+        "last_updated": created,
+        "logged_at": created,
+        "engagement": [
+            {"name": name, "period": "lifetime", "values": [{"value": i % 500}]}
+            for name in ("post_impressions", "post_engaged_users", "post_clicks")
+        ],
+    }
+
+
+def measure(collection, query: dict, projection, runs: int) -> tuple:
+    """Median milliseconds of `find_one` over `runs` calls, and the BSON size of the document returned."""
+    timings = []
+    doc = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        doc = collection.find_one(query, projection)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), len(bson.encode(doc or {}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Repository projection latency/payload benchmark")
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    client = MongoClient(settings.MONGO_URI)
+    db_name = f"{settings.MONGO_DB_NAME}_bench"
+    client.drop_database(db_name)
+    database = client[db_name]
+    try:
+        agent_id = "agent_001"
+        posts = [build_post(agent_id, i) for i in range(args.posts)]
+        target = posts[args.posts // 2]["post_id"]
+
+        # Legacy layout: every post in the agent document
+        agents = database["agents"]
+        agents.insert_one({"_id": agent_id, "access_token": "x" * 180, "facebook": {"posts": posts}})
+        agents.create_index([("facebook.posts.post_id", ASCENDING)])
+        # Posts collection, indexed as in db/indexes.py
+        collection = database[settings.POSTS_COLLECTION]
+        collection.insert_many([dict(post) for post in posts])
+        collection.create_index([("agent_id", ASCENDING), ("post_id", ASCENDING)], unique=True)
+        collection.create_index([("post_id", ASCENDING)])
+
+        model_fields = {"_id": 0, **{field: 1 for field in FacebookPost.model_fields}}
+        cases = [
+            ("legacy, whole agent document", agents, {"_id": agent_id}, None),
+            ("legacy, $elemMatch", agents, {"facebook.posts.post_id": target},
+             {"_id": 0, "facebook.posts": {"$elemMatch": {"post_id": target}}}),
+            ("posts collection, no projection", collection, {"post_id": target}, None),
+            ("posts collection, model fields", collection, {"post_id": target}, model_fields),
+            ("posts collection, ['agent_id']", collection, {"post_id": target}, {"_id": 0, "agent_id": 1}),
+        ]
+
+        print(f"agent with {args.posts} posts, median of {args.runs} find_one calls")
+        results = {}
+        for label, coll, query, projection in cases:
+            coll.find_one(query, projection)  # warm the cache
+            results[label] = measure(coll, query, projection, args.runs)
+            ms, size = results[label]
+            print(f"{label + ':':<36}{ms:>9.3f} ms {size:>12,} bytes")
+
+        before_ms, _ = results["legacy, whole agent document"]
+        after_ms, _ = results["posts collection, model fields"]
+        print(f"{'speedup for a post read:':<36}{before_ms / after_ms:>9.1f}x")
+    finally:
+        client.drop_database(db_name)
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,32 @@ class Settings(BaseSettings):
 
     MONGO_URI: str
     MONGO_DB_NAME: str = "property_agents"
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_MAX_IDLE_TIME_MS: int = 60_000
+    MONGO_CONNECT_TIMEOUT_MS: int = 5_000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 5_000
+    MONGO_SOCKET_TIMEOUT_MS: int = 20_000
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = 5_000
+    POSTS_COLLECTION: str = "facebook_posts"
+    # Post metric samples (time-series) and their per-agent rollups
+    INSIGHTS_TS_COLLECTION: str = "insights_samples"
+    INSIGHTS_DAILY_COLLECTION: str = "insights_daily"
+    INSIGHTS_WEEKLY_COLLECTION: str = "insights_weekly"
+    INSIGHTS_VERSIONS_COLLECTION: str = "insights_versions"
+    # Last lifetime counters seen per post, to turn samples into deltas
+    INSIGHTS_LATEST_COLLECTION: str = "insights_latest"
+    INSIGHTS_BACKFILL_INTERVAL_SECONDS: float = 3600.0
+    # Upper bound on buckets returned by a ranged insights query
+    INSIGHTS_MAX_POINTS: int = 120
+    # Cross-agent benchmarks (services/agent_benchmarks.py)
+    BENCHMARK_CACHE_TTL_SECONDS: float = 300.0
+    BENCHMARK_MOVING_AVERAGE_DAYS: int = 7
+    # Server-side cache of polled dashboard responses (utils/http_cache.py)
+    HTTP_CACHE_TTL_SECONDS: float = 5.0
+    # Write-behind batching of concurrent updates (db/bulk_writer.py)
+    MONGO_BULK_MAX_BATCH: int = 500
+    MONGO_BULK_MAX_DELAY_MS: float = 20.0
 
     STABILITY_API_KEY: str
     OPENAI_API_KEY: str
@@ -28,6 +54,89 @@ class Settings(BaseSettings):
     FRONTEND_URL: str = Field("http://localhost:3000", env="FRONTEND_URL")
 
 
+    # Webhook ingestion: events are appended to a durable Mongo log and
+    # drained by background consumers (see services/webhook_event_log.py)
+    WEBHOOK_LOG_COLLECTION: str = "webhook_events"
+    WEBHOOK_CONSUMERS_ENABLED: bool = True
+    WEBHOOK_CONSUMER_PARTITIONS: int = 4
+    WEBHOOK_CONSUMER_BATCH_SIZE: int = 100
+    WEBHOOK_CONSUMER_POLL_INTERVAL: float = 0.5
+    WEBHOOK_CONSUMER_SETTLE_SECONDS: float = 1.0
+    # Each partition is drained by the one worker holding its lease
+    WEBHOOK_CONSUMER_LEASE_SECONDS: float = 30.0
+    # Failed batches are retried this often, then applied per event with failures dead-lettered
+    WEBHOOK_CONSUMER_MAX_ATTEMPTS: int = 5
+    WEBHOOK_LOG_RETENTION_SECONDS: int = 14 * 24 * 3600
+
+    # Facebook retries deliveries for up to a day; remember keys a bit longer
+    WEBHOOK_DEDUP_COLLECTION: str = "webhook_dedup"
+    WEBHOOK_DEDUP_TTL_SECONDS: int = 36 * 3600
+    WEBHOOK_DEDUP_LRU_SIZE: int = 100_000
+
+    # Comment webhooks trigger at most one insights refresh per post per window
+    ENGAGEMENT_REFRESH_WINDOW_SECONDS: float = 60.0
+    ENGAGEMENT_REFRESH_TICK_SECONDS: float = 1.0
+    ENGAGEMENT_REFRESH_CONCURRENCY: int = 8
+
+    # Tiered engagement sync (tasks/facebook_sync.py)
+    ENGAGEMENT_SYNC_CONCURRENCY: int = 8
+    ENGAGEMENT_SYNC_MAX_POSTS: int = 5_000
+    ENGAGEMENT_SYNC_INTERVAL_SECONDS: float = 300.0
+    # "post": one /insights call per due post; "page": paged /{page_id}/posts with inline insights
+    ENGAGEMENT_SYNC_MODE: str = "post"
+    PAGE_SYNC_PAGE_SIZE: int = 100
+    PAGE_SYNC_CURSORS_COLLECTION: str = "page_sync_cursors"
+
+    # Lease-based periodic jobs (services/job_scheduler.py)
+    JOB_SCHEDULER_ENABLED: bool = True
+    JOB_LEASES_COLLECTION: str = "job_leases"
+    JOB_RUNS_COLLECTION: str = "job_runs"
+    JOB_LEASE_SECONDS: float = 60.0
+    JOB_POLL_INTERVAL: float = 5.0
+    JOB_RUNS_TTL_SECONDS: int = 30 * 24 * 3600
+    TOKEN_REFRESH_INTERVAL_SECONDS: float = 3600.0
+
+    # OAuth state tokens: "mongo" (shared across workers) or "memory"
+    OAUTH_STATE_BACKEND: str = "mongo"
+    OAUTH_STATE_COLLECTION: str = "oauth_states"
+
+    # Pillow work runs in a process pool (services/image_pipeline.py)
+    IMAGE_PIPELINE_WORKERS: int = 2
+    IMAGE_PIPELINE_QUEUE_SIZE: int = 32
+
+    # Listing photo uploads (api/endpoints/listing_photos.py)
+    LISTING_PHOTO_MAX_BYTES: int = 25 * 1024 * 1024
+
+    # Content-addressed image store (services/image_store.py)
+    IMAGE_STORE_DIR: str = "generated_images"
+    # In-flight uploads and compositions; keep it outside IMAGE_STORE_DIR (which is served)
+    # and on the same filesystem so stored files are renamed rather than copied
+    IMAGE_STAGING_DIR: str = "image_staging"
+    IMAGE_BLOBS_COLLECTION: str = "image_blobs"
+    IMAGE_VARIANT_BUDGET_BYTES: int = 2 * 1024 ** 3
+    # Upload encodings (services/image_encoder.py): smallest size with SSIM at or above target
+    IMAGE_ENCODED_DIR: str = "generated_images/encoded"
+    IMAGE_ENCODE_TARGET_SSIM: float = 0.985
+
+    # Branded listing images (services/image_compositor.py)
+    BRAND_FONT_PATH: Optional[str] = None
+    BRAND_IMAGE_WIDTH: int = 1080
+    BRAND_IMAGE_HEIGHT: int = 1080
+    BRAND_IMAGE_BATCH_SIZE: int = 8
+    BRAND_IMAGE_QUALITY: int = 88
+    # Branding sessions are dropped this long after they start (if never continued) or
+    # complete, releasing their images; completed ones keep them while the client posts them
+    BRANDING_SESSION_TTL_SECONDS: float = 3600.0
+
+    # Disk GC of generated_images/, image_staging/ and agent_sites/ (services/disk_gc.py)
+    AGENT_SITES_DIR: str = "agent_sites"
+    DISK_GC_INTERVAL_SECONDS: float = 60.0
+    DISK_GC_BATCH_SIZE: int = 2_000
+    DISK_GC_MIN_AGE_SECONDS: float = 7 * 24 * 3600
+    DISK_GC_AGENT_QUOTA_BYTES: int = 500 * 1024 ** 2
+    DISK_GC_GLOBAL_QUOTA_BYTES: int = 20 * 1024 ** 3
+    DISK_GC_REPORTS_COLLECTION: str = "disk_gc_reports"
+
     ENVIRONMENT: str = "development"
     LOG_LEVEL: str = "INFO"
 
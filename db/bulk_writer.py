@@ -0,0 +1,166 @@
+# db/bulk_writer.py
+
+import asyncio
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BulkOpResult(NamedTuple):
+    """
+    Outcome of one queued write.
+
+    `matched` is True/False when the batch counts pin it down (every op in
+    the batch matched, or none did). bulk_write does not report matches per
+    operation, so when only some of a batch matched, the ops whose filters
+    are plain top-level equalities are resolved with one lookup for the
+    whole batch; `matched` is None only for the other filters.
+    """
+    matched: Optional[bool]
+    upserted_id: Any = None
+
+
+class BulkWriteBatcher:
+    """
+    Write-behind batcher for one collection.
+
+    Callers await `update_one` as usual; the operation is queued and sent
+    together with its neighbours as one unordered `bulk_write` once
+    `max_batch` operations are pending or `max_delay` seconds have passed,
+    whichever comes first. Each caller's future resolves with its own
+    BulkOpResult, or raises its own write error.
+    """
+
+    def __init__(self, collection: AsyncIOMotorCollection, max_batch: int = 500, max_delay: float = 0.02):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending: List[Tuple[UpdateOne, Dict[str, Any], asyncio.Future]] = []
+        self._timer: Optional[asyncio.Task] = None
+        self._flushes: Set[asyncio.Task] = set()  # size-triggered flushes, kept so they are not collected
+
+    async def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False) -> BulkOpResult:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((UpdateOne(filter, update, upsert=upsert), filter, future))
+
+        if len(self._pending) >= self.max_batch:
+            task = asyncio.create_task(self.flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_delay)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        ops = [op for op, _, _ in batch]
+        errors: Dict[int, Exception] = {}
+        try:
+            result = await self.collection.bulk_write(ops, ordered=False)
+            matched, upserted = result.matched_count, result.upserted_ids
+        except BulkWriteError as e:
+            details = e.details
+            matched = details.get("nMatched", 0)
+            upserted = {u["index"]: u["_id"] for u in details.get("upserted", [])}
+            for error in details.get("writeErrors", []):
+                errors[error["index"]] = RuntimeError(error.get("errmsg", "bulk write error"))
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        succeeded = len(batch) - len(errors) - len(upserted)
+        resolved: Dict[int, bool] = {}
+        if matched == succeeded:
+            all_matched: Optional[bool] = True
+        elif matched == 0:
+            all_matched = False
+        else:
+            all_matched = None
+            unknown = [i for i in range(len(batch)) if i not in errors and i not in upserted]
+            resolved = await self._resolve_matches({i: batch[i][1] for i in unknown})
+
+        for index, (_, _, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index in errors:
+                future.set_exception(errors[index])
+            elif index in upserted:
+                future.set_result(BulkOpResult(matched=False, upserted_id=upserted[index]))
+            else:
+                future.set_result(BulkOpResult(matched=resolved.get(index, all_matched)))
+
+        logger.debug(f"Flushed {len(batch)} writes to {self.collection.name} in one bulk_write")
+
+
+    async def _resolve_matches(self, filters: Dict[int, Dict[str, Any]]) -> Dict[int, bool]:
+        """
+        Which of the ops (by batch index → filter) matched a document, found
+        with one `$or` query over their filters. Only plain top-level
+        equality filters can be checked against the returned documents;
+        others are left out.
+        """
+        filters = {
+            i: f for i, f in filters.items()
+            if f and all("." not in key and not key.startswith("$") for key in f)
+            and not any(isinstance(value, dict) for value in f.values())
+        }
+        if not filters:
+            return {}
+        keys = {key for f in filters.values() for key in f}
+        try:
+            found = await self.collection.find(
+                {"$or": list(filters.values())}, {key: 1 for key in keys}
+            ).to_list(None)
+        except Exception as e:
+            logger.warning(f"Could not resolve matches of a mixed batch on {self.collection.name}: {e}")
+            return {}
+        return {
+            i: any(all(key in doc and doc[key] == value for key, value in f.items()) for doc in found)
+            for i, f in filters.items()
+        }
+
+
+_batchers: Dict[str, BulkWriteBatcher] = {}
+
+
+def get_batcher(collection: AsyncIOMotorCollection) -> BulkWriteBatcher:
+    """Process-wide batcher per collection, so concurrent callers share batches."""
+    key = collection.full_name
+    if key not in _batchers:
+        _batchers[key] = BulkWriteBatcher(
+            collection,
+            max_batch=settings.MONGO_BULK_MAX_BATCH,
+            max_delay=settings.MONGO_BULK_MAX_DELAY_MS / 1000,
+        )
+    return _batchers[key]
+
+
+async def flush_all():
+    """
+    Flush every batcher; called on shutdown so no queued write is lost.
+    The batchers are then dropped, as their collection handles belong to
+    the client being closed.
+    """
+    await asyncio.gather(*(batcher.flush() for batcher in _batchers.values()))
+    await asyncio.gather(*(task for batcher in _batchers.values() for task in list(batcher._flushes)))
+    _batchers.clear()
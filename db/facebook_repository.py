@@ -8,19 +8,34 @@ from motor.motor_asyncio import AsyncIOMotorCollection
 from pymongo import ReturnDocument
 from bson.objectid import ObjectId
 
-from models.facebook import (
-    FacebookPost,
-    FacebookPostUpdate,
-    FacebookTokenRecord,
-    FacebookPage
-)
+from db.bulk_writer import get_batcher
+from db.session import get_posts_collection
+from models.facebook import FacebookTokenRecord, FacebookPage
+from models.post import FacebookPost, FacebookPostUpdate
+from services.engagement_schedule import next_engagement_sync
 
 logger = logging.getLogger(__name__)
 
 
 class FacebookRepository:
-    def __init__(self, collection: AsyncIOMotorCollection):
+    """
+    Agent Facebook data access.
+
+    Posts live in their own collection (one document per agent and post,
+    unique on `(agent_id, post_id)`, see db/indexes.py): agents connected to
+    the same page each hold their own copy. Tokens and pages stay on the
+    agent document. Until tasks/migrate_posts_collection.py has finished,
+    lookups that miss the posts collection fall back to the legacy
+    `facebook.posts` array on the agent document.
+    """
+
+    def __init__(
+        self,
+        collection: AsyncIOMotorCollection,
+        posts_collection: Optional[AsyncIOMotorCollection] = None
+    ):
         self.collection = collection
+        self.posts = posts_collection if posts_collection is not None else get_posts_collection()
         self.posts_path = "facebook.posts"
         self.tokens_path = "facebook.tokens"
         self.pages_path = "facebook.pages"
@@ -29,56 +44,123 @@ class FacebookRepository:
         try:
             post_dict = post.dict()
             post_dict["logged_at"] = datetime.utcnow()
+            # Due time of the first engagement refresh (tasks/facebook_sync.py)
+            post_dict["next_sync_at"] = next_engagement_sync(post.created_at, post_dict["logged_at"])
 
             logger.info(f"Inserting post for agent: {post.agent_id}")
             logger.debug(f"Post payload: {post_dict}")
 
-            result = await self.collection.update_one(
-                {"_id": post.agent_id},
-                {"$push": {self.posts_path: post_dict}},
+            result = await get_batcher(self.posts).update_one(
+                {"agent_id": post.agent_id, "post_id": post.post_id},
+                {"$set": post_dict},
                 upsert=True
             )
 
-            if not result.acknowledged:
-                raise ValueError("Post insertion was not acknowledged by MongoDB.")
-
-            logger.info(f"Post logged successfully. Matched: {result.matched_count}, Modified: {result.modified_count}, Upserted: {result.upserted_id}")
+            logger.info(f"Post logged successfully. Upserted: {result.upserted_id}")
             return post
 
         except Exception as e:
             logger.error(f"Error logging Facebook post: {e}", exc_info=True)
             raise
 
+    def _post_projection(self, fields: Optional[List[str]]) -> Dict[str, Any]:
+        projection: Dict[str, Any] = {"_id": 0}
+        projection.update({field: 1 for field in fields or FacebookPost.model_fields})
+        return projection
+
+    def _legacy_post_projection(self, post_id: str) -> Dict[str, Any]:
+        # $elemMatch returns only the matching array element, not every post
+        return {"_id": 0, self.posts_path: {"$elemMatch": {"post_id": post_id}}}
+
+    @staticmethod
+    def _legacy_post(doc: Optional[Dict[str, Any]], fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        posts = (doc or {}).get("facebook", {}).get("posts") or []
+        if not posts:
+            return None
+        return {k: v for k, v in posts[0].items() if not fields or k in fields}
+
+    async def get_post(self, post_id: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Fetch one post (any agent's copy), transferring only `fields`
+        (default: the FacebookPost model fields), e.g.
+        ``get_post(post_id, ["engagement"])`` on hot paths.
+        """
+        post = await self.posts.find_one({"post_id": post_id}, self._post_projection(fields))
+        if post:
+            return post
+
+        # Not migrated yet: read it from the agent document
+        doc = await self.collection.find_one(
+            {f"{self.posts_path}.post_id": post_id},
+            self._legacy_post_projection(post_id)
+        )
+        return self._legacy_post(doc, fields)
+
+    async def get_post_agent_ids(self, post_id: str) -> List[str]:
+        """Agents holding a copy of the post, migrated or not."""
+        agent_ids = set(await self.posts.distinct("agent_id", {"post_id": post_id}))
+        agent_ids.update(await self.collection.distinct("_id", {f"{self.posts_path}.post_id": post_id}))
+        return sorted(str(agent_id) for agent_id in agent_ids)
+
+    async def set_post_fields(self, post_id: str, fields: Dict[str, Any], agent_id: Optional[str] = None) -> bool:
+        """
+        `$set` fields on `agent_id`'s copy of a post; returns False if there
+        is none.
+
+        Without an agent (webhooks only identify the page), every agent's
+        copy is updated, since agents connected to the same page hold the
+        same Facebook post.
+        """
+        if agent_id is not None:
+            # Batched with concurrent writers into one bulk_write (db/bulk_writer.py);
+            # the equality filter means the batcher always knows whether it matched
+            result = await get_batcher(self.posts).update_one({"agent_id": agent_id, "post_id": post_id}, {"$set": fields})
+            matched = bool(result.matched)
+        else:
+            matched = (await self.posts.update_many({"post_id": post_id}, {"$set": fields})).matched_count > 0
+        if matched:
+            return True
+
+        legacy = {f"{self.posts_path}.$.{k}": v for k, v in fields.items()}
+        legacy_query = {f"{self.posts_path}.post_id": post_id}
+        if agent_id is not None:
+            legacy_query["_id"] = agent_id
+            result = await self.collection.update_one(legacy_query, {"$set": legacy})
+        else:
+            result = await self.collection.update_many(legacy_query, {"$set": legacy})
+        return bool(result.matched_count)
+
     async def update_post(self, agent_id: str, post_id: str, update: FacebookPostUpdate) -> FacebookPost:
         try:
-            update_data = {"$set": {}}
-            for field, value in update.dict(exclude_unset=True).items():
-                update_data["$set"][f"{self.posts_path}.$.{field}"] = value
-
+            fields = update.dict(exclude_unset=True)
             if update.status:
-                update_data["$set"][f"{self.posts_path}.$.last_updated"] = datetime.utcnow()
+                fields["last_updated"] = datetime.utcnow()
 
-            logger.info(f"Updating post: {post_id} for agent: {agent_id} with data: {update_data}")
+            logger.info(f"Updating post: {post_id} for agent: {agent_id} with data: {fields}")
 
-            result = await self.collection.find_one_and_update(
-                {
-                    "_id": agent_id,
-                    f"{self.posts_path}.post_id": post_id
-                },
-                update_data,
+            result = await self.posts.find_one_and_update(
+                {"agent_id": agent_id, "post_id": post_id},
+                {"$set": fields},
+                projection=self._post_projection(None),
                 return_document=ReturnDocument.AFTER
             )
 
             if not result:
-                raise ValueError(f"Post {post_id} not found for agent {agent_id}")
-
-            post_list = result.get("facebook", {}).get("posts", [])
-            updated_post = next((p for p in post_list if p["post_id"] == post_id), None)
-
-            if not updated_post:
-                raise ValueError("Post updated but not found in returned document")
-
-            return FacebookPost(**updated_post)
+                # Not migrated yet: update it in place on the agent document,
+                # returning only the updated element of the posts array
+                doc = await self.collection.find_one_and_update(
+                    {"_id": agent_id, f"{self.posts_path}.post_id": post_id},
+                    {"$set": {f"{self.posts_path}.$.{k}": v for k, v in fields.items()}},
+                    projection=self._legacy_post_projection(post_id),
+                    return_document=ReturnDocument.AFTER
+                )
+                if not doc:
+                    raise ValueError(f"Post {post_id} not found for agent {agent_id}")
+                result = self._legacy_post(doc)
+                if not result:
+                    raise ValueError("Post updated but not found in returned document")
+
+            return FacebookPost(**result)
 
         except Exception as e:
             logger.error(f"Error updating Facebook post: {e}", exc_info=True)
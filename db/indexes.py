@@ -0,0 +1,311 @@
+# db/indexes.py
+#
+# Declarative index registry. Every index the app relies on is declared
+# here, applied idempotently at startup and checkable from the CLI:
+#
+#     python -m db.indexes            # create missing indexes, report drift
+#     python -m db.indexes --check    # only report drift (exit 1 if any)
+#     python -m db.indexes --explain  # check the hot queries' plans use an index
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from bson.objectid import ObjectId
+
+from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from core.config import settings
+from db.session import get_database, get_db
+from logging_config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Options that make two indexes with the same keys behave differently
+_COMPARED_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+def timeseries_registry() -> Dict[str, Dict[str, Any]]:
+    """Collections that must be created as time-series collections before indexing."""
+    return {
+        settings.INSIGHTS_TS_COLLECTION: {"timeField": "ts", "metaField": "meta", "granularity": "hours"},
+    }
+
+
+def index_registry() -> Dict[str, List[IndexModel]]:
+    """Collection name → declared indexes. Names are explicit so drift is detected by name."""
+    agents = get_db().name
+    return {
+        # Agent documents: tokens/pages at the root, legacy post arrays,
+        # agent settings (routes/agents.py) and branding sessions
+        agents: [
+            IndexModel([("facebook.posts.post_id", ASCENDING)], name="legacy_post_id", sparse=True),
+            IndexModel([("agent_id", ASCENDING), ("date", ASCENDING)], name="agent_id_date"),
+            IndexModel([("agentId", ASCENDING)], name="agentId", sparse=True),
+            IndexModel([("session_id", ASCENDING)], name="session_id", sparse=True),
+        ],
+        f"{agents}.agent_websites": [
+            IndexModel([("agent_id", ASCENDING)], name="agent_id", unique=True),
+        ],
+        # Agents connected to the same page each hold their own copy of a post
+        settings.POSTS_COLLECTION: [
+            IndexModel([("agent_id", ASCENDING), ("post_id", ASCENDING)], name="agent_id_post_id", unique=True),
+            IndexModel([("post_id", ASCENDING)], name="post_id_lookup"),
+            IndexModel([("agent_id", ASCENDING), ("created_at", DESCENDING)], name="agent_id_created_at"),
+            # Due posts for the tiered engagement sync
+            IndexModel([("status", ASCENDING), ("next_sync_at", ASCENDING)], name="status_next_sync_at"),
+        ],
+        settings.WEBHOOK_LOG_COLLECTION: [
+            IndexModel([("partition", ASCENDING), ("_id", ASCENDING)], name="partition_offset"),
+            IndexModel([("received_at", ASCENDING)], name="received_at"),
+            IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        ],
+        f"{settings.WEBHOOK_LOG_COLLECTION}_dead_letters": [
+            IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        ],
+        settings.INSIGHTS_TS_COLLECTION: [
+            IndexModel([("meta.agent_id", ASCENDING), ("ts", ASCENDING)], name="agent_id_ts"),
+        ],
+        settings.INSIGHTS_DAILY_COLLECTION: [
+            IndexModel([("agent_id", ASCENDING), ("bucket", ASCENDING)], name="agent_id_bucket", unique=True),
+        ],
+        settings.INSIGHTS_WEEKLY_COLLECTION: [
+            IndexModel([("agent_id", ASCENDING), ("bucket", ASCENDING)], name="agent_id_bucket", unique=True),
+        ],
+        settings.JOB_RUNS_COLLECTION: [
+            IndexModel([("job", ASCENDING), ("started_at", DESCENDING)], name="job_started_at"),
+            IndexModel(
+                [("started_at", ASCENDING)],
+                name="started_at_ttl",
+                expireAfterSeconds=settings.JOB_RUNS_TTL_SECONDS
+            ),
+        ],
+        settings.OAUTH_STATE_COLLECTION: [
+            IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        ],
+        settings.IMAGE_BLOBS_COLLECTION: [
+            IndexModel([("refs", ASCENDING), ("last_referenced_at", ASCENDING)], name="refs_last_referenced_at"),
+        ],
+        settings.DISK_GC_REPORTS_COLLECTION: [
+            IndexModel([("host", ASCENDING), ("finished_at", DESCENDING)], name="host_finished_at"),
+        ],
+        settings.WEBHOOK_DEDUP_COLLECTION: [
+            IndexModel(
+                [("created_at", ASCENDING)],
+                name="created_at_ttl",
+                expireAfterSeconds=settings.WEBHOOK_DEDUP_TTL_SECONDS
+            ),
+        ],
+    }
+
+
+def retired_indexes() -> Dict[str, List[str]]:
+    """Indexes dropped by apply_indexes because they contradict the registry."""
+    return {
+        # Unique on post_id alone: a second agent's copy of a post could not be stored
+        settings.POSTS_COLLECTION: ["post_id"],
+    }
+
+
+def _normalize(spec: Dict[str, Any]) -> Dict[str, Any]:
+    keys = spec.get("key")
+    keys = keys.items() if isinstance(keys, dict) else keys
+    keys = [(k, int(v) if isinstance(v, (int, float)) else v) for k, v in keys]
+    return {"key": keys, **{opt: spec[opt] for opt in _COMPARED_OPTIONS if opt in spec}}
+
+
+def _server_created(collection: str) -> Set[str]:
+    """Indexes the server adds itself: MongoDB 6.3+ indexes metaField + timeField on time-series collections."""
+    options = timeseries_registry().get(collection)
+    if not options or "metaField" not in options:
+        return set()
+    return {f"{options['metaField']}_1_{options['timeField']}_1"}
+
+
+async def detect_drift(
+    database: AsyncIOMotorDatabase,
+    registry: Optional[Dict[str, List[IndexModel]]] = None
+) -> List[str]:
+    """Compare live indexes with the registry; returns human-readable differences."""
+    registry = registry or index_registry()
+    problems = []
+    for name, models in registry.items():
+        live = await database[name].index_information()
+        live.pop("_id_", None)
+        for index_name in _server_created(name):
+            live.pop(index_name, None)
+        declared = {m.document["name"]: _normalize(m.document) for m in models}
+
+        for index_name, spec in declared.items():
+            if index_name not in live:
+                problems.append(f"{name}: missing index {index_name}")
+            elif _normalize(live[index_name]) != spec:
+                problems.append(f"{name}: index {index_name} differs (live {_normalize(live[index_name])}, declared {spec})")
+        for index_name in live.keys() - declared.keys():
+            problems.append(f"{name}: undeclared index {index_name}")
+    return problems
+
+
+async def _log_build_progress(database: AsyncIOMotorDatabase, interval: float = 2.0):
+    """Log the progress of index builds running on the server until cancelled."""
+    pipeline = [
+        {"$currentOp": {"allUsers": True, "idleConnections": False}},
+        {"$match": {"command.createIndexes": {"$exists": True}, "ns": {"$regex": f"^{database.name}\\."}}},
+    ]
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async for op in database.client.admin.aggregate(pipeline):
+                progress = op.get("progress") or {}
+                if progress.get("total"):
+                    logger.info(
+                        f"Building indexes on {op.get('ns')}: "
+                        f"{progress.get('done')}/{progress.get('total')} ({op.get('msg', '')})"
+                    )
+        except OperationFailure as e:
+            logger.debug(f"Index build progress unavailable: {e}")
+            return
+
+
+async def apply_indexes(
+    database: Optional[AsyncIOMotorDatabase] = None,
+    registry: Optional[Dict[str, List[IndexModel]]] = None
+) -> List[str]:
+    """
+    Create every declared index (a no-op for ones that already exist) and
+    return the drift that remains, e.g. an index whose options changed and
+    must be dropped by hand, or an index nobody declared.
+    """
+    database = database if database is not None else get_database()
+    registry = registry or index_registry()
+
+    existing = set(await database.list_collection_names())
+    for name, options in timeseries_registry().items():
+        if name not in existing:
+            await database.create_collection(name, timeseries=options)
+            logger.info(f"Created time-series collection {name}")
+
+    for name, index_names in retired_indexes().items():
+        live = await database[name].index_information() if name in existing else {}
+        for index_name in index_names:
+            if index_name in live:
+                await database[name].drop_index(index_name)
+                logger.info(f"Dropped retired index {index_name} on {name}")
+
+    progress = asyncio.create_task(_log_build_progress(database))
+    try:
+        for name, models in registry.items():
+            try:
+                created = await database[name].create_indexes(models)
+                logger.info(f"Indexes ensured on {name}: {', '.join(created)}")
+            except OperationFailure as e:
+                # IndexOptionsConflict / IndexKeySpecsConflict: leave it to drift reporting
+                logger.error(f"Could not create indexes on {name}: {e}")
+    finally:
+        progress.cancel()
+
+    drift = await detect_drift(database, registry)
+    for problem in drift:
+        logger.warning(f"Index drift: {problem}")
+    return drift
+
+
+def hot_queries() -> List[Tuple[str, Dict[str, Any], Optional[List[Tuple[str, int]]]]]:
+    """
+    (collection, query, sort) of the queries on request and job hot paths,
+    in the shapes the code issues them; each must be served by an index
+    from the registry above.
+    """
+    agents = get_db().name
+    now = datetime.utcnow()
+    return [
+        (settings.POSTS_COLLECTION, {"post_id": "0_0"}, None),
+        (settings.POSTS_COLLECTION, {"agent_id": "a", "post_id": "0_0"}, None),
+        (settings.POSTS_COLLECTION, {"agent_id": "a"}, [("created_at", DESCENDING)]),
+        (
+            settings.POSTS_COLLECTION,
+            {"status": "published", "next_sync_at": {"$lte": now}},
+            [("next_sync_at", ASCENDING)],
+        ),
+        (agents, {"facebook.posts.post_id": "0_0"}, None),
+        (agents, {"agentId": "a"}, None),
+        (agents, {"session_id": "s"}, None),
+        (agents, {"agent_id": "a", "date": {"$gte": "2024-01-01", "$lte": "2024-01-31"}}, None),
+        (
+            settings.WEBHOOK_LOG_COLLECTION,
+            {"partition": 0, "_id": {"$gt": ObjectId.from_datetime(now - timedelta(minutes=1))}},
+            [("_id", ASCENDING)],
+        ),
+        (settings.INSIGHTS_TS_COLLECTION, {"meta.agent_id": "a", "ts": {"$gte": now - timedelta(days=1)}}, None),
+        (settings.INSIGHTS_DAILY_COLLECTION, {"agent_id": "a", "bucket": {"$gte": now - timedelta(days=7)}}, None),
+        (settings.IMAGE_BLOBS_COLLECTION, {"refs": {"$gt": 0}}, None),
+    ]
+
+
+async def check_hot_queries(database: Optional[AsyncIOMotorDatabase] = None) -> List[str]:
+    """Explain every hot query; returns the ones whose winning plan scans a whole collection."""
+    database = database if database is not None else get_database()
+    problems = []
+    for name, query, sort in hot_queries():
+        try:
+            await assert_indexed(database[name], query, sort)
+        except AssertionError as e:
+            problems.append(str(e))
+        except OperationFailure as e:
+            problems.append(f"Could not explain {query} on {name}: {e}")
+    return problems
+
+
+def _stages(plan: Dict[str, Any]):
+    yield plan.get("stage")
+    for child in ("inputStage", "queryPlan"):
+        if child in plan:
+            yield from _stages(plan[child])
+    for sub in plan.get("inputStages", []):
+        yield from _stages(sub)
+
+
+async def assert_indexed(collection: AsyncIOMotorCollection, query: Dict[str, Any], sort=None):
+    """
+    Fail if the winning plan for `query` scans the whole collection.
+
+    Meant for tests that pin hot-path queries to an index, e.g.
+    ``await assert_indexed(get_posts_collection(), {"post_id": "1_2"})``;
+    check_hot_queries runs it over `hot_queries()`.
+    """
+    cursor = collection.find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    plan = await cursor.explain()
+    winning = plan.get("queryPlanner", {}).get("winningPlan", {})
+    if "COLLSCAN" in set(_stages(winning)):
+        raise AssertionError(f"Unindexed query on {collection.name}: {query} (sort={sort})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply or check the declared Mongo indexes")
+    parser.add_argument("--check", action="store_true", help="Only report drift, do not create indexes")
+    parser.add_argument("--explain", action="store_true", help="Check that the hot queries use an index")
+    args = parser.parse_args()
+
+    configure_logging()
+    if args.explain:
+        problems = asyncio.run(check_hot_queries())
+        for problem in problems:
+            print(problem)
+        raise SystemExit(1 if problems else 0)
+    if args.check:
+        drift = asyncio.run(detect_drift(get_database()))
+        for problem in drift:
+            print(problem)
+    else:
+        drift = asyncio.run(apply_indexes())
+    raise SystemExit(1 if drift else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,133 @@
 # db/session.py
 
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
+import threading
+from typing import Any, Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import ReadPreference, monitoring
 from core.config import settings
 
-client = AsyncIOMotorClient(settings.MONGO_URI)
-db = client[settings.MONGO_DB_NAME]
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool counters fed by pymongo's CMAP events (see /health/db)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.in_use = 0
+        self.checkouts_started = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+
+    def _bump(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current counters; `utilization` is None for an unbounded pool (MONGO_MAX_POOL_SIZE=0)."""
+        max_pool_size = settings.MONGO_MAX_POOL_SIZE
+        with self._lock:
+            return {
+                "open_connections": self.open,
+                "in_use": self.in_use,
+                "waiting": self.checkouts_started - self.checkouts - self.checkout_failures,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "max_pool_size": max_pool_size,
+                "utilization": round(self.in_use / max_pool_size, 3) if max_pool_size else None,
+            }
+
+    def connection_created(self, event):
+        self._bump(open=1)
+
+    def connection_closed(self, event):
+        self._bump(open=-1)
+
+    def connection_check_out_started(self, event):
+        self._bump(checkouts_started=1)
+
+    def connection_checked_out(self, event):
+        self._bump(checkouts=1, in_use=1)
+
+    def connection_check_out_failed(self, event):
+        self._bump(checkout_failures=1)
+
+    def connection_checked_in(self, event):
+        self._bump(in_use=-1)
+
+    # Unused CMAP events
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+
+
+class MongoManager:
+    """
+    Owns the process' single Motor client.
+
+    The app opens it in its lifespan and closes it on shutdown; scripts and
+    anything touched before startup get it lazily on first use, with the
+    same pool configuration.
+    """
+
+    def __init__(self):
+        self._client: Optional[AsyncIOMotorClient] = None
+        self.metrics = MongoPoolMetrics()
+
+    def connect(self) -> AsyncIOMotorClient:
+        if self._client is None:
+            self._client = AsyncIOMotorClient(
+                settings.MONGO_URI,
+                maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+                minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+                maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+                connectTimeoutMS=settings.MONGO_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                socketTimeoutMS=settings.MONGO_SOCKET_TIMEOUT_MS,
+                waitQueueTimeoutMS=settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                event_listeners=[self.metrics],
+            )
+        return self._client
+
+    async def ping(self):
+        await self.connect().admin.command("ping")
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    @property
+    def db(self) -> AsyncIOMotorDatabase:
+        return self.connect()[settings.MONGO_DB_NAME]
+
+
+mongo = MongoManager()
+
+
+def get_database() -> AsyncIOMotorDatabase:
+    return mongo.db
+
 
 def get_db() -> AsyncIOMotorCollection:
-    return db["facebook_insights"]  # ✔ Must be a collection, not the whole DB
+    return get_database()["facebook_insights"]  # ✔ Must be a collection, not the whole DB
+
+
+def get_analytics_collection(name: str) -> AsyncIOMotorCollection:
+    """Collection handle for dashboard reads, routed to secondaries when available."""
+    return get_database().get_collection(name, read_preference=ReadPreference.SECONDARY_PREFERRED)
+
+
+def get_analytics_db() -> AsyncIOMotorCollection:
+    return get_analytics_collection("facebook_insights")
+
+
+def get_webhook_log() -> AsyncIOMotorCollection:
+    return get_database()[settings.WEBHOOK_LOG_COLLECTION]
 
 
+def get_posts_collection() -> AsyncIOMotorCollection:
+    return get_database()[settings.POSTS_COLLECTION]
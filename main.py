@@ -1,21 +1,40 @@
-import asyncio
 import logging
 import os
 import json # [ADDED]
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
 from core.config import settings
 
 # --- Import all necessary routers ---
-from api.endpoints.facebook.auth import router as auth_router, clean_expired_tokens
+from api.endpoints.facebook.auth import router as auth_router
 from api.endpoints.facebook.posts import router as posts_router
 from api.endpoints.facebook.status import router as status_router
 from api.endpoints.facebook.insights import router as insights_router
 from api.endpoints.facebook.webhooks import router as webhooks_router
 from api.endpoints.bot import router as bot_router
 from api.endpoints.agent_website import router as website_router
+from api.endpoints.listing_photos import router as listing_photos_router
+from services.facebook_webhook_handler import WebhookHandler
+from services.webhook_event_log import WebhookEventConsumer, get_webhook_event_log
+from services.engagement_refresher import EngagementRefresher
+from services.webhook_dedup import get_webhook_deduplicator
+from services.expiring_store import get_oauth_state_store
+from services.agent_benchmarks import get_benchmark_engine
+from services.job_scheduler import JobScheduler, ScheduledJob
+from tasks.facebook_sync import FacebookSync
+from db.indexes import apply_indexes, check_hot_queries
+from db.session import mongo
+from services.image_pipeline import get_image_pipeline
+from services.image_store import ImageStaticFiles, get_image_store
+from services.image_encoder import get_image_encoder
+from services.image_compositor import get_brand_compositor
+from api.endpoints.facebook.insights import get_insights_cache
+from api.endpoints.facebook.status import get_status_cache
+from services.disk_gc import DiskGarbageCollector
+from services.insights_store import backfill_legacy_insights
+from db.bulk_writer import flush_all as flush_bulk_writes
 
 # Initialize logging 
 from logging_config import configure_logging
@@ -23,17 +42,125 @@ configure_logging()
 
 
 logger = logging.getLogger(__name__)
+
+# Process-wide singletons; several hold collection handles of the current
+# Mongo client, so they are rebuilt after it is closed
+SINGLETONS = (
+    get_webhook_event_log,
+    get_webhook_deduplicator,
+    get_oauth_state_store,
+    get_benchmark_engine,
+    get_image_store,
+    get_image_encoder,
+    get_brand_compositor,
+    get_image_pipeline,
+    get_insights_cache,
+    get_status_cache,
+)
+
 # --- Static Files Configuration ---
-IMAGES_DIR = "generated_images"
+IMAGES_DIR = settings.IMAGE_STORE_DIR
 if not os.path.exists(IMAGES_DIR):
     os.makedirs(IMAGES_DIR)
     logger.info(f"Created image directory: {IMAGES_DIR}")
 
+# --------------------
+# Startup & Shutdown
+# --------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("Application startup initiated.")
+    mongo.connect()
+    await mongo.ping()
+    await apply_indexes()
+    if settings.ENVIRONMENT == "development":
+        # Catch a new query shape or a dropped index before it reaches production
+        for problem in await check_hot_queries():
+            logger.warning(f"Query plan check: {problem}")
+    # Periodic jobs; exclusive ones run on one replica at a time under a Mongo lease
+    scheduler = JobScheduler(
+        mongo.db,
+        lease_seconds=settings.JOB_LEASE_SECONDS,
+        poll_interval=settings.JOB_POLL_INTERVAL,
+    )
+    scheduler.register(ScheduledJob(
+        "refresh_facebook_tokens",
+        lambda: FacebookSync().refresh_all_tokens(),
+        interval=settings.TOKEN_REFRESH_INTERVAL_SECONDS,
+        jitter=60,
+    ))
+    scheduler.register(ScheduledJob(
+        "engagement_sync",
+        lambda: FacebookSync().sync_engagements(),
+        interval=settings.ENGAGEMENT_SYNC_INTERVAL_SECONDS,
+        jitter=30,
+    ))
+    # Copies the pre-rollup insights rows once; later runs return immediately
+    scheduler.register(ScheduledJob(
+        "insights_legacy_backfill",
+        backfill_legacy_insights,
+        interval=settings.INSIGHTS_BACKFILL_INTERVAL_SECONDS,
+    ))
+    # Files live on each instance's own disk, so every instance collects its own
+    disk_gc = DiskGarbageCollector(
+        mongo.db,
+        [settings.IMAGE_STORE_DIR, settings.IMAGE_STAGING_DIR, settings.AGENT_SITES_DIR],
+        batch_size=settings.DISK_GC_BATCH_SIZE,
+        min_age=settings.DISK_GC_MIN_AGE_SECONDS,
+        agent_quota=settings.DISK_GC_AGENT_QUOTA_BYTES,
+        global_quota=settings.DISK_GC_GLOBAL_QUOTA_BYTES,
+    )
+    scheduler.register(ScheduledJob(
+        "disk_gc", disk_gc.run, interval=settings.DISK_GC_INTERVAL_SECONDS, jitter=10, exclusive=False
+    ))
+    if settings.JOB_SCHEDULER_ENABLED:
+        scheduler.start()
+
+    # Background workers draining the durable webhook event log. Duplicate
+    # changes are dropped by the deduplicator and comment-driven engagement
+    # refreshes are debounced per post by the refresher.
+    webhook_handler = WebhookHandler(dedup=get_webhook_deduplicator())
+    engagement_refresher = EngagementRefresher(
+        webhook_handler.refresh_engagement,
+        window=settings.ENGAGEMENT_REFRESH_WINDOW_SECONDS,
+        tick=settings.ENGAGEMENT_REFRESH_TICK_SECONDS,
+        concurrency=settings.ENGAGEMENT_REFRESH_CONCURRENCY,
+    )
+    webhook_handler.refresher = engagement_refresher
+    webhook_consumer = WebhookEventConsumer(
+        get_webhook_event_log(),
+        webhook_handler,
+        batch_size=settings.WEBHOOK_CONSUMER_BATCH_SIZE,
+        poll_interval=settings.WEBHOOK_CONSUMER_POLL_INTERVAL,
+        settle_seconds=settings.WEBHOOK_CONSUMER_SETTLE_SECONDS,
+        lease_seconds=settings.WEBHOOK_CONSUMER_LEASE_SECONDS,
+        max_attempts=settings.WEBHOOK_CONSUMER_MAX_ATTEMPTS,
+    )
+    if settings.WEBHOOK_CONSUMERS_ENABLED:
+        engagement_refresher.start()
+        webhook_consumer.start()
+    logger.info("Application startup complete.")
+
+    yield
+
+    logger.info("Application shutdown initiated.")
+    await scheduler.stop()
+    await webhook_consumer.stop()
+    # Flush debounced refreshes so no trailing update is lost
+    await engagement_refresher.stop()
+    await flush_bulk_writes()
+    get_image_pipeline().close()
+    mongo.close()
+    for singleton in SINGLETONS:
+        singleton.cache_clear()
+    logger.info("Application shutdown complete.")
+
 # Create FastAPI app
 app = FastAPI(
     title="Agentic AI Properties",
     description="Platform for real estate agent branding and content publishing",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # -------------------
@@ -74,24 +201,10 @@ app.add_middleware(
 
 # --- Mount Static Files ---
 # This allows you to access images via http://localhost:8000/generated_images/image.png
-app.mount("/generated_images", StaticFiles(directory=IMAGES_DIR), name="static_images")
+# Content-addressed blobs/variants are served with immutable cache headers
+app.mount("/generated_images", ImageStaticFiles(directory=IMAGES_DIR), name="static_images")
 
 
-# --------------------
-# Startup & Shutdown
-# --------------------
-@app.on_event("startup")
-async def on_startup():
-    logger.info("Application startup initiated.")
-    # Start the background task for cleaning expired OAuth state tokens
-    asyncio.create_task(clean_expired_tokens())
-    logger.info("Application startup complete.")
-
-@app.on_event("shutdown")
-async def on_shutdown():
-    logger.info("Application shutdown initiated.")
-    logger.info("Application shutdown complete.")
-
 # -------------
 # Health Check
 # -------------
@@ -99,6 +212,11 @@ async def on_shutdown():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/health/db")
+async def db_health_check():
+    # Connection pool utilization, fed by pymongo pool events
+    return {"status": "healthy", "pool": mongo.metrics.snapshot()}
+
 # ---------------
 # Include Routers
 # ---------------
@@ -110,6 +228,7 @@ app.include_router(insights_router, prefix="/api/facebook/insights", tags=["Face
 app.include_router(webhooks_router, prefix="/api/facebook/webhooks", tags=["Facebook Webhooks"])
 app.include_router(bot_router, prefix="/api/bot", tags=["AI Bot"])
 app.include_router(website_router, prefix="/api/agents", tags=["Agent Websites"])
+app.include_router(listing_photos_router, prefix="/api/agents", tags=["Listing Photos"])
 
 from api.endpoints.facebook import status as facebook_status_router
 
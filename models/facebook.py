@@ -13,6 +13,7 @@ class PostStatus(str, Enum):
     PUBLISHED = "published"
     FAILED    = "failed"
     DELETED   = "deleted"
+    HIDDEN    = "hidden"
 
 
 class TokenStatus(str, Enum):
@@ -9,6 +9,7 @@ class PostStatus(str, Enum):
     PUBLISHED = "published"
     FAILED = "failed"
     DELETED = "deleted"
+    HIDDEN = "hidden"
 
 class PropertyDetails(BaseModel):
     title: str = Field(..., max_length=100)
@@ -1,17 +1,12 @@
 from fastapi import APIRouter, Request
-from pymongo import MongoClient
 import logging
 from datetime import datetime
+from db.session import get_database
 
 # Logger setup
 logger = logging.getLogger("facebook_auth")
 logger.setLevel(logging.INFO)
 
-# MongoDB setup
-mongo_client = MongoClient("mongodb://localhost:27017")
-db = mongo_client["property_agents"]
-tokens_collection = db["facebook_tokens"]
-
 router = APIRouter()
 
 @router.get("/facebook/auth/login")
@@ -37,7 +32,7 @@ async def handle_oauth_callback(request: Request):
     }
 
     try:
-        tokens_collection.update_one(
+        await get_database()["facebook_tokens"].update_one(
             { "agent_id": agent_id },
             { "$set": record },
             upsert=True
@@ -0,0 +1,203 @@
+# services/agent_benchmarks.py
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import settings
+from db.session import get_analytics_collection
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_METRICS = ("likes", "comments", "shares", "impressions")
+COHORT_PERCENTILES = (25, 50, 75, 90)
+
+
+class AgentMetricsFrame:
+    """
+    Daily metrics of every agent over one period, held as a dense
+    (agents × days × metrics) float array. Days without a rollup are NaN.
+    """
+
+    def __init__(self, agents: List[str], days: List[datetime], values: np.ndarray):
+        self.agents = agents
+        self.days = days
+        self.values = values
+        self.index = {agent_id: i for i, agent_id in enumerate(agents)}
+
+    @classmethod
+    def from_rollups(cls, rollups: List[Dict[str, Any]], start: datetime, days: int) -> "AgentMetricsFrame":
+        agents = sorted({r["agent_id"] for r in rollups})
+        row = {agent_id: i for i, agent_id in enumerate(agents)}
+        values = np.full((len(agents), days, len(BENCHMARK_METRICS)), np.nan)
+
+        if rollups:
+            rows = np.fromiter((row[r["agent_id"]] for r in rollups), dtype=np.intp, count=len(rollups))
+            cols = np.fromiter(((r["bucket"] - start).days for r in rollups), dtype=np.intp, count=len(rollups))
+            metrics = np.array(
+                [[r.get(m) or 0 for m in BENCHMARK_METRICS] for r in rollups], dtype=float
+            )
+            values[rows, cols] = metrics
+
+        return cls(agents, [start + timedelta(days=d) for d in range(days)], values)
+
+
+def moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean along the day axis, ignoring missing days."""
+    present = ~np.isnan(values)
+    sums = np.cumsum(np.where(present, values, 0.0), axis=1)
+    counts = np.cumsum(present, axis=1)
+    sums[:, window:] -= sums[:, :-window]
+    counts[:, window:] -= counts[:, :-window]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def percentile_ranks(totals: np.ndarray) -> np.ndarray:
+    """
+    Per-column percentile rank (0–100) of each row within its cohort.
+
+    Tied totals share the average of the ranks they span, so agents with
+    the same total always get the same percentile.
+    """
+    if totals.shape[0] < 2:
+        return np.full(totals.shape, 100.0)
+    ordered = np.sort(totals, axis=0)
+    ranks = np.empty(totals.shape, dtype=float)
+    for m in range(totals.shape[1]):
+        first = np.searchsorted(ordered[:, m], totals[:, m], side="left")
+        last = np.searchsorted(ordered[:, m], totals[:, m], side="right") - 1
+        ranks[:, m] = (first + last) / 2.0
+    return ranks * 100.0 / (totals.shape[0] - 1)
+
+
+class BenchmarkEngine:
+    """
+    Cross-agent engagement benchmarks.
+
+    One aggregation loads every agent's daily rollups for the period (each
+    holds that day's activity, see InsightsStore); the cohort percentiles,
+    moving averages and week-over-week deltas are then computed for all
+    agents at once and cached per period, so per-agent requests are
+    dictionary lookups.
+    """
+
+    def __init__(self, ttl_seconds: float, window: int = 7):
+        self.daily = get_analytics_collection(settings.INSIGHTS_DAILY_COLLECTION)
+        self.ttl_seconds = ttl_seconds
+        self.window = window
+        self._cache: Dict[Tuple[datetime, int], Tuple[float, Dict[str, Any]]] = {}
+        self._locks: Dict[Tuple[datetime, int], asyncio.Lock] = {}
+
+    async def get_period(self, end: datetime, days: int) -> Dict[str, Any]:
+        end = datetime(end.year, end.month, end.day) + timedelta(days=1)
+        key = (end, days)
+        cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[0] < self.ttl_seconds:
+            return cached[1]
+
+        # Concurrent requests for the same period share one computation
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            cached = self._cache.get(key)
+            if cached and time.monotonic() - cached[0] < self.ttl_seconds:
+                return cached[1]
+            frame = await self._load(end - timedelta(days=days), days)
+            period = await asyncio.to_thread(self._compute, frame)
+            self._evict_expired()
+            self._cache[key] = (time.monotonic(), period)
+            return period
+
+    async def get_agent(self, agent_id: str, end: datetime, days: int) -> Optional[Dict[str, Any]]:
+        period = await self.get_period(end, days)
+        agent = period["agents"].get(agent_id)
+        if agent is None:
+            return None
+        return {
+            "start": period["start"],
+            "end": period["end"],
+            "cohort_size": period["cohort_size"],
+            "cohort": period["cohort"],
+            **agent,
+        }
+
+    async def _load(self, start: datetime, days: int) -> AgentMetricsFrame:
+        cursor = self.daily.find(
+            {"bucket": {"$gte": start, "$lt": start + timedelta(days=days)}},
+            {"_id": 0, "agent_id": 1, "bucket": 1, **{m: 1 for m in BENCHMARK_METRICS}}
+        )
+        rollups = await cursor.to_list(length=None)
+        logger.info(f"Loaded {len(rollups)} daily rollups for benchmarking from {start:%Y-%m-%d}")
+        return AgentMetricsFrame.from_rollups(rollups, start, days)
+
+    def _compute(self, frame: AgentMetricsFrame) -> Dict[str, Any]:
+        values = frame.values
+        days = len(frame.days)
+        period = {
+            "start": frame.days[0].strftime("%Y-%m-%d") if frame.days else None,
+            "end": frame.days[-1].strftime("%Y-%m-%d") if frame.days else None,
+            "cohort_size": len(frame.agents),
+            "cohort": {},
+            "agents": {},
+        }
+        if not frame.agents:
+            return period
+
+        totals = np.nansum(values, axis=1)  # (agents, metrics)
+        ranks = percentile_ranks(totals)
+        cohort = np.percentile(totals, COHORT_PERCENTILES, axis=0)  # (percentiles, metrics)
+        averages = moving_average(values, self.window)
+
+        this_week = np.nansum(values[:, -7:], axis=1)
+        last_week = np.nansum(values[:, -14:-7], axis=1) if days >= 14 else np.full(totals.shape, np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            wow_pct = np.where(last_week > 0, (this_week - last_week) * 100.0 / last_week, np.nan)
+
+        period["cohort"] = {
+            metric: {f"p{p}": float(cohort[i, m]) for i, p in enumerate(COHORT_PERCENTILES)}
+            for m, metric in enumerate(BENCHMARK_METRICS)
+        }
+        dates = [day.strftime("%Y-%m-%d") for day in frame.days]
+        for a, agent_id in enumerate(frame.agents):
+            period["agents"][agent_id] = {
+                "agent_id": agent_id,
+                "totals": _metric_dict(totals[a]),
+                "percentile": _metric_dict(ranks[a]),
+                "week_over_week": {
+                    metric: {
+                        "current": _clean(this_week[a, m]),
+                        "previous": _clean(last_week[a, m]),
+                        "change_pct": _clean(wow_pct[a, m]),
+                    }
+                    for m, metric in enumerate(BENCHMARK_METRICS)
+                },
+                "moving_average": [
+                    {"date": date, **_metric_dict(averages[a, d])} for d, date in enumerate(dates)
+                ],
+            }
+        return period
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for key in [k for k, (at, _) in self._cache.items() if now - at >= self.ttl_seconds]:
+            del self._cache[key]
+            self._locks.pop(key, None)
+
+
+def _clean(value) -> Optional[float]:
+    value = float(value)
+    return None if np.isnan(value) else round(value, 2)
+
+
+def _metric_dict(row: np.ndarray) -> Dict[str, Optional[float]]:
+    return {metric: _clean(row[m]) for m, metric in enumerate(BENCHMARK_METRICS)}
+
+
+@lru_cache(maxsize=None)
+def get_benchmark_engine() -> BenchmarkEngine:
+    return BenchmarkEngine(settings.BENCHMARK_CACHE_TTL_SECONDS, settings.BENCHMARK_MOVING_AVERAGE_DAYS)
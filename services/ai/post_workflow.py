@@ -1,8 +1,5 @@
-import os
-import shutil
 import logging
 from typing import TypedDict, List, Optional
-from PIL import Image, ImageDraw, ImageFont
 import asyncio
 
 from langgraph.graph import StateGraph, END
@@ -11,6 +8,7 @@ from langchain_core.output_parsers import StrOutputParser
 from langchain_groq import ChatGroq
 
 from services.social_media.facebook_manager import create_facebook_post
+from services.image_compositor import ListingCard, get_brand_compositor, load_brand_style
 from core.config import settings
 
 logger = logging.getLogger(__name__)
@@ -34,6 +32,8 @@ class BrandingPostState(TypedDict):
     selected_brand: Optional[str]   # NEW: To store the user's chosen brand
     visual_prompts: Optional[str]
     image_path: Optional[str]
+    image_paths: Optional[List[str]]  # one branded image per listing photo
+    listing_photos: Optional[List[str]]  # local paths of the listing's uploaded photos, if any
     location: Optional[str]
     price: Optional[str]
     bedrooms: Optional[str]
@@ -83,37 +83,21 @@ def create_visuals_node(state: BrandingPostState) -> dict:
     logger.info(f"Generated visual prompts: {out[:100]}...")
     return {"visual_prompts": out.strip()}
 
-# Node: simulate image generation (consider replacing with actual Stability AI call if available)
-def generate_image_node(state: BrandingPostState) -> dict:
-    image_dir = "generated_images"
-    os.makedirs(image_dir, exist_ok=True)
-    placeholder = "placeholder.png"
-
-    # Create placeholder image if it doesn't exist
-    if not os.path.exists(placeholder):
-        img = Image.new("RGB", (1024, 1024), (200, 200, 200))
-        d = ImageDraw.Draw(img)
-        try:
-            # Use a robust font loading strategy or ensure font exists
-            font_path = "arial.ttf" # Assuming arial.ttf is in the same directory or accessible
-            if not os.path.exists(font_path):
-                 # Fallback to default if arial.ttf is not found
-                font = ImageFont.load_default()
-                logger.warning(f"Font '{font_path}' not found, using default font.")
-            else:
-                font = ImageFont.truetype(font_path, 40)
-
-        except Exception as e:
-            font = ImageFont.load_default()
-            logger.error(f"Error loading font, using default: {e}", exc_info=True)
-        d.text((10, 10), "Placeholder Image", fill=(0, 0, 0), font=font)
-        img.save(placeholder)
-        logger.info(f"Created new placeholder image at {placeholder}")
-
-    out_path = os.path.join(image_dir, f"{state.get('client_id', 'unknown_agent')}_img.png")
-    shutil.copy(placeholder, out_path)
-    logger.info(f"Generated placeholder image at {out_path}")
-    return {"image_path": out_path}
+# Node: brand the listing photos (or a plain brand card when there are none)
+async def generate_image_node(state: BrandingPostState) -> dict:
+    style = await load_brand_style(state.get("client_id"), state.get("selected_brand"))
+    photos = state.get("listing_photos") or [None]
+    cards = [ListingCard(photo, state.get("price"), state.get("location")) for photo in photos]
+
+    # Stored by content hash: identical images share one file, and a later
+    # run never overwrites an image an earlier post still points at. The
+    # branding session holds a reference to each until it ends (api/endpoints/bot.py)
+    blobs = [blob for blob in await get_brand_compositor().render(style, cards, state.get("client_id")) if blob]
+    if not blobs:
+        logger.error(f"No branded image could be rendered for '{style.name}'")
+        return {"image_path": None, "image_paths": []}
+    logger.info(f"Generated {len(blobs)} branded image(s), first at {blobs[0].path}")
+    return {"image_path": blobs[0].path, "image_paths": [blob.path for blob in blobs]}
 
 # Node: check for required property info
 def check_requirements_node(state: BrandingPostState) -> dict:
@@ -158,7 +142,7 @@ def generate_post_node(state: BrandingPostState) -> dict:
 # Node: post to Facebook via your manager
 async def post_to_facebook_node(state: BrandingPostState) -> dict:
     caption = state.get("base_post")
-    image_path = state.get("image_path")
+    image_paths = state.get("image_paths") or ([state["image_path"]] if state.get("image_path") else [])
     agent_id = state.get("client_id")
     db_session = state.get("db") # Access db from the state if passed
 
@@ -170,7 +154,7 @@ async def post_to_facebook_node(state: BrandingPostState) -> dict:
         fb_resp = await create_facebook_post(
             agent_id=agent_id,
             caption=caption,
-            images=[image_path] if image_path else [],
+            images=image_paths,
             db=db_session # Pass the db session here
         )
         logger.info(f"Posted to Facebook, got: {fb_resp}")
@@ -0,0 +1,321 @@
+# services/disk_gc.py
+
+import asyncio
+import logging
+import os
+import re
+import shutil
+import socket
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from core.config import settings
+from db.session import get_db, get_posts_collection
+from models.facebook import PostStatus
+from services.image_store import blob_sha256
+
+logger = logging.getLogger(__name__)
+
+
+
+def reference_pattern(store_dir: str) -> "re.Pattern[str]":
+    """
+    Matches a stored path or URL of a file in the image store, capturing
+    its path relative to the store: `<store_dir>/...` (paths built by the
+    image store) or `generated_images/...` (the URL it is served under).
+    """
+    prefixes = {re.escape(os.path.normpath(store_dir).replace(os.sep, "/").strip("/")), "generated_images"}
+    return re.compile(rf"(?:{'|'.join(sorted(prefixes))})/(?P<path>[^\s\"'?#]+)")
+
+
+_REFERENCE = reference_pattern(settings.IMAGE_STORE_DIR)
+# Half-written files left by interrupted uploads, compositions and renders
+_TEMPORARY = re.compile(r"(^\.(upload|compose)-|\.tmp-\d+$)")
+TEMPORARY_MAX_AGE = 3600
+
+
+class DiskFile(NamedTuple):
+    root: str
+    path: str
+    size: int
+    mtime: float
+    agent_id: Optional[str]
+
+
+class DiskGarbageCollector:
+    """
+    Reclaims space in generated_images/, image_staging/ and agent_sites/.
+
+    Files are visited incrementally: each `run` handles at most
+    `batch_size` entries and resumes where the previous one stopped, so no
+    run walks the whole tree. A full pass over both trees is a sweep.
+
+    A file is kept while something references it:
+      - the `images` of a post that is not deleted (posts collection and
+        legacy agent documents),
+      - an agent's website record or a branding session,
+      - a content-addressed blob with references (image_blobs),
+      - an agent_sites/<agent_id>/ directory of an agent that still exists.
+    Blobs are charged to the first agent that stored them.
+    Upload encodings (encoded/) are a cache, but their paths are also
+    returned to callers (PropertyImageProcessor.create_resized_copies), so
+    they are kept while referenced like any other file; their .json
+    records are never referenced and age out, which only costs a re-encode.
+    variants/ is left
+    to the image store's own LRU budget. Nothing in the staging directory
+    is referenced, so stale staged files age out too.
+
+    Unreferenced files older than `min_age` are deleted as they are met.
+    At the end of a sweep, agents over `agent_quota` and then the whole
+    store over `global_quota` lose their oldest unreferenced files, however
+    young, except those created since the sweep started. References are
+    read again before any run or sweep end deletes files, and a blob is only deleted together with
+    its image_blobs record while it has no references. Each sweep's totals
+    are written to `disk_gc_reports`.
+    """
+
+    def __init__(
+        self,
+        database: AsyncIOMotorDatabase,
+        roots: List[str],
+        batch_size: int,
+        min_age: float,
+        agent_quota: int,
+        global_quota: int
+    ):
+        self.reports = database[settings.DISK_GC_REPORTS_COLLECTION]
+        self.blobs = database[settings.IMAGE_BLOBS_COLLECTION]
+        self.roots = roots
+        self.batch_size = batch_size
+        self.min_age = min_age
+        self.agent_quota = agent_quota
+        self.global_quota = global_quota
+        self._walker: Optional[Iterator[DiskFile]] = None
+        self._reset()
+
+    def _reset(self):
+        self._sweep_started = time.time()
+        self._references: Optional[Set[str]] = None
+        self._live_blobs: Set[str] = set()
+        self._blob_owners: Dict[str, str] = {}
+        self._live_agents: Set[str] = set()
+        self._usage: Dict[Optional[str], int] = defaultdict(int)
+        self._candidates: List[DiskFile] = []  # unreferenced, too young to delete by age
+        self._stats = {"scanned": 0, "deleted": 0, "reclaimed_bytes": 0}
+
+    async def run(self) -> Dict[str, Any]:
+        """Process the next batch of files; finishes the sweep (quotas, report) when the walk is done."""
+        if self._references is None:
+            await self._load_references()
+        if self._walker is None:
+            self._walker = self._walk()
+
+        batch = await asyncio.to_thread(self._next_batch)
+        now = time.time()
+        expired = [
+            entry for entry in batch
+            if not self._is_temporary(entry) and now - entry.mtime > self.min_age and not self._is_referenced(entry)
+        ]
+        if expired:
+            # References were read when the sweep started, possibly many runs
+            # ago; read them again so nothing referenced since is deleted
+            await self._load_references()
+
+        for entry in batch:
+            self._stats["scanned"] += 1
+            if self._is_temporary(entry):
+                if now - entry.mtime > TEMPORARY_MAX_AGE:
+                    await self._delete(entry)
+                continue
+            referenced = self._is_referenced(entry)
+            if not referenced and now - entry.mtime > self.min_age and await self._delete(entry):
+                continue
+            self._usage[entry.agent_id] += entry.size
+            self._usage["*"] += entry.size
+            if not referenced:
+                self._candidates.append(entry)
+
+        if len(batch) < self.batch_size:
+            return await self._finish_sweep()
+        return dict(self._stats, sweep_complete=False)
+
+    def _next_batch(self) -> List[DiskFile]:
+        batch = []
+        for entry in self._walker:
+            batch.append(entry)
+            if len(batch) >= self.batch_size:
+                break
+        return batch
+
+    def _walk(self) -> Iterator[DiskFile]:
+        for root in self.roots:
+            if not os.path.isdir(root):
+                continue
+            pending = [root]
+            while pending:
+                directory = pending.pop()
+                try:
+                    entries = list(os.scandir(directory))
+                except FileNotFoundError:
+                    continue
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        relative = os.path.relpath(entry.path, root)
+                        if relative != "variants":
+                            pending.append(entry.path)
+                        continue
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+                    yield DiskFile(root, entry.path, stat.st_size, stat.st_mtime, self._owner(root, entry.path))
+
+    @staticmethod
+    def _is_sites_root(root: str) -> bool:
+        return os.path.abspath(root) == os.path.abspath(settings.AGENT_SITES_DIR)
+
+    def _owner(self, root: str, path: str) -> Optional[str]:
+        """Agent a file is charged to: agent_sites/<agent>/..., a blob's first agent, or legacy `<agent>_...` names."""
+        parts = os.path.relpath(path, root).split(os.sep)
+        if self._is_sites_root(root):
+            return parts[0] if len(parts) > 1 else None
+        if parts[0] == "blobs":
+            return self._blob_owners.get(blob_sha256(path))
+        if len(parts) == 1 and "_" in parts[0]:
+            return parts[0].split("_", 1)[0]
+        return None
+
+    @staticmethod
+    def _is_temporary(entry: DiskFile) -> bool:
+        return bool(_TEMPORARY.search(os.path.basename(entry.path)))
+
+    def _is_referenced(self, entry: DiskFile) -> bool:
+        if self._is_sites_root(entry.root):
+            return entry.agent_id is not None and entry.agent_id in self._live_agents
+        relative = os.path.relpath(entry.path, entry.root).replace(os.sep, "/")
+        if relative.startswith("blobs/") and blob_sha256(entry.path) in self._live_blobs:
+            return True
+        return relative in self._references
+
+    async def _delete(self, entry: DiskFile) -> bool:
+        """Remove a file; False if it is gone already or is a blob that was referenced in the meantime."""
+        sha256 = blob_sha256(entry.path) if self._is_blob(entry) else None
+        if sha256:
+            # Dropping the record first means a concurrent put() re-verifies
+            # and restores the file rather than pointing at a deleted one
+            deleted = await self.blobs.delete_one({"_id": sha256, "refs": {"$not": {"$gt": 0}}})
+            if not deleted.deleted_count and await self.blobs.count_documents({"_id": sha256}, limit=1):
+                return False
+        try:
+            os.unlink(entry.path)
+        except FileNotFoundError:
+            return False
+        if sha256:
+            await asyncio.to_thread(shutil.rmtree, os.path.join(entry.root, "variants", sha256[:2], sha256), True)
+        self._stats["deleted"] += 1
+        self._stats["reclaimed_bytes"] += entry.size
+        logger.debug(f"GC removed {entry.path} ({entry.size} bytes)")
+        return True
+
+    @staticmethod
+    def _is_blob(entry: DiskFile) -> bool:
+        return os.path.relpath(entry.path, entry.root).split(os.sep)[0] == "blobs"
+
+    async def _load_references(self):
+        """Everything that may point at a file, read once per sweep."""
+        references: Set[str] = set()
+
+        def collect(value):
+            if isinstance(value, str):
+                match = _REFERENCE.search(value)
+                if match:
+                    references.add(match["path"])
+            elif isinstance(value, (list, tuple)):
+                for item in value:
+                    collect(item)
+            elif isinstance(value, dict):
+                for item in value.values():
+                    collect(item)
+
+        agents = get_db()
+        async for post in get_posts_collection().find(
+            {"images.0": {"$exists": True}, "status": {"$ne": PostStatus.DELETED.value}}, {"_id": 0, "images": 1}
+        ):
+            collect(post.get("images"))
+        async for doc in agents.find(
+            {"facebook.posts.images.0": {"$exists": True}}, {"_id": 0, "facebook.posts.images": 1}
+        ):
+            collect(doc.get("facebook", {}).get("posts"))
+        async for session in agents.find(
+            {"session_id": {"$exists": True}}, {"_id": 0, "image_path": 1, "images": 1}
+        ):
+            collect(session)
+
+        live_agents: Set[str] = set()
+        async for site in agents.agent_websites.find({}, {"_id": 0}):
+            collect(site)
+            live_agents.add(str(site.get("agent_id")))
+        live_agents.update(str(agent_id) for agent_id in await agents.distinct("_id"))
+        live_agents.update(str(agent_id) for agent_id in await get_posts_collection().distinct("agent_id"))
+
+        self._references = references
+        self._live_agents = live_agents
+        self._live_blobs = set(await self.blobs.distinct("_id", {"refs": {"$gt": 0}}))
+        self._blob_owners = {
+            doc["_id"]: doc["agents"][0]
+            async for doc in self.blobs.find({"agents.0": {"$exists": True}}, {"agents": {"$slice": 1}})
+        }
+
+    async def _finish_sweep(self) -> Dict[str, Any]:
+        over_agent_quota = [a for a, used in self._usage.items() if a not in (None, "*") and used > self.agent_quota]
+        if over_agent_quota or self._usage["*"] > self.global_quota:
+            # Candidates were judged against references read when the sweep
+            # started; anything referenced since then must survive eviction
+            await self._load_references()
+        over_quota = sorted(self._candidates, key=lambda entry: entry.mtime)
+        for agent_id in over_agent_quota:
+            for entry in over_quota:
+                if self._usage[agent_id] <= self.agent_quota:
+                    break
+                if entry.agent_id == agent_id and await self._evict(entry):
+                    self._usage[agent_id] -= entry.size
+
+        for entry in over_quota:
+            if self._usage["*"] <= self.global_quota:
+                break
+            if await self._evict(entry) and entry.agent_id is not None:
+                self._usage[entry.agent_id] -= entry.size
+
+        report = dict(
+            self._stats,
+            sweep_complete=True,
+            host=socket.gethostname(),
+            started_at=datetime.utcfromtimestamp(self._sweep_started),
+            finished_at=datetime.utcnow(),
+            usage_bytes=self._usage["*"],
+        )
+        logger.info(
+            f"Disk GC sweep: scanned {report['scanned']} files, removed {report['deleted']}, "
+            f"reclaimed {report['reclaimed_bytes'] / 1024 / 1024:.1f}MB, {report['usage_bytes'] / 1024 / 1024:.1f}MB in use"
+        )
+        try:
+            await self.reports.insert_one(dict(report))
+        except Exception as e:
+            logger.error(f"Failed to store disk GC report: {e}", exc_info=True)
+
+        self._walker = None
+        self._reset()
+        return report
+
+    async def _evict(self, entry: DiskFile) -> bool:
+        # Files created during this sweep may be referenced by records it hasn't seen
+        if entry.mtime >= self._sweep_started or self._is_referenced(entry):
+            return False
+        if not await self._delete(entry):
+            return False
+        self._usage["*"] -= entry.size
+        return True
@@ -0,0 +1,129 @@
+# services/engagement_refresher.py
+
+import asyncio
+import logging
+import math
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel: O(1) insert and O(expired) advance.
+
+    Time is split into `tick`-second slots arranged in a ring. A key due
+    further away than one revolution carries a rounds counter that is
+    decremented each time the cursor passes its slot.
+    """
+
+    def __init__(self, tick: float, slots: int = 512):
+        self.tick = tick
+        self.slots: List[Dict[Hashable, int]] = [dict() for _ in range(slots)]
+        self.cursor = 0
+
+    def add(self, key: Hashable, delay: float):
+        ticks = max(1, math.ceil(delay / self.tick))
+        rounds, offset = divmod(ticks, len(self.slots))
+        if offset == 0:
+            rounds, offset = rounds - 1, len(self.slots)
+        slot = (self.cursor + offset) % len(self.slots)
+        self.slots[slot][key] = rounds
+
+    def advance(self) -> List[Hashable]:
+        """Move the cursor one tick forward and return the keys that came due."""
+        self.cursor = (self.cursor + 1) % len(self.slots)
+        slot = self.slots[self.cursor]
+        expired = [key for key, rounds in slot.items() if rounds == 0]
+        for key in expired:
+            del slot[key]
+        for key in slot:
+            slot[key] -= 1
+        return expired
+
+    def drain(self) -> List[Hashable]:
+        """Remove and return every pending key, regardless of due time."""
+        keys = [key for slot in self.slots for key in slot]
+        for slot in self.slots:
+            slot.clear()
+        return keys
+
+
+class EngagementRefresher:
+    """
+    Per-post trailing-edge debounce for engagement refreshes.
+
+    The first comment on a post schedules a refresh `window` seconds later;
+    further comments arriving before it fires are absorbed. Each post is
+    therefore refreshed at most once per window no matter how many comment
+    webhooks arrive, and always after the latest burst has been seen.
+
+    At most `concurrency` refreshes run at once. Refreshes that came due
+    run as tracked tasks, which `stop` waits for.
+    """
+
+    def __init__(
+        self,
+        refresh: Callable[[str], Awaitable[None]],
+        window: float = 60.0,
+        tick: float = 1.0,
+        concurrency: int = 8
+    ):
+        self.refresh = refresh
+        self.window = window
+        self.wheel = TimerWheel(tick, slots=max(8, math.ceil(window / tick) + 1))
+        self._pending: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+        self._slots = asyncio.Semaphore(concurrency)
+
+    def schedule(self, post_id: str):
+        if post_id in self._pending:
+            return
+        self._pending.add(post_id)
+        self.wheel.add(post_id, self.window)
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop ticking, flush every pending refresh immediately and wait for those in flight."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    async def flush(self):
+        due = self.wheel.drain()
+        if due:
+            logger.info(f"Flushing {len(due)} pending engagement refreshes")
+        await self._refresh_all(due)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            due = self.wheel.advance()
+            if due:
+                # Keep a reference: the loop only holds tasks weakly
+                task = asyncio.create_task(self._refresh_all(due))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+
+    async def _refresh_all(self, post_ids: List[str]):
+        for post_id in post_ids:
+            self._pending.discard(post_id)
+        await asyncio.gather(*(self._refresh_one(post_id) for post_id in post_ids))
+
+    async def _refresh_one(self, post_id: str):
+        async with self._slots:
+            try:
+                await self.refresh(post_id)
+            except Exception as e:
+                logger.error(f"Engagement refresh failed for {post_id}: {e}", exc_info=True)
@@ -0,0 +1,28 @@
+# services/engagement_schedule.py
+
+from datetime import datetime, timedelta
+from typing import Optional
+
+# (post age below, refresh interval): engagement settles as a post ages
+SYNC_TIERS = (
+    (timedelta(hours=24), timedelta(minutes=15)),
+    (timedelta(days=7),   timedelta(hours=1)),
+    (timedelta(days=90),  timedelta(days=1)),
+)
+# Posts of unknown age are synced at the slowest tier, never as if brand new
+UNKNOWN_AGE_INTERVAL = SYNC_TIERS[-1][1]
+
+
+def next_engagement_sync(created_at: Optional[datetime], now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    When a post's engagement should next be refreshed, or None once it is
+    past the last tier and no longer synced.
+    """
+    now = now or datetime.utcnow()
+    if created_at is None:
+        return now + UNKNOWN_AGE_INTERVAL
+    age = now - created_at
+    for max_age, interval in SYNC_TIERS:
+        if age < max_age:
+            return now + interval
+    return None
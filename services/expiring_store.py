@@ -0,0 +1,91 @@
+# services/expiring_store.py
+
+import heapq
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from core.config import settings
+from db.session import get_database
+
+
+class MemoryExpiringStore:
+    """
+    Process-local key/value store whose entries expire after a TTL.
+
+    Entries are (expires_at, value) tuples; a min-heap of expiry times lets
+    each operation drop what has expired in O(log n) per entry, instead of
+    periodically scanning everything. Heap items for keys that were popped
+    or overwritten are skipped when they surface.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[float, Any]] = {}
+        self._expiry: List[Tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self._purge()
+        expires_at = time.monotonic() + ttl
+        self._entries[key] = (expires_at, value)
+        heapq.heappush(self._expiry, (expires_at, key))
+
+    async def get(self, key: str) -> Optional[Any]:
+        self._purge()
+        entry = self._entries.get(key)
+        return entry[1] if entry else None
+
+    async def pop(self, key: str) -> Optional[Any]:
+        self._purge()
+        entry = self._entries.pop(key, None)
+        return entry[1] if entry else None
+
+    def _purge(self):
+        now = time.monotonic()
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiry)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == expires_at:
+                del self._entries[key]
+
+
+class MongoExpiringStore:
+    """
+    Expiring key/value store shared by all workers.
+
+    One small document per key ({_id, v, expires_at}); a TTL index on
+    `expires_at` deletes expired documents. The TTL monitor only runs about
+    once a minute, so reads also check the expiry themselves.
+    """
+
+    def __init__(self, collection: AsyncIOMotorCollection):
+        self.collection = collection
+
+    async def set(self, key: str, value: Any, ttl: float):
+        await self.collection.replace_one(
+            {"_id": key},
+            {"v": value, "expires_at": datetime.utcnow() + timedelta(seconds=ttl)},
+            upsert=True
+        )
+
+    async def get(self, key: str) -> Optional[Any]:
+        doc = await self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+        return doc["v"] if doc else None
+
+    async def pop(self, key: str) -> Optional[Any]:
+        # Atomic: a value can be popped by only one worker
+        doc = await self.collection.find_one_and_delete({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+        return doc["v"] if doc else None
+
+
+@lru_cache(maxsize=None)
+def get_oauth_state_store():
+    """OAuth CSRF state tokens; Mongo-backed so callbacks may land on any worker."""
+    if settings.OAUTH_STATE_BACKEND == "memory":
+        return MemoryExpiringStore()
+    return MongoExpiringStore(get_database()[settings.OAUTH_STATE_COLLECTION])
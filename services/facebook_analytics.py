@@ -1,77 +1,228 @@
 # services/facebook_analytics.py
 
 import logging
+import math
 import httpx
 from motor.motor_asyncio import AsyncIOMotorCollection
-from datetime import datetime
-from typing import List, Dict, Any
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+
+from core.config import settings
+from db.session import get_analytics_collection
 
 logger = logging.getLogger(__name__)
 
+CHART_METRICS = ("likes", "comments", "shares", "impressions")
+POST_INSIGHT_METRICS = "post_impressions,post_engaged_users,post_clicks,post_reactions_like_total"
+# Comments and shares are not insight metrics; they are read from the post itself
+POST_ENGAGEMENT_FIELDS = (
+    f"insights.metric({POST_INSIGHT_METRICS}),comments.limit(0).summary(total_count),shares"
+)
+
+# Candidate bucket sizes, finest first
+BUCKET_UNITS = (
+    ("hour",  timedelta(hours=1)),
+    ("day",   timedelta(days=1)),
+    ("week",  timedelta(weeks=1)),
+    ("month", timedelta(days=30.44)),
+)
+
+
+def insights_with_counts(post: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    A post's insights plus its comment and share counts, in the `/insights`
+    format (`post_comments`, `post_shares`) that engagement lists and
+    metrics_from_insights already use.
+    """
+    insights = list((post.get("insights") or {}).get("data", []))
+    comments = ((post.get("comments") or {}).get("summary") or {}).get("total_count")
+    shares = (post.get("shares") or {}).get("count", 0)
+    if comments is not None:
+        insights.append({"name": "post_comments", "period": "lifetime", "values": [{"value": comments}]})
+    insights.append({"name": "post_shares", "period": "lifetime", "values": [{"value": shares}]})
+    return insights
+
+
+def choose_bucket(start: datetime, end: datetime, max_points: int) -> str:
+    """Finest bucket unit that keeps the range within `max_points` buckets."""
+    span = end - start
+    for unit, size in BUCKET_UNITS:
+        if math.ceil(span / size) <= max_points:
+            return unit
+    return BUCKET_UNITS[-1][0]
+
 class FacebookAnalytics:
     def __init__(self, db: AsyncIOMotorCollection):
         self.db = db
+        # Precomputed per-agent daily and weekly buckets (services/insights_store.py)
+        self.daily = get_analytics_collection(settings.INSIGHTS_DAILY_COLLECTION)
+        self.weekly = get_analytics_collection(settings.INSIGHTS_WEEKLY_COLLECTION)
+        self.samples = get_analytics_collection(settings.INSIGHTS_TS_COLLECTION)
 
-    async def get_agent_analytics(self, agent_id: str, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+    async def get_agent_series(
+        self,
+        agent_id: str,
+        start: datetime,
+        end: datetime,
+        max_points: int
+    ) -> Tuple[str, List[Dict[str, Any]]]:
         """
-        Aggregate insights for an agent's posts over a date range.
+        Insights over an arbitrary range, downsampled server-side so the
+        response never exceeds `max_points` buckets.
+
+        Values are per-bucket activity (sums of sample deltas, see
+        InsightsStore), so coarse buckets are plain sums of finer ones.
+        Hourly buckets come from the raw samples, with the largest single
+        post's value as `<metric>_peak`. Week buckets are the weekly rollups
+        as stored; day and month buckets regroup the daily rollups. All
+        three carry the largest daily value as `<metric>_peak` (so spikes
+        stay visible). `start` is truncated to the bucket unit, so the first
+        bucket is always whole.
         """
-        pipeline = [
-            {
-                "$match": {
-                    "agent_id": agent_id,
-                    "date": { "$gte": start_date, "$lte": end_date }
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$date",
-                    "likes": { "$sum": "$likes" },
-                    "comments": { "$sum": "$comments" },
-                    "shares": { "$sum": "$shares" },
-                    "impressions": { "$sum": "$impressions" }
-                }
-            },
-            { "$sort": { "_id": 1 } }
-        ]
+        unit = choose_bucket(start, end, max_points)
+        if unit == "hour":
+            start = start.replace(minute=0, second=0, microsecond=0)
+            pipeline = [
+                {"$match": {"meta.agent_id": agent_id, "ts": {"$gte": start, "$lt": end}}},
+                {"$group": {
+                    "_id": {"post": "$meta.post_id", "bucket": {"$dateTrunc": {"date": "$ts", "unit": "hour"}}},
+                    **{m: {"$sum": {"$ifNull": [f"$delta.{m}", 0]}} for m in CHART_METRICS},
+                }},
+                {"$group": {
+                    "_id": "$_id.bucket",
+                    **{m: {"$sum": f"${m}"} for m in CHART_METRICS},
+                    **{f"{m}_peak": {"$max": f"${m}"} for m in CHART_METRICS},
+                }},
+                {"$sort": {"_id": 1}},
+            ]
+            source = self.samples
+        elif unit == "week":
+            # Weekly rollups start on Monday
+            start = datetime(start.year, start.month, start.day) - timedelta(days=start.weekday())
+            pipeline = [
+                {"$match": {"agent_id": agent_id, "bucket": {"$gte": start, "$lt": end}}},
+                {"$sort": {"bucket": 1}},
+                {"$project": {
+                    "_id": "$bucket",
+                    **{m: {"$ifNull": [f"${m}", 0]} for m in CHART_METRICS},
+                    **{f"{m}_peak": {"$ifNull": [f"${m}_peak", f"${m}", 0]} for m in CHART_METRICS},
+                }},
+            ]
+            source = self.weekly
+        else:
+            # Daily rollups are keyed by midnight: a mid-day start would skip its own day
+            start = datetime(start.year, start.month, start.day)
+            pipeline = [
+                {"$match": {"agent_id": agent_id, "bucket": {"$gte": start, "$lt": end}}},
+                {"$group": {
+                    "_id": {"$dateTrunc": {"date": "$bucket", "unit": unit, "startOfWeek": "monday"}},
+                    **{m: {"$sum": {"$ifNull": [f"${m}", 0]}} for m in CHART_METRICS},
+                    **{f"{m}_peak": {"$max": {"$ifNull": [f"${m}", 0]}} for m in CHART_METRICS},
+                }},
+                {"$sort": {"_id": 1}},
+            ]
+            source = self.daily
 
         try:
-            logger.info(f"Running analytics aggregation for agent {agent_id}")
-            results = await self.db.aggregate(pipeline).to_list(length=None)
-            return [
-                {
-                    "date": r["_id"],
-                    "likes": r["likes"],
-                    "comments": r["comments"],
-                    "shares": r["shares"],
-                    "impressions": r["impressions"]
-                } for r in results
-            ]
+            results = await source.aggregate(pipeline).to_list(length=max_points + 1)
         except Exception as e:
-            logger.error(f"Aggregation failed: {e}", exc_info=True)
-            return []
+            logger.error(f"Series aggregation failed: {e}", exc_info=True)
+            return unit, []
+
+        date_format = "%Y-%m-%dT%H:00" if unit == "hour" else "%Y-%m-%d"
+        return unit, [
+            {"date": r["_id"].strftime(date_format), **{k: v for k, v in r.items() if k != "_id"}}
+            for r in results
+        ]
 
-    async def get_post_insights(self, post_id: str, access_token: str) -> List[Dict[str, Any]]:
+    async def get_post_insights(
+        self,
+        post_id: str,
+        access_token: str,
+        client: Optional[httpx.AsyncClient] = None,
+        raise_errors: bool = False
+    ) -> List[Dict[str, Any]]:
         """
-        Fetch insights for a specific Facebook post via Graph API.
+        Fetch insights for a specific Facebook post via Graph API, with its
+        comment and share counts (see insights_with_counts).
+
+        Pass a shared `client` when fetching many posts to reuse connections.
+        Errors are logged and return [] unless `raise_errors` is set, for
+        callers that must tell a failure from a post without insights.
         """
-        url = f"https://graph.facebook.com/v18.0/{post_id}/insights"
+        url = f"https://graph.facebook.com/{settings.FB_API_VERSION}/{post_id}"
         params = {
-            "metric": "post_impressions,post_engaged_users,post_clicks",
+            "fields": POST_ENGAGEMENT_FIELDS,
             "access_token": access_token
         }
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            if client is None:
+                async with httpx.AsyncClient(timeout=10.0) as client:
+                    response = await client.get(url, params=params)
+            else:
                 response = await client.get(url, params=params)
-                response.raise_for_status()
-                data = response.json()
-                return data.get("data", [])
+            response.raise_for_status()
+            return insights_with_counts(response.json())
         except httpx.HTTPStatusError as e:
             logger.error(f"Facebook API error: {e.response.status_code} - {e.response.text}")
+            if raise_errors:
+                raise
             return []
         except Exception as e:
             logger.error(f"Failed to fetch post insights: {e}", exc_info=True)
+            if raise_errors:
+                raise
             return []
 
 
+
+    async def iter_page_posts_insights(
+        self,
+        page_id: str,
+        access_token: str,
+        since: datetime,
+        after: Optional[str] = None,
+        client: Optional[httpx.AsyncClient] = None
+    ) -> AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """
+        Page through a page's posts created since `since`, each with its
+        insights expanded inline, instead of one `/insights` call per post.
+
+        Yields (posts, cursor) per page of results; `cursor` resumes paging
+        after that page and is None on the last one. Errors propagate so the
+        caller can keep its stored cursor.
+        """
+        url = f"https://graph.facebook.com/{settings.FB_API_VERSION}/{page_id}/posts"
+        params = {
+            "fields": f"id,created_time,{POST_ENGAGEMENT_FIELDS}",
+            "since": int(since.replace(tzinfo=timezone.utc).timestamp()),
+            "limit": settings.PAGE_SYNC_PAGE_SIZE,
+            "access_token": access_token,
+        }
+        if after:
+            params["after"] = after
+
+        owned = client is None
+        client = client or httpx.AsyncClient(timeout=10.0)
+        try:
+            while True:
+                response = await client.get(url, params=params)
+                response.raise_for_status()
+                data = response.json()
+                paging = data.get("paging") or {}
+                cursor = (paging.get("cursors") or {}).get("after") if paging.get("next") else None
+                yield [
+                    {
+                        "post_id": post["id"],
+                        "created_time": post.get("created_time"),
+                        "insights": insights_with_counts(post),
+                    }
+                    for post in data.get("data", [])
+                ], cursor
+                if not cursor:
+                    return
+                params["after"] = cursor
+        finally:
+            if owned:
+                await client.aclose()
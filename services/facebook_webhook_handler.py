@@ -1,93 +1,181 @@
 # services/facebook_webhook_handler.py
 
+import asyncio
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from db.session import get_db 
+from db.facebook_repository import FacebookRepository
 from services.social_media.token_service import FacebookTokenService
+from services.facebook_analytics import FacebookAnalytics
+from services.engagement_refresher import EngagementRefresher
+from services.insights_store import InsightsStore, metrics_from_insights
+from services.webhook_dedup import WebhookDeduplicator
 from models.facebook import FacebookWebhookPayload
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Facebook feed verbs → PostStatus values (models/facebook.py). An edited or
+# unhidden post is still published; verbs without a mapping leave the
+# status untouched.
+POST_STATUS_BY_VERB = {
+    "add":    "published",
+    "edit":   "published",
+    "delete": "deleted",
+    "hide":   "hidden",
+    "unhide": "published",
+}
+
 class WebhookHandler:
+    def __init__(
+        self,
+        refresher: Optional[EngagementRefresher] = None,
+        dedup: Optional[WebhookDeduplicator] = None
+    ):
+        # When a refresher is attached, comment-driven engagement refreshes
+        # are debounced per post instead of running inline.
+        self.refresher = refresher
+        # When a deduplicator is attached, changes already applied by this or
+        # another replica are dropped before any processing. Changes are only
+        # recorded as applied after their writes succeed; in between, a
+        # replica may apply the same change twice, which is harmless because
+        # status writes and engagement refreshes are idempotent.
+        self.dedup = dedup
+
+    async def process_batch(self, events: List[Dict[str, Any]]):
+        """
+        Apply a batch of events read from the webhook event log.
+
+        Every change of every entry is considered, but feed changes are
+        coalesced per post first: a burst of comments on one post results in
+        a single engagement refresh, and only the latest post verb is applied.
+        """
+        db = get_db()
+        pending: Dict[str, Dict[str, Any]] = {}
+        changes: List[tuple] = []
+
+        for event in events:
+            for entry in event.get("entry", []):
+                entry_changes = entry.get("changes") or []
+                messaging     = entry.get("messaging") or []
+                if not entry_changes and not messaging:
+                    logger.info(f"Unhandled webhook entry: {entry}")
+                changes.extend((entry, change) for change in entry_changes)
+                for message in messaging:
+                    await self._handle_message(message, db)
+
+        unique, new_keys = await self._drop_duplicates(changes)
+        for change in unique:
+            self._collect_change(change, pending)
+
+        # Status writes run concurrently so the repository's bulk writer
+        # sends them as a handful of bulk_write calls
+        await asyncio.gather(*(
+            self._update_post_status(post_id, post_changes["verb"], db)
+            for post_id, post_changes in pending.items()
+            if post_changes["verb"]
+        ))
+        for post_id, post_changes in pending.items():
+            if post_changes["comments"]:
+                if self.refresher:
+                    self.refresher.schedule(post_id)
+                else:
+                    await self._update_comment_count(post_id, db)
+
+        # Only now: if anything above failed or the process died, the batch
+        # is retried from its checkpoint and its changes are not duplicates
+        if self.dedup:
+            await self.dedup.mark_seen(new_keys)
+
+        if pending:
+            logger.info(f"Applied webhook changes for {len(pending)} posts")
+
     async def process_event(self, payload: Dict[str, Any]):
-        # Grab the collection
-        db_coll = get_db()
-        db      = db_coll  # that's your AsyncIOMotorCollection
-
-        for entry in payload.get("entry", []):
-            if entry.get("changes"):
-                await self._handle_change(entry["changes"][0], db)
-            elif entry.get("messaging"):
-                await self._handle_message(entry["messaging"][0], db)
-            else:
-                logger.info(f"Unhandled webhook entry: {entry}")
-
-    async def _handle_change(self, change: Dict[str, Any], db):
-        if change["field"] == "feed":
-            post_id = change["value"].get("post_id")
-            item    = change["value"].get("item")
-            verb    = change["value"].get("verb")
-
-            if item == "post" and post_id:
-                await self._update_post_status(post_id, verb, db)
-            elif item == "comment" and post_id:
-                await self._update_comment_count(post_id, db)
+        await self.process_batch([payload])
+
+    def coalesce(self, events: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Group the feed changes of `events` per post without applying them."""
+        pending: Dict[str, Dict[str, Any]] = {}
+        for event in events:
+            for entry in event.get("entry", []):
+                for change in entry.get("changes") or []:
+                    self._collect_change(change, pending)
+        return pending
+
+    async def _drop_duplicates(self, changes: List[tuple]) -> tuple:
+        if not self.dedup:
+            return [change for _, change in changes], []
+
+        keys = [self.dedup.change_key(entry, change) for entry, change in changes]
+        new_keys = await self.dedup.unseen(keys)
+        fresh = set(new_keys)
+        unique = []
+        for key, (_, change) in zip(keys, changes):
+            if key in fresh:
+                fresh.discard(key)  # keep only the first copy within the batch
+                unique.append(change)
+        if len(unique) < len(changes):
+            logger.info(f"Dropped {len(changes) - len(unique)} duplicate webhook changes")
+        return unique, new_keys
+
+    def _collect_change(self, change: Dict[str, Any], pending: Dict[str, Dict[str, Any]]):
+        if change.get("field") != "feed":
+            return
+
+        value   = change.get("value") or {}
+        post_id = value.get("post_id")
+        item    = value.get("item")
+        if not post_id:
+            return
+
+        post_changes = pending.setdefault(post_id, {"verb": None, "comments": 0})
+        if item == "post":
+            post_changes["verb"] = value.get("verb")
+        elif item == "comment":
+            post_changes["comments"] += 1
+
+    async def refresh_engagement(self, post_id: str):
+        await self._update_comment_count(post_id, get_db())
+
+    async def _handle_message(self, message: Dict[str, Any], db):
+        sender = message.get("sender", {}).get("id")
+        logger.info(f"Received page message from {sender}; messaging is not handled yet")
 
     async def _update_post_status(self, post_id: str, action: str, db):
-        status_map = {
-            "add":    "published",
-            "edit":   "updated",
-            "delete": "deleted",
-            "hide":   "hidden",
-            "unhide": "published",
-        }
-        new_status = status_map.get(action, "modified")
-
-        result = await db.update_one(
-            {"facebook.posts.post_id": post_id},
-            {"$set": {"facebook.posts.$.status": new_status}}
-        )
-        if result.modified_count:
+        new_status = POST_STATUS_BY_VERB.get(action)
+        if not new_status:
+            logger.info(f"Ignoring unmapped verb {action!r} for post {post_id}")
+            return
+
+        if await FacebookRepository(db).set_post_fields(post_id, {"status": new_status}):
             logger.info(f"Post {post_id} status set to {new_status}")
         else:
             logger.warning(f"Post {post_id} not found to update status")
 
     async def _update_comment_count(self, post_id: str, db):
-        # 1) Load post document (to get agent_id)
-        doc = await db.find_one(
-            {"facebook.posts.post_id": post_id},
-            {"facebook.posts.$": 1}
-        )
-        if not doc or not doc.get("facebook", {}).get("posts"):
+        repository = FacebookRepository(db)
+
+        # 1) Agents holding the post (all connected to the page it is on)
+        agent_ids = await repository.get_post_agent_ids(post_id)
+        if not agent_ids:
             logger.warning(f"No post doc for {post_id}")
             return
 
-        post_rec = doc["facebook"]["posts"][0]
-        agent_id = post_rec.get("agent_id")
+        agent_id = agent_ids[0]
 
         # 2) Instantiate token service to decrypt / refresh token
         token_service = FacebookTokenService(db)
         token         = await token_service.get_valid_token(agent_id)
 
         # 3) Fetch fresh metrics
-        metrics_list = await get_post_insights(post_id, token)
-        # metrics_list is a List[Dict], you might need to map it to your schema
+        metrics_list = await FacebookAnalytics(db).get_post_insights(post_id, token)
 
-        # Example: pick the first metric entry (or iterate as needed)
+        # 4) The metrics are the page's, so every agent's copy gets them
         if metrics_list:
-            insights = metrics_list[0].get("values", [])
-            # flatten values into a single number if you want, e.g.
-            # latest = insights[-1]["value"]
-            # else adjust to your data shape
-
-            await db.update_one(
-                {"facebook.posts.post_id": post_id},
-                {"$set": {
-                    "facebook.posts.$.engagement": metrics_list,
-                    "facebook.posts.$.last_updated": datetime.utcnow()
-                }}
-            )
+            await repository.set_post_fields(post_id, {
+                "engagement": metrics_list,
+                "last_updated": datetime.utcnow()
+            })
+            metrics = metrics_from_insights(metrics_list)
+            await InsightsStore().record([(agent_id, post_id, metrics) for agent_id in agent_ids])
             logger.info(f"Updated engagement for {post_id}")
-
-
@@ -0,0 +1,269 @@
+# services/image_compositor.py
+
+import asyncio
+import logging
+import os
+import re
+import uuid
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Tuple
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont, ImageOps
+
+from core.config import settings
+from db.session import get_db
+from models.agents import AgentBranding
+from services.image_pipeline import get_image_pipeline
+from services.image_store import ImageBlob, get_image_store
+
+logger = logging.getLogger(__name__)
+
+# Tried in order when BRAND_FONT_PATH is unset; Pillow also searches the system font dirs
+FALLBACK_FONTS = ("DejaVuSans-Bold.ttf", "LiberationSans-Bold.ttf", "Arial Bold.ttf", "arial.ttf")
+
+DEFAULT_PRIMARY = AgentBranding.model_fields["primary_color"].default
+DEFAULT_SECONDARY = AgentBranding.model_fields["secondary_color"].default
+
+_PAIR_PREFIX = re.compile(r"^\s*(pair\s*\d+\s*:)?\s*", re.IGNORECASE)
+
+
+class BrandStyle(NamedTuple):
+    """Everything the brand band depends on; also the key of the per-brand caches."""
+    name: str
+    slogan: str
+    primary_color: str = DEFAULT_PRIMARY
+    secondary_color: str = DEFAULT_SECONDARY
+
+
+class ListingCard(NamedTuple):
+    """One listing to brand: its photo (None for a plain brand card) and per-listing details."""
+    photo: Optional[str]
+    price: Optional[str] = None
+    location: Optional[str] = None
+
+
+class CardLayout(NamedTuple):
+    padding: int
+    band_height: int
+    name_size: int
+    name_y: int
+    slogan_size: int
+    slogan_y: int
+    detail_size: int
+
+
+class CardResult(NamedTuple):
+    path: Optional[str]
+    error: Optional[str] = None
+
+
+def parse_brand(selected_brand: Optional[str]) -> Tuple[str, str]:
+    """'Pair 1: Brand Name - Slogan' (as suggested by create_branding_node) → (name, slogan)."""
+    lines = (selected_brand or "").strip().splitlines()
+    text = _PAIR_PREFIX.sub("", lines[0]) if lines else ""
+    name, _, slogan = text.partition(" - ")
+    return name.strip(" *\"'"), slogan.strip(" *\"'")
+
+
+def _rgba(color: str, fallback: str, alpha: int = 255) -> Tuple[int, int, int, int]:
+    try:
+        r, g, b = ImageColor.getrgb(color)[:3]
+    except ValueError:
+        r, g, b = ImageColor.getrgb(fallback)[:3]
+    return r, g, b, alpha
+
+
+# Everything below runs in the image pool's worker processes. The caches are
+# per process and live as long as the pool, so each worker loads a font size,
+# measures a brand and draws its band once, however many listings follow.
+
+@lru_cache(maxsize=64)
+def _font(size: int) -> ImageFont.ImageFont:
+    candidates = ([settings.BRAND_FONT_PATH] if settings.BRAND_FONT_PATH else []) + list(FALLBACK_FONTS)
+    for path in candidates:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            continue
+    logger.warning("No TrueType font found, using Pillow's default font")
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:  # Pillow < 10.1 only has a fixed-size default
+        return ImageFont.load_default()
+
+
+def _fit(text: str, size: int, max_width: int, min_size: int = 12) -> int:
+    """Largest font size up to `size` at which `text` fits in `max_width`."""
+    while size > min_size:
+        left, _, right, _ = _font(size).getbbox(text)
+        if right - left <= max_width:
+            break
+        size = max(min_size, int(size * 0.9))
+    return size
+
+
+@lru_cache(maxsize=256)
+def _layout(style: BrandStyle, width: int, height: int) -> CardLayout:
+    """Font sizes and offsets of the brand band, relative to the band's top."""
+    padding = max(12, width // 30)
+    band_height = max(60, height // 5)
+    usable = width - 2 * padding
+    name_size = _fit(style.name, band_height * 2 // 5, usable)
+    slogan_size = _fit(style.slogan, band_height // 5, usable) if style.slogan else 0
+    gap = padding // 3 if style.slogan else 0
+    name_y = (band_height - (name_size + gap + slogan_size)) // 2
+    return CardLayout(
+        padding=padding,
+        band_height=band_height,
+        name_size=name_size,
+        name_y=name_y,
+        slogan_size=slogan_size,
+        slogan_y=name_y + name_size + gap,
+        detail_size=max(14, band_height // 5),
+    )
+
+
+@lru_cache(maxsize=16)
+def _band(style: BrandStyle, width: int, height: int) -> Image.Image:
+    """The brand band (name, slogan, colors) as an RGBA layer; the same for every listing of a brand."""
+    layout = _layout(style, width, height)
+    band = Image.new("RGBA", (width, layout.band_height), _rgba(style.primary_color, DEFAULT_PRIMARY, 215))
+    draw = ImageDraw.Draw(band)
+    draw.rectangle(
+        (0, 0, width, max(4, layout.band_height // 20)),
+        fill=_rgba(style.secondary_color, DEFAULT_SECONDARY)
+    )
+    draw.text((layout.padding, layout.name_y), style.name, font=_font(layout.name_size), fill=(255, 255, 255, 255))
+    if style.slogan:
+        draw.text(
+            (layout.padding, layout.slogan_y), style.slogan,
+            font=_font(layout.slogan_size), fill=(255, 255, 255, 230)
+        )
+    return band
+
+
+def _draw_details(canvas: Image.Image, style: BrandStyle, layout: CardLayout, card: ListingCard):
+    """Price badge in the top corner and location above the band: the only per-listing drawing."""
+    draw = ImageDraw.Draw(canvas)
+    width, height = canvas.size
+    font = _font(layout.detail_size)
+    pad = layout.padding
+    if card.price:
+        left, top, right, bottom = draw.textbbox((0, 0), card.price, font=font)
+        box_w, box_h = right - left + pad, bottom - top + pad // 2
+        x0, y0 = width - pad - box_w, pad
+        draw.rounded_rectangle(
+            (x0, y0, x0 + box_w, y0 + box_h), radius=box_h // 3,
+            fill=_rgba(style.secondary_color, DEFAULT_SECONDARY, 235)
+        )
+        draw.text((x0 + pad // 2 - left, y0 + pad // 4 - top), card.price, font=font, fill=(255, 255, 255, 255))
+    if card.location:
+        _, top, _, bottom = draw.textbbox((0, 0), card.location, font=font)
+        y = height - layout.band_height - (bottom - top) - pad // 2
+        draw.text(
+            (pad, y - top), card.location, font=font, fill=(255, 255, 255, 255),
+            stroke_width=max(1, layout.detail_size // 12), stroke_fill=(0, 0, 0, 160)
+        )
+
+
+def render_card(style: BrandStyle, card: ListingCard, dest: str, size: Tuple[int, int], quality: int) -> CardResult:
+    """Composite the brand band and listing details onto the photo (cropped to `size`) and write a JPEG."""
+    try:
+        width, height = size
+        if card.photo:
+            with Image.open(card.photo) as opened:
+                photo = ImageOps.exif_transpose(opened)
+                canvas = ImageOps.fit(photo.convert("RGB"), size, Image.LANCZOS).convert("RGBA")
+        else:
+            canvas = Image.new("RGBA", size, _rgba(style.secondary_color, DEFAULT_SECONDARY))
+
+        layout = _layout(style, width, height)
+        canvas.alpha_composite(_band(style, width, height), (0, height - layout.band_height))
+        _draw_details(canvas, style, layout, card)
+
+        tmp = f"{dest}.tmp-{os.getpid()}"
+        canvas.convert("RGB").save(tmp, format="JPEG", quality=quality, optimize=True, progressive=True)
+        os.replace(tmp, dest)
+        return CardResult(dest)
+    except Exception as e:
+        return CardResult(None, error=str(e))
+
+
+def render_cards(
+    style: BrandStyle, cards: List[Tuple[ListingCard, str]], size: Tuple[int, int], quality: int
+) -> List[CardResult]:
+    """One worker round-trip for a batch of one brand's listings; errors are per card."""
+    return [render_card(style, card, dest, size, quality) for card, dest in cards]
+
+
+class BrandCompositor:
+    """
+    Branded listing images: the brand name and slogan on a band in the
+    agent's primary color, with the price and location of each listing.
+
+    Listings are split into batches of `batch_size` and rendered in the
+    image worker pool, all batches at once (bounded by the pool's queue).
+    A brand's fonts, layout and band are cached in each worker, so after
+    the first card a listing costs one decode, one composite and one
+    encode. Results are stored in the image store by content hash without
+    being decoded again, as the pool has just written them.
+    """
+
+    def __init__(self, size: Tuple[int, int], batch_size: int, quality: int):
+        self.size = size
+        self.batch_size = batch_size
+        self.quality = quality
+
+    async def render(
+        self, style: BrandStyle, cards: List[ListingCard], agent_id: Optional[str] = None
+    ) -> List[Optional[ImageBlob]]:
+        """Branded images in card order, stored for `agent_id`; None where a card failed to render."""
+        store = get_image_store()
+        os.makedirs(store.staging_dir, exist_ok=True)
+        staged = [(card, os.path.join(store.staging_dir, f".compose-{uuid.uuid4().hex}.jpg")) for card in cards]
+        batches = [staged[i:i + self.batch_size] for i in range(0, len(staged), self.batch_size)]
+
+        pipeline = get_image_pipeline()
+        rendered = await asyncio.gather(*(
+            pipeline.call(render_cards, style, batch, self.size, self.quality) for batch in batches
+        ))
+
+        blobs: List[Optional[ImageBlob]] = []
+        for (card, _), result in zip(staged, (r for batch in rendered for r in batch)):
+            if result.error:
+                logger.error(f"Failed to brand {card.photo or 'brand card'} for '{style.name}': {result.error}")
+                blobs.append(None)
+                continue
+            blobs.append(await store.put(result.path, move=True, agent_id=agent_id, dimensions=self.size))
+        logger.info(f"Branded {sum(b is not None for b in blobs)}/{len(cards)} listing images for '{style.name}'")
+        return blobs
+
+    async def render_one(self, style: BrandStyle, card: ListingCard, agent_id: Optional[str] = None) -> Optional[ImageBlob]:
+        return (await self.render(style, [card], agent_id))[0]
+
+
+async def load_brand_style(agent_id: Optional[str], selected_brand: Optional[str]) -> BrandStyle:
+    """The selected brand's name and slogan, in the agent's colors (AgentBranding defaults if unset)."""
+    name, slogan = parse_brand(selected_brand)
+    primary, secondary = DEFAULT_PRIMARY, DEFAULT_SECONDARY
+    if agent_id:
+        try:
+            agent = await get_db().find_one(
+                {"agentId": agent_id}, {"_id": 0, "primary_color": 1, "secondary_color": 1}
+            )
+        except Exception as e:
+            logger.warning(f"Could not load branding colors for agent {agent_id}: {e}")
+            agent = None
+        if agent:
+            primary = agent.get("primary_color") or primary
+            secondary = agent.get("secondary_color") or secondary
+    return BrandStyle(name or "Your Brand", slogan, primary, secondary)
+
+
+@lru_cache(maxsize=None)
+def get_brand_compositor() -> BrandCompositor:
+    return BrandCompositor(
+        (settings.BRAND_IMAGE_WIDTH, settings.BRAND_IMAGE_HEIGHT),
+        settings.BRAND_IMAGE_BATCH_SIZE,
+        settings.BRAND_IMAGE_QUALITY
+    )
@@ -0,0 +1,191 @@
+# services/image_encoder.py
+
+import asyncio
+import io
+import json
+import logging
+import os
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from core.config import settings
+from services.image_pipeline import get_image_pipeline
+from services.image_store import hash_file
+
+logger = logging.getLogger(__name__)
+
+# JPEG qualities searched, lowest first
+JPEG_QUALITY_RANGE = (40, 95)
+# Image.info keys that carry metadata an upload must not leak
+METADATA_KEYS = ("exif", "icc_profile", "xmp", "XML:com.adobe.xmp", "comment")
+
+
+class EncodedImage(NamedTuple):
+    path: str
+    format: str
+    quality: Optional[int]
+    size: int
+    original_size: int
+    ssim: float
+
+
+def ssim(reference: np.ndarray, candidate: np.ndarray, block: int = 8) -> float:
+    """Mean structural similarity of two greyscale images over non-overlapping blocks."""
+    h = reference.shape[0] // block * block
+    w = reference.shape[1] // block * block
+    if not h or not w:
+        return 1.0 if np.array_equal(reference, candidate) else 0.0
+
+    def blocks(a: np.ndarray) -> np.ndarray:
+        return a[:h, :w].reshape(h // block, block, w // block, block).swapaxes(1, 2).reshape(-1, block * block)
+
+    x, y = blocks(reference.astype(np.float64)), blocks(candidate.astype(np.float64))
+    mx, my = x.mean(axis=1), y.mean(axis=1)
+    vx, vy = x.var(axis=1), y.var(axis=1)
+    cov = ((x - mx[:, None]) * (y - my[:, None])).mean(axis=1)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    return float(np.mean(((2 * mx * my + c1) * (2 * cov + c2)) / ((mx ** 2 + my ** 2 + c1) * (vx + vy + c2))))
+
+
+def _encode(img: Image.Image, fmt: str, quality: Optional[int]) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "JPEG":
+        img.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        img.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def encode_for_target(src: str, dest_base: str, max_dimensions: Optional[Tuple[int, int]], target_ssim: float) -> EncodedImage:
+    """
+    Runs in a worker process. Re-encodes `src` at the smallest size whose
+    SSIM against the (resized) source is at least `target_ssim`.
+
+    Photos are binary-searched over JPEG quality; images with transparency
+    are kept as lossless PNG, and small-palette graphics use PNG when that
+    is smaller than the chosen JPEG. EXIF orientation is applied and all
+    metadata (EXIF, GPS, ICC, text chunks) is dropped. A JPEG or PNG source
+    that carries no metadata and fits `max_dimensions` is kept as is when
+    no re-encode is smaller.
+
+    The result is also written to `{dest_base}.json`, so cache hits can
+    report it without decoding anything.
+    """
+    original_size = os.path.getsize(src)
+    with Image.open(src) as opened:
+        source_format = opened.format
+        clean = not any(key in opened.info for key in METADATA_KEYS) and not getattr(opened, "text", None)
+        img = ImageOps.exif_transpose(opened)
+        img.load()
+    original_dimensions = img.size
+    if max_dimensions:
+        img.thumbnail(max_dimensions)
+    keep_original = clean and source_format in ("JPEG", "PNG") and img.size == original_dimensions
+
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    if has_alpha:
+        data, fmt, quality, score = _encode(img.convert("RGBA"), "PNG", None), "PNG", None, 1.0
+    else:
+        rgb = img.convert("RGB")
+        reference = np.asarray(rgb.convert("L"))
+
+        def encode_scored(quality: int) -> Tuple[bytes, int, float]:
+            data = _encode(rgb, "JPEG", quality)
+            with Image.open(io.BytesIO(data)) as decoded:
+                return data, quality, ssim(reference, np.asarray(decoded.convert("L")))
+
+        lo, hi = JPEG_QUALITY_RANGE
+        best = None
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            scored = encode_scored(mid)
+            if scored[2] >= target_ssim:
+                best, hi = scored, mid - 1
+            else:
+                lo = mid + 1
+        if best is None:
+            # No quality reaches the target: keep the best one we search
+            best = scored if scored[1] == JPEG_QUALITY_RANGE[1] else encode_scored(JPEG_QUALITY_RANGE[1])
+        data, quality, score = best
+        fmt = "JPEG"
+
+        # Flat graphics (logos, text cards) compress better losslessly
+        if rgb.getcolors(256) is not None:
+            png = _encode(rgb, "PNG", None)
+            if len(png) < len(data):
+                data, fmt, quality, score = png, "PNG", None, 1.0
+
+    if keep_original and len(data) >= original_size:
+        with open(src, "rb") as f:
+            data = f.read()
+        fmt, quality, score = source_format, None, 1.0
+
+    path = f"{dest_base}{'.jpg' if fmt == 'JPEG' else '.png'}"
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    encoded = EncodedImage(path, fmt, quality, len(data), original_size, round(score, 4))
+    tmp = f"{dest_base}.json.tmp-{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(encoded._asdict(), f)
+    os.replace(tmp, f"{dest_base}.json")
+    return encoded
+
+
+class ImageEncoder:
+    """
+    Size-optimized encodings for upload, cached by content hash.
+
+    The cache key is the source's sha256 plus the size bound and quality
+    target, so a photo is encoded once however many posts or copies use it.
+    Encoding runs in the image worker pool.
+    """
+
+    def __init__(self, cache_dir: str, target_ssim: float):
+        self.cache_dir = cache_dir
+        self.target_ssim = target_ssim
+        self._encoding: dict = {}
+
+    async def optimize(self, path: str, max_dimensions: Optional[Tuple[int, int]] = None) -> EncodedImage:
+        sha256 = await asyncio.to_thread(hash_file, path)
+        bound = f"{max_dimensions[0]}x{max_dimensions[1]}" if max_dimensions else "full"
+        dest_base = os.path.join(self.cache_dir, sha256[:2], f"{sha256}-{bound}-q{int(self.target_ssim * 1000)}")
+
+        cached = await asyncio.to_thread(self._cached, dest_base)
+        if cached:
+            return cached
+
+        # Concurrent requests for the same encoding share one worker call,
+        # which stays registered until it finishes even if its callers give up
+        if dest_base not in self._encoding:
+            os.makedirs(os.path.dirname(dest_base), exist_ok=True)
+            future = asyncio.ensure_future(get_image_pipeline().call(
+                encode_for_target, path, dest_base, max_dimensions, self.target_ssim
+            ))
+            self._encoding[dest_base] = future
+            future.add_done_callback(lambda _: self._encoding.pop(dest_base, None))
+        encoded = await asyncio.shield(self._encoding[dest_base])
+        logger.info(
+            f"Encoded {os.path.basename(path)} as {encoded.format} q={encoded.quality}: "
+            f"{encoded.original_size} → {encoded.size} bytes (SSIM {encoded.ssim})"
+        )
+        return encoded
+
+    @staticmethod
+    def _cached(dest_base: str) -> Optional[EncodedImage]:
+        """The encode recorded next to `dest_base`, if both it and its image are still on disk."""
+        try:
+            with open(f"{dest_base}.json") as f:
+                encoded = EncodedImage(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+        return encoded if os.path.exists(encoded.path) else None
+
+
+@lru_cache(maxsize=None)
+def get_image_encoder() -> ImageEncoder:
+    return ImageEncoder(settings.IMAGE_ENCODED_DIR, settings.IMAGE_ENCODE_TARGET_SSIM)
@@ -0,0 +1,152 @@
+# services/image_pipeline.py
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, TypeVar
+
+from PIL import Image
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ImageJob(NamedTuple):
+    """
+    One image to process: verify it and/or fit it within `max_dimensions`.
+
+    The resized copy is written next to the original as
+    `{path}_resized{suffix}`; nothing is written if it already fits.
+    """
+    path: str
+    verify: bool = True
+    max_dimensions: Optional[Tuple[int, int]] = None
+    quality: int = 85
+
+
+class ImageResult(NamedTuple):
+    path: str
+    output_path: Optional[str]
+    width: int
+    height: int
+    timings: Dict[str, float]  # stage → milliseconds
+    error: Optional[str] = None
+
+
+def _process(job: ImageJob) -> ImageResult:
+    """Runs in a worker process; errors are returned, not raised, so one bad image doesn't fail its batch."""
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    def lap(stage: str):
+        nonlocal started
+        now = time.perf_counter()
+        timings[stage] = round((now - started) * 1000, 2)
+        started = now
+
+    width = height = 0
+    try:
+        if job.verify:
+            # verify() leaves the image unusable, so it gets its own open
+            with Image.open(job.path) as img:
+                img.verify()
+            lap("verify")
+
+        output_path = job.path
+        with Image.open(job.path) as img:
+            width, height = img.size
+            lap("open")
+            if job.max_dimensions and (width > job.max_dimensions[0] or height > job.max_dimensions[1]):
+                img.thumbnail(job.max_dimensions)
+                width, height = img.size
+                lap("resize")
+                output_path = f"{job.path}_resized{Path(job.path).suffix}"
+                img.save(output_path, quality=job.quality)
+                lap("save")
+        return ImageResult(job.path, output_path, width, height, timings)
+    except Exception as e:
+        return ImageResult(job.path, None, width, height, timings, error=str(e))
+
+
+def _process_batch(jobs: List[ImageJob]) -> List[ImageResult]:
+    return [_process(job) for job in jobs]
+
+
+def render_variant(src: str, dest: str, max_dimension: Optional[int], fmt: str, quality: int) -> int:
+    """Write a derived copy of `src` to `dest` (atomically); returns its size in bytes."""
+    with Image.open(src) as img:
+        img.load()
+        if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        if max_dimension:
+            img.thumbnail((max_dimension, max_dimension))
+        tmp = f"{dest}.tmp-{os.getpid()}"
+        img.save(tmp, format=fmt, quality=quality, optimize=True)
+    os.replace(tmp, dest)
+    return os.path.getsize(dest)
+
+
+class ImagePipeline:
+    """
+    Pillow work (verify, decode, resize, encode) off the event loop.
+
+    Batches of images are sent to a process pool, so CPU-bound decoding
+    neither blocks the loop nor contends for the GIL. At most `queue_size`
+    batches are in flight; further submissions wait for a slot instead of
+    piling up unbounded work.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self._slots = asyncio.Semaphore(queue_size)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Forking after Motor's monitor threads exist can copy a held
+            # lock into the child and deadlock it; start workers from a
+            # clean process instead (spawn where forkserver is unavailable)
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method))
+        return self._pool
+
+    async def submit(self, jobs: List[ImageJob]) -> List[ImageResult]:
+        """Process a batch of images in one worker round-trip; results are in job order."""
+        if not jobs:
+            return []
+        async with self._slots:
+            started = time.perf_counter()
+            results = await asyncio.get_running_loop().run_in_executor(self.pool, _process_batch, list(jobs))
+        elapsed = (time.perf_counter() - started) * 1000
+        logger.debug(
+            f"Processed {len(jobs)} images in {elapsed:.1f}ms: "
+            + "; ".join(f"{Path(r.path).name} {r.timings}" for r in results)
+        )
+        return results
+
+    async def process(self, job: ImageJob) -> ImageResult:
+        return (await self.submit([job]))[0]
+
+    async def call(self, fn: Callable[..., T], *args) -> T:
+        """Run any picklable module-level function in the pool, under the same queue bound."""
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+
+@lru_cache(maxsize=None)
+def get_image_pipeline() -> ImagePipeline:
+    return ImagePipeline(settings.IMAGE_PIPELINE_WORKERS, settings.IMAGE_PIPELINE_QUEUE_SIZE)
@@ -1,14 +1,44 @@
 import aiofiles
+import asyncio
+import hashlib
 import os
 import logging
+import uuid
 from fastapi import HTTPException
-from PIL import Image, UnidentifiedImageError
 from pathlib import Path
-from typing import List
+from typing import AsyncIterator, List, NamedTuple, Optional
 from fastapi import UploadFile
+from services.image_pipeline import ImageJob, get_image_pipeline
+from services.image_encoder import get_image_encoder
 
 logger = logging.getLogger(__name__)
 
+# Leading bytes of each accepted image type
+IMAGE_SIGNATURES = {
+    "image/jpeg": (b"\xff\xd8\xff",),
+    "image/png": (b"\x89PNG\r\n\x1a\n",),
+    "image/webp": (b"RIFF",),  # + "WEBP" at offset 8, checked below
+}
+IMAGE_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp"}
+SNIFF_BYTES = 12
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Content type from an image's first bytes, or None if it is not an accepted image."""
+    for content_type, signatures in IMAGE_SIGNATURES.items():
+        if any(head.startswith(signature) for signature in signatures):
+            if content_type == "image/webp" and head[8:12] != b"WEBP":
+                continue
+            return content_type
+    return None
+
+
+class StoredUpload(NamedTuple):
+    path: str
+    sha256: str
+    size: int
+    content_type: str
+
 class PropertyImageProcessor:
     def __init__(self):
         self.allowed_types = ["image/jpeg", "image/png"]
@@ -33,16 +63,74 @@ class PropertyImageProcessor:
                 detail=f"File too large. Max size: {max_size/1024/1024}MB"
             )
     
+    async def stream_to_disk(
+        self,
+        chunks: AsyncIterator[bytes],
+        dest_dir: str,
+        allowed_types: List[str],
+        max_size: int
+    ) -> StoredUpload:
+        """
+        Write an upload to disk chunk by chunk, hashing it and checking its
+        type and size as it arrives.
+
+        The type is sniffed from the first bytes (the declared content type
+        is not trusted) and the upload is aborted as soon as it fails that
+        check or passes `max_size`, without reading the rest. Each upload
+        gets its own file, so concurrent uploads of the same photo never
+        share one. The image is not decoded here: ImageStore.put verifies
+        it only if it is not stored already.
+        """
+        os.makedirs(dest_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        head = b""
+        content_type = None
+        tmp_path = os.path.join(dest_dir, f".upload-{uuid.uuid4().hex}")
+
+        try:
+            async with aiofiles.open(tmp_path, "wb") as out:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    size += len(chunk)
+                    if size > max_size:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"File too large. Max size: {max_size/1024/1024}MB"
+                        )
+                    if content_type is None:
+                        head += chunk[:SNIFF_BYTES - len(head)]
+                        if len(head) >= SNIFF_BYTES:
+                            content_type = sniff_image_type(head)
+                            if content_type not in allowed_types:
+                                raise HTTPException(
+                                    status_code=415,
+                                    detail=f"Invalid file type. Allowed: {', '.join(allowed_types)}"
+                                )
+                    digest.update(chunk)
+                    await out.write(chunk)
+
+            if content_type is None:
+                raise HTTPException(status_code=400, detail="Upload is empty or too short to be an image")
+
+            path = f"{tmp_path}{IMAGE_EXTENSIONS[content_type]}"
+            os.replace(tmp_path, path)
+            return StoredUpload(path, digest.hexdigest(), size, content_type)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
     async def validate_image_integrity(self, file_path: str):
         """Verify the image is valid and not corrupted"""
-        try:
-            with Image.open(file_path) as img:
-                img.verify()  # Verify without loading
-        except (UnidentifiedImageError, Exception) as e:
+        # Decoding runs in the image worker pool, off the event loop
+        result = await get_image_pipeline().process(ImageJob(file_path, verify=True))
+        if result.error:
             os.unlink(file_path)
             raise HTTPException(
                 status_code=400,
-                detail=f"Invalid image file: {str(e)}"
+                detail=f"Invalid image file: {result.error}"
             )
     
     async def create_resized_copy(
@@ -51,13 +139,31 @@ class PropertyImageProcessor:
         max_dimensions: tuple[int, int]
     ) -> str:
         """Create resized copy if image exceeds max dimensions"""
-        with Image.open(original_path) as img:
-            if img.width <= max_dimensions[0] and img.height <= max_dimensions[1]:
-                return original_path
-                
-            # Create resized copy
-            img.thumbnail(max_dimensions)
-            new_path = f"{original_path}_resized{Path(original_path).suffix}"
-            img.save(new_path, quality=85)
-            return new_path
+        return (await self.create_resized_copies([original_path], max_dimensions))[0]
+
+    async def create_resized_copies(
+        self,
+        original_paths: List[str],
+        max_dimensions: tuple[int, int]
+    ) -> List[str]:
+        """
+        Fit a listing's photos within `max_dimensions`, re-encoded at the
+        smallest size meeting the perceptual quality target and stripped of
+        metadata (services/image_encoder.py). Paths are returned in order;
+        encodings are cached by content hash. The disk GC removes a copy
+        that nothing references, so store the paths you keep (e.g. in a
+        post's `images`).
+        """
+        encoder = get_image_encoder()
+        results = await asyncio.gather(
+            *(encoder.optimize(path, max_dimensions) for path in original_paths),
+            return_exceptions=True
+        )
+        for path, result in zip(original_paths, results):
+            if isinstance(result, Exception):
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Could not resize {Path(path).name}: {result}"
+                )
+        return [result.path for result in results]
 
@@ -0,0 +1,337 @@
+# services/image_store.py
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import shutil
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.staticfiles import StaticFiles
+from motor.motor_asyncio import AsyncIOMotorCollection
+from PIL import Image, UnidentifiedImageError
+from pymongo import ReturnDocument
+
+from core.config import settings
+from db.session import get_database
+from services.image_pipeline import ImageJob, get_image_pipeline, render_variant
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
+
+
+class VariantSpec(NamedTuple):
+    max_dimension: Optional[int]
+    format: str
+    ext: str
+    quality: int
+
+
+# Derived copies, rendered on first request
+VARIANTS = {
+    "facebook": VariantSpec(2048, "JPEG", ".jpg", 85),  # Facebook's largest displayed size
+    "thumb":    VariantSpec(320, "JPEG", ".jpg", 80),
+    "webp":     VariantSpec(None, "WEBP", ".webp", 80),
+}
+
+_BLOB_NAME = re.compile(r"^(?P<sha>[0-9a-f]{64})\.\w+$")
+_VARIANT_PATH = re.compile(r"^variants/[0-9a-f]{2}/(?P<sha>[0-9a-f]{64})/(?P<name>\w+)\.\w+$")
+
+
+class ImageBlob(NamedTuple):
+    sha256: str
+    path: str
+    url: str
+    size: int
+    width: int
+    height: int
+    content_type: str
+
+
+def blob_sha256(path: str) -> Optional[str]:
+    """Content hash of a blob path (as returned by `ImageStore.put`); None for other paths."""
+    match = _BLOB_NAME.match(os.path.basename(path or ""))
+    return match["sha"] if match else None
+
+
+def ref_field(agent_id: Optional[str]) -> str:
+    """Field of an agent's reference count; ids are escaped to be valid field names."""
+    key = (agent_id or "").replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+    return f"agent_refs.{key or '_'}"
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ImageStore:
+    """
+    Content-addressed image storage under `root` (served at /generated_images).
+
+    Originals are stored once per content hash at
+    `blobs/ab/<sha256><ext>`, whoever stores them and however often. The
+    `image_blobs` collection indexes them (size, dimensions, type), records
+    the agents that stored them and counts references per agent
+    (`agent_refs.<agent>`, with their total in `refs`): `put` adds one to
+    the storing agent and `release` drops one of the releasing agent's, so
+    no agent can release references another holds. A blob whose total is
+    0 is left to the disk GC
+    (services/disk_gc.py), which deletes it with its variants once it is
+    old enough, unless a post still points at its path.
+
+    Variants (see VARIANTS) live at `variants/ab/<sha256>/<name><ext>`, are
+    rendered in the image worker pool the first time they are requested,
+    and are evicted least-recently-used once they exceed `variant_budget`
+    bytes on disk; they can always be rendered again. Paths never change
+    content, so they are served with immutable cache headers.
+
+    Uploads and compositions are written to `staging_dir` first. It lies
+    outside `root`, so nothing is publicly served before it is stored.
+    """
+
+    def __init__(self, root: str, staging_dir: str, index: AsyncIOMotorCollection, variant_budget: int):
+        self.root = root
+        self.index = index
+        self.variant_budget = variant_budget
+        self.staging_dir = staging_dir
+        self._variants: "OrderedDict[str, int]" = OrderedDict()  # path → bytes, oldest first
+        self._variant_bytes = 0
+        self._variants_loaded = False
+        self._rendering: Dict[str, asyncio.Future] = {}
+
+    def blob_path(self, sha256: str, ext: str) -> str:
+        return os.path.join(self.root, "blobs", sha256[:2], f"{sha256}{ext}")
+
+    def variant_path(self, sha256: str, name: str) -> str:
+        return os.path.join(self.root, "variants", sha256[:2], sha256, f"{name}{VARIANTS[name].ext}")
+
+    def url_for(self, path: str) -> str:
+        return "/generated_images/" + os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    async def put(
+        self,
+        path: str,
+        move: bool = False,
+        agent_id: Optional[str] = None,
+        dimensions: Optional[Tuple[int, int]] = None,
+        sha256: Optional[str] = None
+    ) -> ImageBlob:
+        """
+        Store the image at `path` (copied, or moved if `move`) and take a
+        reference to it. The blob counts against the quota of the first
+        agent that stored it.
+
+        `path` is hashed unless its `sha256` is given (e.g. computed while
+        streaming it to disk). An image already in the store is the normal
+        dedup case: it is neither decoded nor copied again. New images are
+        decoded once to verify them, unless their `dimensions` are given:
+        only pass them for images this process has just written.
+        """
+        if sha256 is None:
+            sha256 = await asyncio.to_thread(hash_file, path)
+        doc = await self.index.find_one({"_id": sha256})
+        ext = doc["ext"] if doc else os.path.splitext(path)[1].lower()
+        dest = self.blob_path(sha256, ext)
+
+        # Also restores a blob the disk GC removed while it had no references
+        if doc is None or not os.path.exists(dest):
+            if dimensions:
+                width, height = dimensions
+            else:
+                result = await get_image_pipeline().process(ImageJob(path, verify=True))
+                if result.error:
+                    raise ValueError(f"Invalid image {path}: {result.error}")
+                width, height = result.width, result.height
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if not os.path.exists(dest):
+                # shutil.move renames, or copies if staging is on another filesystem
+                await asyncio.to_thread(shutil.move if move else shutil.copyfile, path, dest)
+            doc = {
+                "ext": ext,
+                "content_type": CONTENT_TYPES.get(ext, "application/octet-stream"),
+                "size": os.path.getsize(dest),
+                "width": width,
+                "height": height,
+                "created_at": datetime.utcnow(),
+            }
+
+        if move and os.path.exists(path) and os.path.abspath(path) != os.path.abspath(dest):
+            os.unlink(path)  # already stored under its hash
+
+        doc = await self.index.find_one_and_update(
+            {"_id": sha256},
+            {
+                "$inc": {"refs": 1, ref_field(agent_id): 1},
+                "$set": {"last_referenced_at": datetime.utcnow()},
+                "$setOnInsert": {
+                    k: v for k, v in doc.items()
+                    if k not in ("_id", "refs", "agent_refs", "last_referenced_at", "agents")
+                },
+                **({"$addToSet": {"agents": agent_id}} if agent_id else {}),
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return self._blob(doc)
+
+    async def get(self, sha256: str) -> Optional[ImageBlob]:
+        doc = await self.index.find_one({"_id": sha256})
+        return self._blob(doc) if doc else None
+
+    async def release(self, sha256: str, agent_id: Optional[str] = None) -> bool:
+        """
+        Drop one of the references `agent_id` holds (None: one taken
+        without an agent). False if it holds none. The blob stays on disk:
+        the disk GC reclaims it once no agent references it.
+        """
+        field = ref_field(agent_id)
+        result = await self.index.update_one(
+            {"_id": sha256, field: {"$gt": 0}}, {"$inc": {"refs": -1, field: -1}}
+        )
+        return result.modified_count > 0
+
+    async def ensure_variant(self, sha256: str, name: str) -> Optional[str]:
+        """Path of a variant, rendering it first if needed; None for unknown images or variants."""
+        if name not in VARIANTS:
+            return None
+        path = self.variant_path(sha256, name)
+        await self._load_variants()
+        if os.path.exists(path):
+            if path in self._variants:
+                self._variants.move_to_end(path)
+            else:  # rendered by another worker process
+                self._remember_variant(path, os.path.getsize(path))
+            return path
+
+        # Concurrent requests for the same variant share one render
+        if path in self._rendering:
+            return await asyncio.shield(self._rendering[path])
+        future = asyncio.get_running_loop().create_future()
+        self._rendering[path] = future
+        try:
+            doc = await self.index.find_one({"_id": sha256}, {"ext": 1})
+            if doc is None:
+                future.set_result(None)
+                return None
+            spec = VARIANTS[name]
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            size = await get_image_pipeline().call(
+                render_variant, self.blob_path(sha256, doc["ext"]), path, spec.max_dimension, spec.format, spec.quality
+            )
+            self._remember_variant(path, size)
+            await self._evict_variants()
+            future.set_result(path)
+            return path
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._rendering[path]
+
+    def touch_variant(self, path: str):
+        if path in self._variants:
+            self._variants.move_to_end(path)
+
+    def _remember_variant(self, path: str, size: int):
+        self._forget_variant(path)
+        self._variants[path] = size
+        self._variant_bytes += size
+
+    def _forget_variant(self, path: str):
+        size = self._variants.pop(path, None)
+        if size is not None:
+            self._variant_bytes -= size
+
+    async def _load_variants(self):
+        """Rebuild the LRU from disk once per process, oldest access first."""
+        if self._variants_loaded:
+            return
+        self._variants_loaded = True
+
+        def scan():
+            found = []
+            for dirpath, _, filenames in os.walk(os.path.join(self.root, "variants")):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    stat = os.stat(path)
+                    found.append((stat.st_atime, path, stat.st_size))
+            return sorted(found)
+
+        for _, path, size in await asyncio.to_thread(scan):
+            self._remember_variant(path, size)
+        await self._evict_variants()
+
+    async def _evict_variants(self):
+        while self._variant_bytes > self.variant_budget and self._variants:
+            path, size = self._variants.popitem(last=False)
+            self._variant_bytes -= size
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            logger.debug(f"Evicted image variant {path} ({size} bytes)")
+
+    def _blob(self, doc: Dict[str, Any]) -> ImageBlob:
+        path = self.blob_path(doc["_id"], doc["ext"])
+        return ImageBlob(
+            sha256=doc["_id"],
+            path=path,
+            url=self.url_for(path),
+            size=doc.get("size", 0),
+            width=doc.get("width", 0),
+            height=doc.get("height", 0),
+            content_type=doc.get("content_type", "application/octet-stream"),
+        )
+
+
+class ImageStaticFiles(StaticFiles):
+    """
+    /generated_images: renders missing variants on first request, and marks
+    content-addressed paths (blobs/, variants/) as immutable.
+    """
+
+    IMMUTABLE = "public, max-age=31536000, immutable"
+
+    async def get_response(self, path: str, scope):
+        path = path.replace(os.sep, "/")
+        match = _VARIANT_PATH.match(path)
+        if match:
+            store = get_image_store()
+            variant = store.variant_path(match["sha"], match["name"]) if match["name"] in VARIANTS else None
+            if variant and os.path.exists(variant):
+                store.touch_variant(variant)
+            elif variant:
+                try:
+                    await store.ensure_variant(match["sha"], match["name"])
+                except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+                    logger.warning(f"Cannot render {path}: {e}")
+                    raise HTTPException(status_code=415, detail="Image cannot be decoded")
+                except Exception as e:
+                    logger.error(f"Failed to render {path}: {e}", exc_info=True)
+                    raise HTTPException(status_code=404)
+
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304) and path.startswith(("blobs/", "variants/")):
+            response.headers["Cache-Control"] = self.IMMUTABLE
+        return response
+
+
+@lru_cache(maxsize=None)
+def get_image_store() -> ImageStore:
+    return ImageStore(
+        settings.IMAGE_STORE_DIR,
+        settings.IMAGE_STAGING_DIR,
+        get_database()[settings.IMAGE_BLOBS_COLLECTION],
+        settings.IMAGE_VARIANT_BUDGET_BYTES
+    )
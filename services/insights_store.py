@@ -0,0 +1,291 @@
+# services/insights_store.py
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+
+from core.config import settings
+from db.session import get_database, get_db
+
+logger = logging.getLogger(__name__)
+
+# Graph API insight names → the metric names stored and charted
+METRIC_ALIASES = {
+    "post_impressions":          "impressions",
+    "post_engaged_users":        "engaged_users",
+    "post_clicks":               "clicks",
+    "post_reactions_like_total": "likes",
+    "post_comments":             "comments",
+    "post_shares":               "shares",
+}
+ROLLUP_METRICS = ("likes", "comments", "shares", "impressions", "engaged_users", "clicks")
+# Metrics of the per-day rows dashboards read before the rollups existed
+LEGACY_METRICS = ("likes", "comments", "shares", "impressions")
+LEGACY_BACKFILL_ID = "insights_legacy_backfill"
+
+# $merge whenMatched pipelines. Backfilled buckets keep the legacy counts
+# in `legacy_counts` (each metric and its `_peak`), which are added to
+# whatever the samples contribute, so neither side overwrites the other.
+ADD_LEGACY = [{"$replaceWith": {"$mergeObjects": [
+    "$$new",
+    {"legacy": "$legacy", "legacy_counts": "$legacy_counts"},
+    {m: {"$add": [f"$$new.{m}", {"$ifNull": [f"$legacy_counts.{m}", 0]}]} for m in LEGACY_METRICS},
+    {f"{m}_peak": {"$max": [f"$$new.{m}_peak", f"$legacy_counts.{m}_peak"]} for m in LEGACY_METRICS},
+]}}]
+# Re-running the backfill swaps the previous legacy counts for the new ones
+SET_LEGACY = [{"$replaceWith": {"$mergeObjects": [
+    "$$ROOT",
+    {"legacy": True, "legacy_counts": "$$new.legacy_counts", "updated_at": "$$new.updated_at"},
+    {m: {"$add": [
+        {"$subtract": [{"$ifNull": [f"${m}", 0]}, {"$ifNull": [f"$legacy_counts.{m}", 0]}]},
+        f"$$new.{m}",
+    ]} for m in LEGACY_METRICS},
+    {f"{m}_peak": {"$max": [f"${m}_peak", f"$$new.{m}_peak"]} for m in LEGACY_METRICS},
+]}}]
+
+
+def metrics_from_insights(insights: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Flatten a Graph `/insights` response into {metric: latest integer value}."""
+    metrics = {}
+    for insight in insights or []:
+        values = insight.get("values") or []
+        value = values[-1].get("value") if values else None
+        if isinstance(value, (int, float)):
+            metrics[METRIC_ALIASES.get(insight.get("name"), insight.get("name"))] = int(value)
+    return metrics
+
+
+class InsightsStore:
+    """
+    Post metric samples in a Mongo time-series collection, plus per-agent
+    daily and weekly rollups maintained incrementally.
+
+    Graph insights are lifetime counters. Each sample therefore also stores
+    its `delta` against the previous sample of the same post (the last
+    counters are kept per post in `insights_latest`; a post's first sample
+    counts everything up to then). A rollup bucket sums the deltas that fall
+    in it, so buckets hold the activity of their own period and coarser
+    buckets are plain sums of finer ones; each also keeps its busiest
+    day's value as `<metric>_peak`. Recording a sample recomputes only the
+    day and week it falls in (a `$merge` of one bucket each); dashboard
+    reads never touch raw samples.
+
+    Every record also bumps the agent's data version, which the insights
+    endpoint uses for ETags and to invalidate its response cache.
+    """
+
+    # Per-post counter swaps issued concurrently by one record()
+    DELTA_CONCURRENCY = 100
+
+    def __init__(self):
+        database = get_database()
+        self.samples = database[settings.INSIGHTS_TS_COLLECTION]
+        self.latest = database[settings.INSIGHTS_LATEST_COLLECTION]
+        self.daily = database[settings.INSIGHTS_DAILY_COLLECTION]
+        self.weekly = database[settings.INSIGHTS_WEEKLY_COLLECTION]
+        self.versions = database[settings.INSIGHTS_VERSIONS_COLLECTION]
+        self.migrations = database["migrations"]
+
+    async def record(self, samples: Iterable[Tuple[str, str, Dict[str, int]]], ts: Optional[datetime] = None):
+        """Store (agent_id, post_id, metrics) samples and refresh the buckets they touch."""
+        ts = ts or datetime.utcnow()
+        samples = [(agent_id, post_id, metrics) for agent_id, post_id, metrics in samples if metrics]
+        if not samples:
+            return
+
+        docs = []
+        for i in range(0, len(samples), self.DELTA_CONCURRENCY):
+            chunk = samples[i:i + self.DELTA_CONCURRENCY]
+            deltas = await asyncio.gather(*(self._delta(*sample, ts) for sample in chunk))
+            docs.extend(
+                {"ts": ts, "meta": {"agent_id": agent_id, "post_id": post_id}, **metrics, "delta": delta}
+                for (agent_id, post_id, metrics), delta in zip(chunk, deltas)
+            )
+
+        await self.samples.insert_many(docs, ordered=False)
+        for agent_id in {doc["meta"]["agent_id"] for doc in docs}:
+            await self.refresh_rollups(agent_id, ts)
+            await self.versions.update_one(
+                {"_id": agent_id},
+                {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+                upsert=True
+            )
+
+    async def _delta(self, agent_id: str, post_id: str, metrics: Dict[str, int], ts: datetime) -> Dict[str, int]:
+        # Atomic swap of the post's last counters: concurrent records of the
+        # same post each see the other's value, so no delta is counted twice
+        previous = await self.latest.find_one_and_update(
+            {"_id": post_id},
+            {"$set": {**metrics, "agent_id": agent_id, "ts": ts}},
+            projection={metric: 1 for metric in metrics},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        ) or {}
+        return {metric: value - previous.get(metric, 0) for metric, value in metrics.items()}
+
+    async def get_version(self, agent_id: str) -> Tuple[int, Optional[datetime]]:
+        """(version, last update time) of an agent's insights; (0, None) before any sample."""
+        doc = await self.versions.find_one({"_id": agent_id})
+        if not doc:
+            return 0, None
+        return doc.get("version", 0), doc.get("updated_at")
+
+    async def refresh_rollups(self, agent_id: str, ts: datetime):
+        day_start = datetime(ts.year, ts.month, ts.day)
+        # Weeks start on Monday, matching $dateTrunc with startOfWeek "monday"
+        week_start = day_start - timedelta(days=day_start.weekday())
+        await self._merge_bucket(agent_id, "day", day_start, day_start + timedelta(days=1), self.daily)
+        await self._merge_bucket(agent_id, "week", week_start, week_start + timedelta(days=7), self.weekly)
+
+    async def _merge_bucket(self, agent_id: str, unit: str, start: datetime, end: datetime, target):
+        pipeline = [
+            {"$match": {"meta.agent_id": agent_id, "ts": {"$gte": start, "$lt": end}}},
+            # Per-day sums first, so a bucket also records its busiest day
+            {"$group": {
+                "_id": {"$dateTrunc": {"date": "$ts", "unit": "day"}},
+                **{metric: {"$sum": {"$ifNull": [f"$delta.{metric}", 0]}} for metric in ROLLUP_METRICS},
+                "posts": {"$addToSet": "$meta.post_id"},
+            }},
+            {"$group": {
+                "_id": None,
+                **{metric: {"$sum": f"${metric}"} for metric in ROLLUP_METRICS},
+                **{f"{metric}_peak": {"$max": f"${metric}"} for metric in ROLLUP_METRICS},
+                "posts": {"$push": "$posts"},
+            }},
+            {"$project": {
+                "_id": 0,
+                "agent_id": {"$literal": agent_id},
+                "bucket": {"$literal": start},
+                "date": {"$literal": start.strftime("%Y-%m-%d")},
+                "unit": {"$literal": unit},
+                "posts": {"$size": {"$reduce": {
+                    "input": "$posts", "initialValue": [], "in": {"$setUnion": ["$$value", "$$this"]}
+                }}},
+                "updated_at": "$$NOW",
+                **{metric: 1 for metric in ROLLUP_METRICS},
+                **{f"{metric}_peak": 1 for metric in ROLLUP_METRICS},
+            }},
+            {"$merge": {
+                "into": target.name,
+                "on": ["agent_id", "bucket"],
+                "whenMatched": ADD_LEGACY,
+                "whenNotMatched": "insert",
+            }},
+        ]
+        await self.samples.aggregate(pipeline).to_list(length=None)
+
+    async def legacy_backfilled(self) -> bool:
+        """Whether the pre-rollup `facebook_insights` rows have been copied into the rollups."""
+        global _legacy_backfilled
+        if not _legacy_backfilled:
+            _legacy_backfilled = await self.migrations.count_documents(
+                {"_id": LEGACY_BACKFILL_ID, "completed_at": {"$exists": True}}, limit=1
+            ) > 0
+        return _legacy_backfilled
+
+    async def backfill_legacy(self) -> bool:
+        """
+        Copy the per-day rows the dashboards used to aggregate on every read
+        (agent_id, date, likes, comments, shares, impressions in the agents
+        collection) into the daily and weekly rollups, as `legacy_counts`
+        added to what samples contribute to the same buckets. Re-running it
+        replaces the legacy counts rather than adding them again, so it is
+        safe to run at any time and more than once. Every agent it touches
+        gets a new data version, so cached dashboard responses are dropped.
+        Returns False if it had already completed.
+        """
+        if await self.legacy_backfilled():
+            return False
+        legacy = get_db()
+        await legacy.aggregate([
+            {"$match": {
+                "agent_id": {"$exists": True},
+                "date": {"$type": "string"},
+                "$or": [{metric: {"$exists": True}} for metric in LEGACY_METRICS],
+            }},
+            {"$group": {
+                "_id": {"agent_id": "$agent_id", "date": "$date"},
+                **{metric: {"$sum": {"$ifNull": [f"${metric}", 0]}} for metric in LEGACY_METRICS},
+            }},
+            {"$project": {
+                "_id": 0,
+                "agent_id": "$_id.agent_id",
+                "bucket": {"$dateFromString": {"dateString": "$_id.date", "format": "%Y-%m-%d", "onError": None}},
+                "date": "$_id.date",
+                "unit": "day",
+                "legacy": True,
+                "updated_at": "$$NOW",
+                "legacy_counts": {
+                    **{metric: f"${metric}" for metric in LEGACY_METRICS},
+                    **{f"{metric}_peak": f"${metric}" for metric in LEGACY_METRICS},
+                },
+                **{metric: 1 for metric in LEGACY_METRICS},
+                **{f"{metric}_peak": f"${metric}" for metric in LEGACY_METRICS},
+            }},
+            {"$match": {"bucket": {"$ne": None}}},
+            {"$merge": {
+                "into": self.daily.name,
+                "on": ["agent_id", "bucket"],
+                "whenMatched": SET_LEGACY,
+                "whenNotMatched": "insert",
+            }},
+        ]).to_list(length=None)
+
+        await self.daily.aggregate([
+            {"$match": {"legacy": True}},
+            {"$group": {
+                "_id": {
+                    "agent_id": "$agent_id",
+                    "bucket": {"$dateTrunc": {"date": "$bucket", "unit": "week", "startOfWeek": "monday"}},
+                },
+                **{metric: {"$sum": {"$ifNull": [f"$legacy_counts.{metric}", 0]}} for metric in LEGACY_METRICS},
+                **{f"{metric}_peak": {"$max": f"$legacy_counts.{metric}"} for metric in LEGACY_METRICS},
+            }},
+            {"$project": {
+                "_id": 0,
+                "agent_id": "$_id.agent_id",
+                "bucket": "$_id.bucket",
+                "date": {"$dateToString": {"date": "$_id.bucket", "format": "%Y-%m-%d"}},
+                "unit": "week",
+                "legacy": True,
+                "updated_at": "$$NOW",
+                "legacy_counts": {
+                    **{metric: f"${metric}" for metric in LEGACY_METRICS},
+                    **{f"{metric}_peak": f"${metric}_peak" for metric in LEGACY_METRICS},
+                },
+                **{metric: 1 for metric in LEGACY_METRICS},
+                **{f"{metric}_peak": 1 for metric in LEGACY_METRICS},
+            }},
+            {"$merge": {
+                "into": self.weekly.name,
+                "on": ["agent_id", "bucket"],
+                "whenMatched": SET_LEGACY,
+                "whenNotMatched": "insert",
+            }},
+        ]).to_list(length=None)
+
+        now = datetime.utcnow()
+        agent_ids = await self.daily.distinct("agent_id", {"legacy": True})
+        for i in range(0, len(agent_ids), 1000):
+            await self.versions.bulk_write([
+                UpdateOne({"_id": agent_id}, {"$inc": {"version": 1}, "$set": {"updated_at": now}}, upsert=True)
+                for agent_id in agent_ids[i:i + 1000]
+            ], ordered=False)
+
+        await self.migrations.update_one(
+            {"_id": LEGACY_BACKFILL_ID}, {"$set": {"completed_at": datetime.utcnow()}}, upsert=True
+        )
+        logger.info("Backfilled legacy facebook_insights rows into the insights rollups")
+        return True
+
+
+# Set once the backfill is known to have completed; it never un-completes
+_legacy_backfilled = False
+
+
+async def backfill_legacy_insights():
+    """Scheduled job: a no-op once the legacy backfill has completed."""
+    await InsightsStore().backfill_legacy()
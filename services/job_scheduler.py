@@ -0,0 +1,192 @@
+# services/job_scheduler.py
+
+import asyncio
+import logging
+import os
+import random
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledJob(NamedTuple):
+    """
+    A named periodic job.
+
+    `exclusive` jobs run on exactly one instance per period, guarded by a
+    lease; non-exclusive jobs act on process-local state and run on every
+    instance.
+    """
+    name: str
+    func: Callable[[], Awaitable[None]]
+    interval: float
+    jitter: float = 0.0
+    exclusive: bool = True
+
+
+class JobScheduler:
+    """
+    Runs periodic jobs across replicas with Mongo-backed leases.
+
+    Each exclusive job has one document in `job_leases` holding its next
+    due time and the current lease. An instance runs a due job only after
+    atomically taking an expired lease; while running it heartbeats to
+    extend the lease, and a run whose lease is lost is cancelled so two runs
+    never overlap. If the owner dies, its lease expires and another
+    instance picks the job up on its next poll. Every run is recorded in
+    `job_runs` with its duration and outcome.
+    """
+
+    def __init__(self, database: AsyncIOMotorDatabase, lease_seconds: float = 60.0, poll_interval: float = 5.0):
+        self.leases = database[settings.JOB_LEASES_COLLECTION]
+        self.runs = database[settings.JOB_RUNS_COLLECTION]
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs: Dict[str, ScheduledJob] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._local_due: Dict[str, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    def register(self, job: ScheduledJob):
+        self.jobs[job.name] = job
+
+    def start(self):
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Job scheduler {self.owner} started with jobs: {', '.join(self.jobs)}")
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        # Cancelled runs release their leases on the way out
+        for task in list(self._running.values()):
+            task.cancel()
+        await asyncio.gather(*self._running.values(), return_exceptions=True)
+        logger.info(f"Job scheduler {self.owner} stopped")
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            for job in self.jobs.values():
+                if job.name in self._running:
+                    continue  # never overlap runs of the same job
+                try:
+                    if await self._claim(job):
+                        self._running[job.name] = asyncio.create_task(self._execute(job))
+                except Exception as e:
+                    logger.error(f"Failed to schedule job {job.name}: {e}", exc_info=True)
+
+            # Jitter the poll so replicas don't contend in lockstep
+            timeout = self.poll_interval * random.uniform(0.8, 1.2)
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self, job: ScheduledJob) -> bool:
+        now = datetime.utcnow()
+        if not job.exclusive:
+            if self._local_due.get(job.name, now) > now:
+                return False
+            self._local_due[job.name] = self._next_run(job, now)
+            return True
+
+        try:
+            await self.leases.update_one(
+                {"_id": job.name},
+                {"$setOnInsert": {"next_run_at": now, "lease_until": None, "owner": None}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass  # another instance created it concurrently
+
+        lease = await self.leases.find_one_and_update(
+            {
+                "_id": job.name,
+                "next_run_at": {"$lte": now},
+                "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}],
+            },
+            {"$set": {
+                "owner": self.owner,
+                "lease_until": now + timedelta(seconds=self.lease_seconds),
+                "heartbeat_at": now,
+            }},
+            return_document=ReturnDocument.AFTER
+        )
+        return lease is not None
+
+    async def _execute(self, job: ScheduledJob):
+        started_at = datetime.utcnow()
+        status, error = "succeeded", None
+        run = asyncio.create_task(job.func())
+        heartbeat = asyncio.create_task(self._heartbeat(job, run)) if job.exclusive else None
+        try:
+            await run
+        except asyncio.CancelledError:
+            status, error = "cancelled", "lease lost or scheduler stopped"
+        except Exception as e:
+            status, error = "failed", str(e)
+            logger.error(f"Job {job.name} failed: {e}", exc_info=True)
+        finally:
+            if heartbeat is not None:
+                heartbeat.cancel()
+            if not run.done():
+                run.cancel()
+
+        finished_at = datetime.utcnow()
+        try:
+            if job.exclusive:
+                # A cancelled run stays due so whoever takes over runs it again
+                update = {"lease_until": None, "owner": None, "last_status": status, "last_finished_at": finished_at}
+                if status != "cancelled":
+                    update["next_run_at"] = self._next_run(job, started_at)
+                await self.leases.update_one({"_id": job.name, "owner": self.owner}, {"$set": update})
+            await self.runs.insert_one({
+                "job": job.name,
+                "owner": self.owner,
+                "started_at": started_at,
+                "finished_at": finished_at,
+                "duration_ms": round((finished_at - started_at).total_seconds() * 1000, 1),
+                "status": status,
+                "error": error,
+            })
+        except Exception as e:
+            logger.error(f"Failed to record run of job {job.name}: {e}", exc_info=True)
+        finally:
+            self._running.pop(job.name, None)
+        logger.info(f"Job {job.name} {status} in {(finished_at - started_at).total_seconds():.1f}s")
+
+    async def _heartbeat(self, job: ScheduledJob, run: asyncio.Task):
+        while not run.done():
+            await asyncio.sleep(self.lease_seconds / 3)
+            now = datetime.utcnow()
+            try:
+                result = await self.leases.update_one(
+                    {"_id": job.name, "owner": self.owner},
+                    {"$set": {"lease_until": now + timedelta(seconds=self.lease_seconds), "heartbeat_at": now}}
+                )
+            except Exception as e:
+                # Keep running; the lease only lapses if heartbeats keep failing
+                logger.warning(f"Heartbeat for job {job.name} failed: {e}")
+                continue
+            if not result.matched_count:
+                logger.warning(f"Lost lease on job {job.name}; cancelling this run")
+                run.cancel()
+                return
+
+    @staticmethod
+    def _next_run(job: ScheduledJob, started_at: datetime) -> datetime:
+        return started_at + timedelta(seconds=job.interval + random.uniform(0, job.jitter))
@@ -9,10 +9,14 @@ from pydantic import BaseModel, Field
 from enum import Enum
 from fastapi import HTTPException, Depends
 from services.social_media.token_service import FacebookTokenService
+from services.image_encoder import get_image_encoder
 from db.session import get_db
 
 logger = logging.getLogger(__name__)
 
+# Largest size Facebook displays; anything bigger is downscaled by Facebook anyway
+FACEBOOK_UPLOAD_DIMENSIONS = (2048, 2048)
+
 # Corrected PostStatus Enum
 class PostStatus(str, Enum):
     PUBLISHED = "published"
@@ -83,7 +87,16 @@ async def create_facebook_post(
         logger.info(f"Attempting to open image from absolute path: {absolute_image_path}")
 
         try:
-            with open(absolute_image_path, "rb") as file_obj:
+            if not os.path.exists(absolute_image_path):
+                raise FileNotFoundError(absolute_image_path)
+            # Upload a size-optimized, metadata-free copy rather than the original
+            try:
+                upload_path = (await get_image_encoder().optimize(absolute_image_path, FACEBOOK_UPLOAD_DIMENSIONS)).path
+            except Exception as e:
+                logger.warning(f"Could not optimize {absolute_image_path}, uploading original: {e}")
+                upload_path = absolute_image_path
+
+            with open(upload_path, "rb") as file_obj:
                 files = {"source": file_obj}
                 # Upload to /photos endpoint with published=false to get a media_id
                 upload_url = f"{base_url}/{page_id}/photos?access_token={access_token}&published=false"
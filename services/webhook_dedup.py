@@ -0,0 +1,103 @@
+# services/webhook_dedup.py
+
+import hashlib
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+from datetime import datetime
+from typing import Any, Dict, List
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import BulkWriteError
+
+from core.config import settings
+from db.session import get_database
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookDeduplicator:
+    """
+    Reject repeated webhook deliveries and changes.
+
+    A bounded in-process LRU answers repeat lookups in O(1); misses fall
+    through to a Mongo collection whose unique `_id` is the dedup key and
+    whose TTL index (declared in db/indexes.py) forgets keys once Facebook's retry window has passed.
+    The Mongo layer is what makes dedup hold across replicas.
+    """
+
+    def __init__(self, collection: AsyncIOMotorCollection, lru_size: int = 100_000):
+        self.collection = collection
+        self.lru_size = lru_size
+        self._lru: "OrderedDict[str, None]" = OrderedDict()
+
+    @staticmethod
+    def change_key(entry: Dict[str, Any], change: Dict[str, Any]) -> str:
+        # The entry's `time` is the same across Facebook's retries of one
+        # delivery but differs between genuine repeats of a verb on a post
+        # (hide, unhide, hide), whose `created_time` can be the post's own
+        value = change.get("value") or {}
+        parts = (
+            entry.get("id"),
+            entry.get("time"),
+            change.get("field"),
+            value.get("item"),
+            value.get("verb"),
+            value.get("post_id"),
+            value.get("comment_id"),
+            value.get("created_time"),
+        )
+        raw = "|".join("" if p is None else str(p) for p in parts)
+        return "change:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def delivery_key(signature: str) -> str:
+        # The verified X-Hub-Signature-256 is already a SHA-256 HMAC of the
+        # signed body, so it identifies the delivery without rehashing.
+        return "delivery:" + signature
+
+    def _remember(self, key: str):
+        self._lru[key] = None
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    async def unseen(self, keys: List[str]) -> List[str]:
+        """
+        The keys of `keys` not recorded yet, in order and without repeats.
+        Read-only: record them with `mark_seen` once their work has been
+        applied, so work interrupted in between is not dropped on retry.
+        """
+        unknown = list(dict.fromkeys(k for k in keys if k not in self._lru))
+        if not unknown:
+            return []
+        recorded = set()
+        async for doc in self.collection.find({"_id": {"$in": unknown}}, {"_id": 1}):
+            recorded.add(doc["_id"])
+            self._remember(doc["_id"])
+        return [key for key in unknown if key not in recorded]
+
+    async def mark_seen(self, keys: List[str]):
+        """Record a batch of keys with one round trip; keys recorded meanwhile are fine."""
+        if not keys:
+            return
+        now = datetime.utcnow()
+        try:
+            await self.collection.insert_many(
+                [{"_id": key, "created_at": now} for key in dict.fromkeys(keys)],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+        for key in keys:
+            self._remember(key)
+
+
+@lru_cache(maxsize=None)
+def get_webhook_deduplicator() -> WebhookDeduplicator:
+    """Process-wide deduplicator, so the endpoint and the consumers share one LRU."""
+    return WebhookDeduplicator(
+        get_database()[settings.WEBHOOK_DEDUP_COLLECTION],
+        lru_size=settings.WEBHOOK_DEDUP_LRU_SIZE,
+    )
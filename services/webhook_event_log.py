@@ -0,0 +1,277 @@
+# services/webhook_event_log.py
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+import zlib
+from functools import lru_cache
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from bson.objectid import ObjectId
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from core.config import settings
+from db.session import get_webhook_log
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookEventLog:
+    """
+    Durable, append-only log of verified Facebook webhook deliveries.
+
+    Each delivery becomes one document whose ObjectId `_id` doubles as its
+    offset. Events are spread across a fixed number of partitions (by page
+    id) so several consumers can drain the log in parallel while each page's
+    events are still applied in order.
+
+    Events expire `retention` seconds after they are received (TTL index on
+    `expires_at`). Events that could not be applied are copied to
+    `<collection>_dead_letters`, which expire after the same time.
+    """
+
+    def __init__(self, collection: AsyncIOMotorCollection, partitions: int, retention: float):
+        self.collection = collection
+        self.checkpoints = collection.database[f"{collection.name}_checkpoints"]
+        self.dead_letters = collection.database[f"{collection.name}_dead_letters"]
+        self.partitions = max(1, partitions)
+        self.retention = retention
+
+    def partition_for(self, payload: Dict[str, Any]) -> int:
+        entries = payload.get("entry") or [{}]
+        page_id = str(entries[0].get("id", ""))
+        return zlib.crc32(page_id.encode("utf-8")) % self.partitions
+
+    async def append(self, payload: Dict[str, Any]) -> ObjectId:
+        """Persist a verified delivery. This is the only write on the request path."""
+        now = datetime.utcnow()
+        event = {
+            "_id": ObjectId(),
+            "partition": self.partition_for(payload),
+            "object": payload.get("object"),
+            "entry": payload.get("entry", []),
+            "received_at": now,
+            "expires_at": now + timedelta(seconds=self.retention),
+        }
+        await self.collection.insert_one(event)
+        return event["_id"]
+
+    async def read_batch(
+        self,
+        partition: int,
+        after: Optional[ObjectId],
+        limit: int,
+        settle_seconds: float = 0.0
+    ) -> List[Dict[str, Any]]:
+        """
+        Return up to `limit` events of a partition with an offset past `after`.
+
+        ObjectIds are generated by the writing replica, so two replicas can
+        append slightly out of order. Events younger than `settle_seconds` are
+        left for the next poll so a late insert is never skipped by a
+        checkpoint that already moved past it.
+        """
+        query: Dict[str, Any] = {"partition": partition}
+        id_range: Dict[str, Any] = {}
+        if after is not None:
+            id_range["$gt"] = after
+        if settle_seconds > 0:
+            cutoff = datetime.utcnow() - timedelta(seconds=settle_seconds)
+            id_range["$lte"] = ObjectId.from_datetime(cutoff)
+        if id_range:
+            query["_id"] = id_range
+
+        cursor = self.collection.find(query).sort("_id", 1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def claim(self, consumer: str, owner: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """
+        Take or renew the lease on a consumer's checkpoint. Returns the
+        checkpoint document, or None while another owner's lease is live.
+        """
+        now = datetime.utcnow()
+        try:
+            return await self.checkpoints.find_one_and_update(
+                {"_id": consumer, "$or": [
+                    {"owner": owner},
+                    {"lease_until": None},  # also matches a missing field
+                    {"lease_until": {"$lt": now}},
+                ]},
+                {"$set": {"owner": owner, "lease_until": now + timedelta(seconds=lease_seconds)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return None  # the checkpoint exists and is leased by another owner
+
+    async def release(self, consumer: str, owner: str):
+        await self.checkpoints.update_one({"_id": consumer, "owner": owner}, {"$set": {"lease_until": None}})
+
+    async def save_checkpoint(self, consumer: str, offset: ObjectId, owner: str, lease_seconds: float) -> bool:
+        """Advance the checkpoint and renew the lease; False if `owner` no longer holds it."""
+        now = datetime.utcnow()
+        result = await self.checkpoints.update_one(
+            {"_id": consumer, "owner": owner},
+            {"$set": {
+                "offset": offset,
+                "updated_at": now,
+                "lease_until": now + timedelta(seconds=lease_seconds),
+            }}
+        )
+        return result.matched_count > 0
+
+    async def dead_letter(self, consumer: str, event: Dict[str, Any], error: str, attempts: int):
+        now = datetime.utcnow()
+        await self.dead_letters.replace_one(
+            {"_id": event["_id"]},
+            {
+                **event,
+                "consumer": consumer,
+                "error": error,
+                "attempts": attempts,
+                "dead_lettered_at": now,
+                "expires_at": now + timedelta(seconds=self.retention),
+            },
+            upsert=True
+        )
+
+
+class WebhookEventConsumer:
+    """
+    Pool of background workers draining a WebhookEventLog.
+
+    Across all replicas, each partition is drained by one worker at a time:
+    the worker that holds the lease on that partition's checkpoint. Leases
+    are renewed by every checkpoint write (and while idle). Checkpoint
+    writes only succeed for the lease holder. A dead replica's partitions
+    are taken over once its leases lapse.
+
+    A worker reads a batch past its checkpoint, hands it to the handler and
+    only then advances the checkpoint, so a crash replays at most the batch
+    that was in flight. A failing batch is retried with backoff up to
+    `max_attempts` times. After that its events are applied one by one, and
+    those that still fail are dead-lettered, so one bad event cannot block
+    its partition.
+    """
+
+    def __init__(
+        self,
+        log: WebhookEventLog,
+        handler,
+        batch_size: int = 100,
+        poll_interval: float = 0.5,
+        settle_seconds: float = 1.0,
+        lease_seconds: float = 30.0,
+        max_attempts: int = 5
+    ):
+        self.log = log
+        self.handler = handler
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+
+    def start(self):
+        if self._tasks:
+            return
+        self._stopping.clear()
+        for partition in range(self.log.partitions):
+            self._tasks.append(asyncio.create_task(self._run(partition)))
+        logger.info(f"Started {len(self._tasks)} webhook consumer workers as {self.owner}")
+
+    async def stop(self):
+        self._stopping.set()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Webhook consumer workers stopped")
+
+    async def _run(self, partition: int):
+        consumer = f"webhook-consumer-{partition}"
+        owned = False
+        offset: Optional[ObjectId] = None
+        renew_at = datetime.min
+        attempts = 0
+
+        while not self._stopping.is_set():
+            delay = self.poll_interval
+            try:
+                if not owned or datetime.utcnow() >= renew_at:
+                    checkpoint = await self.log.claim(consumer, self.owner, self.lease_seconds)
+                    if checkpoint is None:
+                        if owned:
+                            logger.warning(f"Lost the lease on {consumer}")
+                        owned = False
+                        await self._wait(self.lease_seconds / 3)
+                        continue
+                    if not owned:
+                        logger.info(f"Took the lease on {consumer}")
+                        offset, attempts = checkpoint.get("offset"), 0
+                    owned = True
+                    renew_at = datetime.utcnow() + timedelta(seconds=self.lease_seconds / 3)
+
+                batch = await self.log.read_batch(
+                    partition, offset, self.batch_size, self.settle_seconds
+                )
+                if batch:
+                    try:
+                        await self.handler.process_batch(batch)
+                    except Exception as e:
+                        attempts += 1
+                        if attempts < self.max_attempts:
+                            raise
+                        logger.error(f"Webhook consumer {consumer} gave up on a batch after {attempts} attempts: {e}")
+                        await self._apply_individually(consumer, batch, attempts)
+                    attempts = 0
+
+                    if not await self.log.save_checkpoint(consumer, batch[-1]["_id"], self.owner, self.lease_seconds):
+                        logger.warning(f"Lost the lease on {consumer}; its new owner replays from the checkpoint")
+                        owned = False
+                        continue
+                    offset = batch[-1]["_id"]
+                    renew_at = datetime.utcnow() + timedelta(seconds=self.lease_seconds / 3)
+                    if len(batch) == self.batch_size:
+                        continue  # backlog: keep draining without sleeping
+            except Exception as e:
+                logger.error(f"Webhook consumer {consumer} failed: {e}", exc_info=True)
+                delay = min(30.0, self.poll_interval * 2 ** attempts)
+
+            await self._wait(delay)
+
+        if owned:
+            try:
+                await self.log.release(consumer, self.owner)
+            except Exception as e:
+                logger.warning(f"Failed to release the lease on {consumer}: {e}")
+
+    async def _apply_individually(self, consumer: str, batch: List[Dict[str, Any]], attempts: int):
+        for event in batch:
+            try:
+                await self.handler.process_batch([event])
+            except Exception as e:
+                logger.error(f"Dead-lettering webhook event {event['_id']} from {consumer}: {e}")
+                await self.log.dead_letter(consumer, event, str(e), attempts)
+
+    async def _wait(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+@lru_cache(maxsize=None)
+def get_webhook_event_log() -> WebhookEventLog:
+    return WebhookEventLog(
+        get_webhook_log(),
+        settings.WEBHOOK_CONSUMER_PARTITIONS,
+        settings.WEBHOOK_LOG_RETENTION_SECONDS
+    )
@@ -1,45 +1,218 @@
+
 import asyncio
 import logging
 from datetime import datetime, timedelta
-from services.social_media.facebook_manager import facebook_manager
-from services.social_media.token_service import token_service
-from db.session import get_db
+from typing import Any, Dict
+
+import httpx
+
+from core.config import settings
+from services.facebook_analytics import FacebookAnalytics
+from services.social_media.token_service import FacebookTokenService
+from services.insights_store import InsightsStore, metrics_from_insights
+from services.engagement_schedule import next_engagement_sync
+from db.facebook_repository import FacebookRepository
+from db.session import get_database, get_db, get_posts_collection
 
 logger = logging.getLogger(__name__)
 
 class FacebookSync:
     def __init__(self):
-        self.db = get_db().agents
+        self.db = get_db()
+        self.posts = get_posts_collection()
+        self.repository = FacebookRepository(self.db, self.posts)
+        self.token_service = FacebookTokenService(self.db)
+        self.analytics = FacebookAnalytics(self.db)
+        self.insights = InsightsStore()
+        self.page_cursors = get_database()[settings.PAGE_SYNC_CURSORS_COLLECTION]
 
     async def refresh_all_tokens(self):
-        agents = self.db.find({"facebook.token.expires_at": {
-            "$lt": datetime.now() + timedelta(days=7)
-        }})
-        
+        agents = self.db.find({"expires_at": {
+            "$lt": datetime.utcnow() + timedelta(days=7)
+        }}, {"_id": 1})
+
         async for agent in agents:
             try:
-                await token_service.get_valid_token(agent['_id'])
+                await self.token_service.get_valid_token(agent['_id'])
             except Exception as e:
                 logger.error(f"Failed to refresh token for agent {agent['_id']}: {str(e)}")
 
-    async def sync_post_engagements(self):
-        agents = self.db.find({"facebook.posts.status": "published"})
-        
-        async for agent in agents:
-            for post in agent.get('facebook', {}).get('posts', []):
-                if post['status'] == 'published':
-                    try:
-                        insights = await facebook_manager.get_post_insights(post['post_id'])
-                        await self.db.update_one(
-                            {"_id": agent['_id'], "facebook.posts.post_id": post['post_id']},
-                            {"$set": {"facebook.posts.$.engagement": insights}}
-                        )
-                    except Exception as e:
-                        logger.error(f"Failed to sync insights for post {post['post_id']}: {str(e)}")
-
-    async def run_scheduled_tasks(self):
-        while True:
-            await self.refresh_all_tokens()
-            await self.sync_post_engagements()
-            await asyncio.sleep(3600)  # Run hourly
+    async def sync_post_engagements(self) -> int:
+        """
+        Refresh engagement for published posts whose `next_sync_at` is due.
+
+        Posts are refreshed on a decaying schedule (services/engagement_schedule.py):
+        every 15 minutes on their first day, hourly for a week, daily up to
+        90 days, then never. Due posts are read from the
+        (status, next_sync_at) index and fetched by a bounded pool of
+        workers sharing one HTTP client. Returns the number of posts synced.
+        """
+        now = datetime.utcnow()
+        await self._schedule_unscheduled(now)
+
+        cursor = self.posts.find(
+            {"status": "published", "next_sync_at": {"$lte": now}},
+            {"_id": 0, "post_id": 1, "agent_id": 1, "created_at": 1}
+        ).sort("next_sync_at", 1).limit(settings.ENGAGEMENT_SYNC_MAX_POSTS)
+
+        concurrency = settings.ENGAGEMENT_SYNC_CONCURRENCY
+        queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+        tokens: Dict[str, asyncio.Task] = {}
+        samples = []
+        synced = 0
+
+        async def sync_post(client: httpx.AsyncClient, post: Dict[str, Any]):
+            nonlocal synced
+            agent_id = post['agent_id']
+            # One token lookup per agent, shared by that agent's concurrent posts
+            if agent_id not in tokens:
+                tokens[agent_id] = asyncio.ensure_future(self.token_service.get_valid_token(agent_id))
+            token = await tokens[agent_id]
+            # Raises on API errors, so a failed fetch neither overwrites the
+            # stored engagement nor pushes the post's next sync back
+            insights = await self.analytics.get_post_insights(
+                post['post_id'], token, client=client, raise_errors=True
+            )
+            samples.append((agent_id, post['post_id'], metrics_from_insights(insights)))
+            await self.repository.set_post_fields(post['post_id'], {
+                "engagement": insights,
+                "next_sync_at": next_engagement_sync(post.get('created_at'), now),
+            }, agent_id=agent_id)
+            synced += 1
+
+        async def worker(client: httpx.AsyncClient):
+            while True:
+                post = await queue.get()
+                try:
+                    if post is None:
+                        return
+                    await sync_post(client, post)
+                except Exception as e:
+                    # Left due: retried on the next run
+                    logger.error(f"Failed to sync insights for post {post['post_id']}: {str(e)}")
+                finally:
+                    queue.task_done()
+
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            workers = [asyncio.create_task(worker(client)) for _ in range(concurrency)]
+            try:
+                async for post in cursor:
+                    await queue.put(post)
+            finally:
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+
+        # One insert plus one day/week bucket refresh per agent
+        await self.insights.record(samples)
+        logger.info(f"Synced engagement for {synced} due posts")
+        return synced
+
+    async def sync_page_engagements(self) -> int:
+        """
+        Page-centric variant of sync_post_engagements.
+
+        For each agent with due posts, one paged `/{page_id}/posts` request
+        with inline insights reaches back to the oldest due post, replacing
+        a request per post. Paging resumes from the cursor stored in
+        `page_sync_cursors` (per agent and page) if the previous run was cut
+        short; the cursor only advances past pages whose posts are stored.
+        Due posts the page no longer returns are rescheduled anyway so they
+        don't force deep fetches on every run. Returns the number of posts synced.
+        """
+        now = datetime.utcnow()
+        await self._schedule_unscheduled(now)
+        agent_ids = await self.posts.distinct(
+            "agent_id", {"status": "published", "next_sync_at": {"$lte": now}}
+        )
+
+        semaphore = asyncio.Semaphore(settings.ENGAGEMENT_SYNC_CONCURRENCY)
+        samples = []
+
+        async def sync_agent(client: httpx.AsyncClient, agent_id: str) -> int:
+            async with semaphore:
+                try:
+                    return await self._sync_agent_page(client, agent_id, now, samples)
+                except Exception as e:
+                    logger.error(f"Failed to sync page insights for agent {agent_id}: {str(e)}")
+                    return 0
+
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            counts = await asyncio.gather(*(sync_agent(client, agent_id) for agent_id in agent_ids))
+
+        await self.insights.record(samples)
+        logger.info(f"Synced engagement for {sum(counts)} due posts across {len(agent_ids)} pages")
+        return sum(counts)
+
+    async def _sync_agent_page(self, client: httpx.AsyncClient, agent_id: str, now: datetime, samples: list) -> int:
+        due = {
+            post['post_id']: post.get('created_at')
+            async for post in self.posts.find(
+                {"agent_id": agent_id, "status": "published", "next_sync_at": {"$lte": now}},
+                {"_id": 0, "post_id": 1, "created_at": 1}
+            )
+        }
+        if not due:
+            return 0
+        page = await self.token_service.get_page_token_for_agent(agent_id)
+        since = min((created for created in due.values() if created), default=now) - timedelta(minutes=5)
+
+        # Every agent may be connected to the same page, so cursors are per agent and page
+        cursor_id = f"{agent_id}:{page.page_id}"
+        # Resume an interrupted run reaching at least as far back
+        stored = await self.page_cursors.find_one({"_id": cursor_id})
+        after = None
+        if stored and stored.get("after") and stored.get("since") and stored["since"] <= since:
+            since, after = stored["since"], stored["after"]
+        resumed = after is not None
+
+        synced = 0
+        async for posts, cursor in self.analytics.iter_page_posts_insights(
+            page.page_id, page.access_token, since, after=after, client=client
+        ):
+            writes = []
+            for post in posts:
+                if post['post_id'] not in due:
+                    continue
+                created_at = due.pop(post['post_id'])
+                samples.append((agent_id, post['post_id'], metrics_from_insights(post['insights'])))
+                writes.append(self.repository.set_post_fields(post['post_id'], {
+                    "engagement": post['insights'],
+                    "next_sync_at": next_engagement_sync(created_at, now),
+                }, agent_id=agent_id))
+            # The cursor only moves past a page once its posts are stored
+            await asyncio.gather(*writes)
+            synced += len(writes)
+            await self.page_cursors.update_one(
+                {"_id": cursor_id},
+                {"$set": {"since": since, "after": cursor, "updated_at": datetime.utcnow()}},
+                upsert=True
+            )
+            if not due:
+                break
+
+        # Not returned by the page (removed, or outside the window): move on.
+        # A resumed run skipped the pages before its cursor, so its leftovers
+        # stay due for the next, complete run.
+        if not resumed:
+            await asyncio.gather(*(
+                self.repository.set_post_fields(
+                    post_id, {"next_sync_at": next_engagement_sync(created_at, now)}, agent_id=agent_id
+                )
+                for post_id, created_at in due.items()
+            ))
+        await self.page_cursors.update_one({"_id": cursor_id}, {"$set": {"after": None}})
+        return synced
+
+    async def _schedule_unscheduled(self, now: datetime):
+        # Posts logged before tiering (or migrated) have no due time yet
+        await self.posts.update_many(
+            {"status": "published", "next_sync_at": {"$exists": False}},
+            {"$set": {"next_sync_at": now}}
+        )
 
+    async def sync_engagements(self) -> int:
+        """Engagement sync in the configured mode; run periodically by the job scheduler."""
+        if settings.ENGAGEMENT_SYNC_MODE == "page":
+            return await self.sync_page_engagements()
+        return await self.sync_post_engagements()
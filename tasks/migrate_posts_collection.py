@@ -0,0 +1,92 @@
+# tasks/migrate_posts_collection.py
+#
+# Copy posts out of the agent documents' `facebook.posts` arrays into the
+# dedicated posts collection. Safe to run while the app is serving traffic
+# and safe to interrupt: progress is checkpointed per agent and re-running
+# resumes after the last completed agent.
+#
+#     python -m tasks.migrate_posts_collection [--batch-size 500] [--prune] [--restart]
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from db.indexes import apply_indexes
+from db.session import get_database, get_db, get_posts_collection
+from logging_config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_ID = "facebook_posts_collection"
+
+
+async def migrate(batch_size: int = 500, prune: bool = False, restart: bool = False):
+    agents = get_db()
+    posts = get_posts_collection()
+    migrations = get_database()["migrations"]
+
+    await apply_indexes()
+
+    if restart:
+        await migrations.delete_one({"_id": MIGRATION_ID})
+    state = await migrations.find_one({"_id": MIGRATION_ID}) or {}
+    last_agent_id = state.get("last_agent_id")
+    copied = state.get("copied", 0)
+
+    query = {"facebook.posts.0": {"$exists": True}}
+    if last_agent_id is not None:
+        query["_id"] = {"$gt": last_agent_id}
+
+    cursor = agents.find(query, {"facebook.posts": 1}).sort("_id", 1).batch_size(batch_size)
+    async for agent in cursor:
+        ops = []
+        for post in agent.get("facebook", {}).get("posts", []):
+            if not post.get("post_id"):
+                continue
+            post.setdefault("agent_id", agent["_id"])
+            # $setOnInsert: a post already written to the new collection by
+            # the running app is newer than the array copy and wins. Each
+            # agent keeps its own copy of a post shared through a page.
+            ops.append(UpdateOne(
+                {"agent_id": post["agent_id"], "post_id": post["post_id"]}, {"$setOnInsert": post}, upsert=True
+            ))
+
+        for i in range(0, len(ops), batch_size):
+            result = await posts.bulk_write(ops[i:i + batch_size], ordered=False)
+            copied += result.upserted_count
+
+        if prune:
+            await agents.update_one({"_id": agent["_id"]}, {"$unset": {"facebook.posts": ""}})
+
+        await migrations.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"last_agent_id": agent["_id"], "copied": copied, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+        logger.info(f"Migrated posts for agent {agent['_id']} ({copied} copied so far)")
+
+    await migrations.update_one(
+        {"_id": MIGRATION_ID},
+        {"$set": {"completed_at": datetime.utcnow(), "copied": copied}},
+        upsert=True
+    )
+    logger.info(f"Posts migration complete: {copied} posts copied")
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move facebook.posts arrays into the posts collection")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--prune", action="store_true", help="Remove the array from each agent once copied")
+    parser.add_argument("--restart", action="store_true", help="Ignore the stored checkpoint")
+    args = parser.parse_args()
+
+    configure_logging()
+    asyncio.run(migrate(args.batch_size, args.prune, args.restart))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# tasks/replay_webhooks.py
+#
+# Rebuild post state from the durable webhook event log.
+#
+#     python -m tasks.replay_webhooks --since 2024-05-01 --until 2024-05-08 \
+#         [--page 1234567890] [--dry-run] [--skip-engagement] [--engagement-concurrency 8]
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from core.config import settings
+from db.session import get_posts_collection, get_webhook_log
+from logging_config import configure_logging
+from services.facebook_webhook_handler import POST_STATUS_BY_VERB, WebhookHandler
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookReplayer:
+    """
+    Stream stored webhook events through the handler's coalescing logic and
+    apply the resulting post state in bulk.
+
+    Replay is idempotent: it only ever `$set`s each post to the status implied
+    by the latest verb seen for it, so running it twice over the same range
+    is harmless. Deduplication and debouncing are bypassed on purpose;
+    engagement refreshes for commented posts run `engagement_concurrency`
+    at a time.
+    Posts are read from the posts collection, so run it after
+    tasks/migrate_posts_collection.py has completed.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 1000,
+        dry_run: bool = False,
+        skip_engagement: bool = False,
+        engagement_concurrency: int = settings.ENGAGEMENT_REFRESH_CONCURRENCY
+    ):
+        self.log = get_webhook_log()
+        self.posts = get_posts_collection()
+        self.handler = WebhookHandler()
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.skip_engagement = skip_engagement
+        self.engagement_concurrency = engagement_concurrency
+
+    def _query(self, since: Optional[datetime], until: Optional[datetime], page_id: Optional[str]) -> Dict[str, Any]:
+        query: Dict[str, Any] = {}
+        received: Dict[str, Any] = {}
+        if since:
+            received["$gte"] = since
+        if until:
+            received["$lt"] = until
+        if received:
+            query["received_at"] = received
+        if page_id:
+            query["entry.id"] = page_id
+        return query
+
+    async def _collect(self, query: Dict[str, Any]) -> tuple:
+        """Fold the event stream into the final verb and comment flag per post."""
+        statuses: Dict[str, str] = {}
+        commented = set()
+        events = 0
+
+        cursor = self.log.find(query, {"entry": 1}).sort("_id", 1).batch_size(self.batch_size)
+        batch: List[Dict[str, Any]] = []
+        async for event in cursor:
+            batch.append(event)
+            if len(batch) >= self.batch_size:
+                events += self._fold(batch, statuses, commented)
+                batch = []
+        if batch:
+            events += self._fold(batch, statuses, commented)
+
+        return events, statuses, commented
+
+    def _fold(self, batch, statuses: Dict[str, str], commented: set) -> int:
+        for post_id, changes in self.handler.coalesce(batch).items():
+            status = POST_STATUS_BY_VERB.get(changes["verb"])
+            if status:
+                statuses[post_id] = status
+            if changes["comments"]:
+                commented.add(post_id)
+        return len(batch)
+
+    async def _current_statuses(self, post_ids: List[str]) -> Dict[str, Optional[str]]:
+        current: Dict[str, Optional[str]] = {}
+        for i in range(0, len(post_ids), self.batch_size):
+            chunk = post_ids[i:i + self.batch_size]
+            cursor = self.posts.find(
+                {"post_id": {"$in": chunk}},
+                {"_id": 0, "post_id": 1, "status": 1}
+            )
+            async for post in cursor:
+                current[post["post_id"]] = post.get("status")
+        return current
+
+    async def _apply_statuses(self, statuses: Dict[str, str]) -> int:
+        modified = 0
+        items = list(statuses.items())
+        for i in range(0, len(items), self.batch_size):
+            ops = [
+                UpdateOne({"post_id": post_id}, {"$set": {"status": status}})
+                for post_id, status in items[i:i + self.batch_size]
+            ]
+            result = await self.posts.bulk_write(ops, ordered=False)
+            modified += result.modified_count
+        return modified
+
+    async def _refresh_engagement(self, post_ids: List[str]) -> int:
+        """Refetch insights for `post_ids` with bounded concurrency; returns how many failed."""
+        slots = asyncio.Semaphore(self.engagement_concurrency)
+
+        async def refresh(post_id: str) -> bool:
+            async with slots:
+                try:
+                    await self.handler.refresh_engagement(post_id)
+                    return True
+                except Exception as e:
+                    logger.error(f"Engagement refresh failed for {post_id}: {e}")
+                    return False
+
+        results = await asyncio.gather(*(refresh(post_id) for post_id in post_ids))
+        return results.count(False)
+
+    async def run(self, since: Optional[datetime], until: Optional[datetime], page_id: Optional[str]) -> Dict[str, Any]:
+        events, statuses, commented = await self._collect(self._query(since, until, page_id))
+        logger.info(f"Replayed {events} events touching {len(statuses.keys() | commented)} posts")
+
+        current = await self._current_statuses(list(statuses))
+        diffs = {
+            post_id: (current.get(post_id), status)
+            for post_id, status in statuses.items()
+            if post_id in current and current[post_id] != status
+        }
+        report = {
+            "events": events,
+            "status_diffs": diffs,
+            "missing_posts": sorted(set(statuses) - set(current)),
+            "engagement_refreshes": len(commented),
+        }
+        if self.dry_run:
+            return report
+
+        report["modified"] = await self._apply_statuses({p: statuses[p] for p in diffs})
+        if not self.skip_engagement:
+            report["engagement_failures"] = await self._refresh_engagement(sorted(commented))
+        return report
+
+
+def _parse_date(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay stored webhook events to rebuild post state")
+    parser.add_argument("--since", type=_parse_date, help="ISO date/time, inclusive")
+    parser.add_argument("--until", type=_parse_date, help="ISO date/time, exclusive")
+    parser.add_argument("--page", help="Only replay events for this Facebook page id")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="Report the diffs without writing")
+    parser.add_argument("--skip-engagement", action="store_true", help="Do not refetch insights for commented posts")
+    parser.add_argument(
+        "--engagement-concurrency", type=int, default=settings.ENGAGEMENT_REFRESH_CONCURRENCY,
+        help="Engagement refreshes run at once"
+    )
+    args = parser.parse_args()
+
+    configure_logging()
+    replayer = WebhookReplayer(args.batch_size, args.dry_run, args.skip_engagement, args.engagement_concurrency)
+    report = asyncio.run(replayer.run(args.since, args.until, args.page))
+
+    for post_id, (old, new) in sorted(report["status_diffs"].items()):
+        print(f"{post_id}: {old} -> {new}")
+    for post_id in report["missing_posts"]:
+        print(f"{post_id}: not found")
+    print(
+        f"{report['events']} events, {len(report['status_diffs'])} status changes, "
+        f"{report['engagement_refreshes']} engagement refreshes"
+        + ("" if args.dry_run else f", {report['modified']} posts modified")
+        + (f", {report['engagement_failures']} refreshes failed" if "engagement_failures" in report else "")
+    )
+
+
+if __name__ == "__main__":
+    main()
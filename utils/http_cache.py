@@ -0,0 +1,135 @@
+# utils/http_cache.py
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, NamedTuple, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+
+class CachedResponse(NamedTuple):
+    body: Any
+    etag: str
+    last_modified: Optional[datetime]
+    headers: Dict[str, str]
+    stored_at: float
+
+
+class ResponseCache:
+    """
+    Short-TTL cache of endpoint payloads with request coalescing.
+
+    Entries are keyed by the caller (agent, range, ...) and tagged with a
+    data version: an entry is served while it is younger than `ttl` and its
+    version still matches. Concurrent misses for the same key await a single
+    computation instead of each running their own query.
+
+    When the caller has no data version, the ETag is derived from the
+    payload itself, which still lets clients revalidate with a 304.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def get(
+        self,
+        key: Hashable,
+        compute: Callable[[], Awaitable[Tuple[Any, Dict[str, str]]]],
+        version: Any = None,
+        last_modified: Optional[datetime] = None
+    ) -> CachedResponse:
+        """
+        Cached entry for `key`, computing it when missing, expired or stale.
+
+        `compute` returns the payload and any extra response headers.
+        """
+        entry = self._entries.get(key)
+        if entry and time.monotonic() - entry.stored_at < self.ttl and (
+            version is None or entry.etag == _etag(key, version)
+        ):
+            self._entries.move_to_end(key)
+            return entry
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            body, headers = await compute()
+            body = jsonable_encoder(body)
+            entry = CachedResponse(
+                body=body,
+                etag=_etag(key, version) if version is not None else _etag(key, body),
+                last_modified=last_modified,
+                headers=headers,
+                stored_at=time.monotonic(),
+            )
+            self._store(key, entry)
+            future.set_result(entry)
+            return entry
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            del self._inflight[key]
+
+    def _store(self, key: Hashable, entry: CachedResponse):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+def conditional_response(request: Request, entry: CachedResponse) -> Response:
+    """JSON response for a cache entry, or a 304 when the client's copy is current."""
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache", **entry.headers}
+    if entry.last_modified is not None:
+        headers["Last-Modified"] = format_datetime(_as_utc(entry.last_modified), usegmt=True)
+
+    if _not_modified(request, entry):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(entry.body, headers=headers)
+
+
+def _not_modified(request: Request, entry: CachedResponse) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        return "*" in tags or entry.etag in tags or entry.etag.removeprefix("W/") in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and entry.last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have second precision
+        return _as_utc(entry.last_modified).replace(microsecond=0) <= _as_utc(since)
+    return False
+
+
+def _etag(key: Hashable, version: Any) -> str:
+    digest = hashlib.sha1(
+        json.dumps([repr(key), version], sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    return f'W/"{digest[:20]}"'
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
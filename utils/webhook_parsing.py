@@ -0,0 +1,54 @@
+# utils/webhook_parsing.py
+
+import hashlib
+import hmac
+import json
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:  # orjson is optional; fall back to the stdlib decoder
+    _loads = json.loads
+
+
+class WebhookPayloadError(ValueError):
+    """Raised when a webhook body is not valid JSON or not shaped like a Facebook payload."""
+
+
+def verify_signature(body: bytes, signature_header: str, secret: bytes) -> Optional[str]:
+    """
+    Check an X-Hub-Signature-256 header against the raw body.
+
+    Returns the verified hex digest (usable as a delivery id) or None.
+    """
+    signature = signature_header.split("sha256=")[-1].strip()
+    expected = hmac.new(secret, body, hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(signature, expected):
+        return None
+    return expected
+
+
+def parse_webhook_body(body: bytes) -> Dict[str, Any]:
+    """
+    Decode a webhook body once and check its shape in place.
+
+    Only the structure the handler relies on is validated (an `object`
+    string and a list of `entry` objects); the decoded dict is returned
+    as-is, without building or copying a model.
+    """
+    try:
+        payload = _loads(body)
+    except ValueError as e:  # json and orjson decode errors both subclass ValueError
+        raise WebhookPayloadError(f"Invalid JSON payload: {e}")
+
+    if not isinstance(payload, dict):
+        raise WebhookPayloadError("Payload must be a JSON object")
+    if not isinstance(payload.get("object"), str):
+        raise WebhookPayloadError("Payload 'object' must be a string")
+    entries = payload.get("entry")
+    if not isinstance(entries, list) or not all(isinstance(e, dict) for e in entries):
+        raise WebhookPayloadError("Payload 'entry' must be a list of objects")
+
+    return payload